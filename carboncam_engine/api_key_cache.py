@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ApiKeyEntry:
+    """A cached api_keys lookup: ``user_id`` is None for unknown or revoked keys."""
+
+    user_id: str | None
+    expires_at: float
+
+
+class ApiKeyCache:
+    """key_hash -> user_id lookups in memory, least recently used evicted first.
+
+    Valid keys expire after ``ttl`` seconds and unknown/revoked ones after
+    ``negative_ttl``, so a revoked key stops working within ``ttl`` even
+    without invalidate(). The cache is per process.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        ttl: float,
+        negative_ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, ApiKeyEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key_hash: str) -> ApiKeyEntry | None:
+        """The live entry for ``key_hash``, or None on a miss or an expired entry."""
+
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            if entry.expires_at <= self._clock():
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+            return entry
+
+    def put(self, key_hash: str, user_id: str | None) -> None:
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key_hash] = ApiKeyEntry(user_id=user_id, expires_at=self._clock() + ttl)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key_hash: str | None = None) -> int:
+        """Drops one key's entry (all entries if ``key_hash`` is None); returns how many."""
+
+        with self._lock:
+            if key_hash is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            return 1 if self._entries.pop(key_hash, None) is not None else 0
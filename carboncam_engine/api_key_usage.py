@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+
+
+class ApiKeyUsageBuffer:
+    """Latest use time per key_hash, held until the next bulk last_used_at write.
+
+    record() is a dict update on the request path; drain() hands the pending
+    times to the writer, which puts them back with restore() if the write fails.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, key_hash: str, used_at: datetime) -> None:
+        with self._lock:
+            previous = self._pending.get(key_hash)
+            if previous is None or used_at > previous:
+                self._pending[key_hash] = used_at
+
+    def drain(self) -> dict[str, datetime]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: dict[str, datetime]) -> None:
+        """Puts back times from a failed write, keeping any newer ones recorded since."""
+
+        for key_hash, used_at in pending.items():
+            self.record(key_hash, used_at)
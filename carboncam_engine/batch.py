@@ -0,0 +1,518 @@
+from __future__ import annotations
+
+import datetime as dt
+import multiprocessing
+from collections import deque
+from collections.abc import Callable, Generator, Iterable, Iterator, Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import cast
+
+import numpy as np
+import pandas as pd
+
+from carboncam_engine.batch_history import RowResultClaims, RowResults
+from carboncam_engine.machining import (
+    BATCH_ERROR_MESSAGES,
+    BATCH_OK,
+    _parse_hhmm_to_minutes,
+    calculate_machining_carbon_batch,
+    estimate_energy_cost_batch,
+)
+from carboncam_engine.tariff import MINUTES_PER_DAY, TariffSchedule
+
+# (tariff_type, currency) -> compiled schedule, for rows that name a tariff or currency.
+TariffMap = Mapping[tuple[str, str], TariffSchedule]
+
+BATCH_OUTPUT_COLUMNS = (
+    "Weight_In",
+    "Weight_Out",
+    "Time",
+    "Machine_ID",
+    "Material_ID",
+    "Total_Energy_kWh",
+    "Total_Carbon_kg",
+    "Energy_Cost",
+    "Currency",
+    "Applied_Rate_per_kWh",
+    "Credits_Left",
+    "Error",
+)
+
+# Fixed column types for typed outputs (Parquet/Arrow).
+BATCH_OUTPUT_DTYPES: dict[str, str] = {
+    "Weight_In": "float64",
+    "Weight_Out": "float64",
+    "Time": "float64",
+    "Machine_ID": "string",
+    "Material_ID": "string",
+    "Total_Energy_kWh": "float64",
+    "Total_Carbon_kg": "float64",
+    "Energy_Cost": "float64",
+    "Currency": "string",
+    "Applied_Rate_per_kWh": "float64",
+    "Credits_Left": "Int64",
+    "Error": "string",
+}
+
+ROW_ERROR_PARSE = "Sayısal değerler parse edilemedi"
+ROW_ERROR_NOT_FINITE = "Geçersiz sayı (NaN/inf)"
+ROW_ERROR_RANGE = "Geçersiz ağırlık/süre"
+ROW_ERROR_UNKNOWN_ASSET = "Makine veya malzeme bulunamadı"
+ROW_ERROR_NO_CREDIT = "Kredi yetersiz"
+ROW_ERROR_HHMM = "Geçersiz saat (HH:MM)"
+ROW_ERROR_TARIFF = "Geçersiz tarife (Single/Multi)"
+ROW_ERROR_NO_TARIFF_RATES = "Tarife fiyatları bulunamadı"
+ROW_ERROR_START_REQUIRED = "Multi tarife için Start_HHMM gerekli"
+
+_TARIFF_NAMES = {"single": "Single", "multi": "Multi"}
+
+_RESULT_COLUMNS = ["Total_Energy_kWh", "Total_Carbon_kg", "Energy_Cost"]
+
+
+def coerce_float_column(raw: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Column-wise ``float(value)``: returns (float64 values, parse_failed mask).
+
+    pd.to_numeric handles the bulk; only cells it rejects (or non-numeric dtypes
+    such as datetimes) fall back to float(), so odd inputs like "nan" or
+    non-ASCII digits keep their scalar semantics.
+    """
+
+    if pd.api.types.is_numeric_dtype(raw.dtype) or raw.dtype == object:
+        values = pd.to_numeric(raw, errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan, copy=True
+        )
+        suspect = np.flatnonzero(np.isnan(values) & raw.notna().to_numpy())
+    else:
+        values = np.full(len(raw), np.nan)
+        suspect = np.arange(len(raw))
+
+    failed = np.zeros(len(raw), dtype=bool)
+    for i in suspect:
+        try:
+            values[i] = float(raw.iat[i])
+        except (TypeError, ValueError):
+            failed[i] = True
+    return values, failed
+
+
+def _optional_cells(
+    frame: pd.DataFrame,
+    column: str,
+    convert: Callable[[object], object],
+    *,
+    blank: object,
+    dtype: type,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Converts an optional column once per distinct cell: (values, failed mask).
+
+    Missing columns and empty cells give ``blank``; cells ``convert`` rejects
+    with TypeError/ValueError are flagged failed and also read as ``blank``.
+    """
+
+    n = len(frame)
+    if column not in frame:
+        return np.full(n, blank, dtype=dtype), np.zeros(n, dtype=bool)
+    codes, uniques = pd.factorize(frame[column], use_na_sentinel=True)
+    converted: np.ndarray = np.full(len(uniques) + 1, blank, dtype=dtype)
+    failed = np.zeros(len(uniques) + 1, dtype=bool)
+    for i, value in enumerate(uniques):
+        try:
+            converted[i] = convert(value)
+        except (TypeError, ValueError):
+            failed[i] = True
+    return converted[codes], failed[codes]
+
+
+def _hhmm_cell(value: object) -> float:
+    if isinstance(value, (dt.time, dt.datetime)):
+        return float(value.hour * 60 + value.minute)
+    if isinstance(value, str):
+        if not value.strip():
+            return np.nan
+        # Spreadsheet time cells often come back as "HH:MM:SS"; seconds are dropped.
+        hh_mm_ss = value.strip().split(":")
+        if len(hh_mm_ss) == 3 and hh_mm_ss[2].isdigit():
+            value = ":".join(hh_mm_ss[:2])
+        return float(_parse_hhmm_to_minutes(value))
+    raise ValueError("time must be in HH:MM format")
+
+
+def _tariff_cell(value: object) -> str:
+    name = str(value).strip().lower()
+    if name and name not in _TARIFF_NAMES:
+        raise ValueError(f"unknown tariff {value!r}")
+    return _TARIFF_NAMES.get(name, "")
+
+
+def _currency_cell(value: object) -> str:
+    return str(value).strip().upper()
+
+
+def _row_tariffs(
+    frame: pd.DataFrame, *, currency: str
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[tuple[str, str]]]:
+    # (flat mask, bad tariff mask, key codes, currencies, distinct (tariff, currency) keys)
+    n = len(frame)
+    if "Tariff" not in frame and "Currency" not in frame:
+        flat = np.ones(n, dtype=bool)
+        codes = np.zeros(n, dtype=np.intp)
+        return flat, ~flat, codes, np.full(n, currency, dtype=object), [("Single", currency)]
+    tariff, bad_tariff = _optional_cells(frame, "Tariff", _tariff_cell, blank="", dtype=object)
+    row_currency, _ = _optional_cells(frame, "Currency", _currency_cell, blank="", dtype=object)
+    flat = (tariff == "") & (row_currency == "") & ~bad_tariff
+    tariff[~flat & (tariff == "")] = "Single"
+    row_currency[row_currency == ""] = currency
+    codes, uniques = pd.factorize(pd.Series(tariff) + "\0" + pd.Series(row_currency))
+    keys = [cast(tuple[str, str], tuple(u.split("\0", 1))) for u in uniques]
+    return flat, bad_tariff, codes, row_currency, keys
+
+
+def batch_tariff_keys(frame: pd.DataFrame, *, currency: str) -> set[tuple[str, str]]:
+    """Distinct (tariff_type, currency) pairs a chunk needs schedules for.
+
+    Rows with neither ``Tariff`` nor ``Currency`` use the flat batch rate and
+    need none; a missing tariff defaults to Single, a missing currency to
+    ``currency``. Unknown tariff names are skipped (they become row errors).
+    """
+
+    if "Tariff" not in frame and "Currency" not in frame:
+        return set()
+    flat, bad_tariff, codes, _, keys = _row_tariffs(frame, currency=currency)
+    return {keys[code] for code in np.unique(codes[~flat & ~bad_tariff])}
+
+
+def evaluate_batch_frame(
+    frame: pd.DataFrame,
+    *,
+    machines: pd.DataFrame,
+    materials: pd.DataFrame,
+    rate_per_kwh: float,
+    currency: str,
+    tariffs: TariffMap | None = None,
+) -> pd.DataFrame:
+    """Computes a /batch/process chunk column-wise and returns its output frame.
+
+    ``machines`` is indexed by machine id with ``standby_power_kw`` and
+    ``carbon_intensity``; ``materials`` by material id with ``kc_value`` and
+    ``density``. Row checks run as masks in the order of the former per-row loop
+    (parse, NaN/inf, range, unknown id, engine errors) and each row keeps the
+    first error it hits; valid rows go through calculate_machining_carbon_batch
+    in one call. ``Credits_Left`` is left blank for apply_credit_grant.
+
+    Rows are costed at the flat ``rate_per_kwh`` in ``currency`` unless they fill
+    the optional ``Tariff``/``Currency`` columns; those are costed through
+    ``tariffs`` (see batch_tariff_keys) with ``Start_HHMM``/``End_HHMM`` giving
+    the Day/Peak/Night split, one estimate_energy_cost_batch call per schedule.
+    """
+
+    n = len(frame)
+    initial, bad_initial = coerce_float_column(frame["Weight_In"])
+    final, bad_final = coerce_float_column(frame["Weight_Out"])
+    time_min, bad_time = coerce_float_column(frame["Time"])
+    parse_failed = bad_initial | bad_final | bad_time
+
+    machine_ids = frame["Machine_ID"].map(lambda v: str(v).strip())
+    material_ids = frame["Material_ID"].map(lambda v: str(v).strip())
+    machine_params = machines.reindex(machine_ids.to_numpy())
+    material_params = materials.reindex(material_ids.to_numpy())
+
+    calc = calculate_machining_carbon_batch(
+        initial_weight_kg=initial,
+        final_weight_kg=final,
+        process_time_minutes=time_min,
+        kc_value=material_params["kc_value"].to_numpy(dtype=np.float64),
+        standby_power_kw=machine_params["standby_power_kw"].to_numpy(dtype=np.float64),
+        carbon_intensity=machine_params["carbon_intensity"].to_numpy(dtype=np.float64),
+        density=material_params["density"].to_numpy(dtype=np.float64),
+    )
+
+    start_min, bad_start = _optional_cells(
+        frame, "Start_HHMM", _hhmm_cell, blank=np.nan, dtype=np.float64
+    )
+    end_min, bad_end = _optional_cells(
+        frame, "End_HHMM", _hhmm_cell, blank=np.nan, dtype=np.float64
+    )
+    flat, bad_tariff, key_codes, row_currency, keys = _row_tariffs(frame, currency=currency)
+    schedules = tariffs or {}
+    key_known = np.array([key in schedules for key in keys], dtype=bool)
+    key_multi = np.array([key[0] == "Multi" for key in keys], dtype=bool)
+    no_rates = ~flat & ~bad_tariff & ~key_known[key_codes]
+    multi_without_start = ~flat & key_multi[key_codes] & np.isnan(start_min)
+
+    error = np.full(n, "", dtype=object)
+    unset = np.ones(n, dtype=bool)
+    finite = np.isfinite(initial) & np.isfinite(final) & np.isfinite(time_min)
+    known = (
+        machine_ids.isin(machines.index).to_numpy() & material_ids.isin(materials.index).to_numpy()
+    )
+    rules = (
+        (parse_failed, ROW_ERROR_PARSE),
+        (~finite, ROW_ERROR_NOT_FINITE),
+        ((time_min <= 0) | (initial < 0) | (final < 0), ROW_ERROR_RANGE),
+        (~known, ROW_ERROR_UNKNOWN_ASSET),
+        (bad_start | bad_end, ROW_ERROR_HHMM),
+        (bad_tariff, ROW_ERROR_TARIFF),
+        (no_rates, ROW_ERROR_NO_TARIFF_RATES),
+        (multi_without_start, ROW_ERROR_START_REQUIRED),
+    )
+    for mask, message in rules:
+        hit = unset & mask
+        error[hit] = message
+        unset &= ~hit
+    for code in np.unique(calc["error_code"][unset]):
+        if code != BATCH_OK:
+            hit = unset & (calc["error_code"] == code)
+            error[hit] = BATCH_ERROR_MESSAGES[int(code)]
+    ok = error == ""
+
+    total_energy = np.where(ok, calc["total_energy_kwh"], np.nan)
+    total_carbon = np.where(ok, calc["total_carbon_kg"], np.nan)
+    rate = np.where(flat, float(rate_per_kwh), np.nan)
+
+    if not flat.all():
+        # End_HHMM pins the clock time; whole days beyond it come from Time (as in
+        # estimate_energy_cost). Without it the operation lasts Time minutes.
+        span = end_min - start_min
+        span = np.where(span <= 0, span + MINUTES_PER_DAY, span)
+        extra_days = np.where(
+            time_min > MINUTES_PER_DAY,
+            np.maximum(0, np.round((time_min - span) / MINUTES_PER_DAY)),
+            0,
+        )
+        duration = np.where(np.isnan(span), time_min, span + extra_days * MINUTES_PER_DAY)
+        priced = ok & ~flat
+        for code in np.unique(key_codes[priced]):
+            rows = np.flatnonzero(priced & (key_codes == code))
+            cost = estimate_energy_cost_batch(
+                schedule=schedules[keys[code]],
+                start_min=np.nan_to_num(start_min[rows]),
+                duration_min=duration[rows],
+                total_energy_kwh=total_energy[rows],
+            )
+            rate[rows] = cost["applied_rate_per_kwh"]
+            failed = cost["error_code"] != BATCH_OK
+            for err in np.unique(cost["error_code"][failed]):
+                error[rows[cost["error_code"] == err]] = BATCH_ERROR_MESSAGES[int(err)]
+        ok = error == ""
+        total_energy = np.where(ok, total_energy, np.nan)
+        total_carbon = np.where(ok, total_carbon, np.nan)
+        rate = np.where(ok | flat, rate, np.nan)
+
+    def _echo(values: np.ndarray, column: str) -> pd.Series:
+        # Unparseable rows echo the raw cells, the rest the parsed floats.
+        out = pd.Series(values, index=frame.index)
+        if parse_failed.any():
+            out = out.astype(object)
+            out[parse_failed] = frame[column][parse_failed]
+        return out
+
+    return pd.DataFrame(
+        {
+            "Weight_In": _echo(initial, "Weight_In"),
+            "Weight_Out": _echo(final, "Weight_Out"),
+            "Time": _echo(time_min, "Time"),
+            "Machine_ID": machine_ids.where(~parse_failed, frame["Machine_ID"]),
+            "Material_ID": material_ids.where(~parse_failed, frame["Material_ID"]),
+            "Total_Energy_kWh": total_energy,
+            "Total_Carbon_kg": total_carbon,
+            "Energy_Cost": total_energy * rate,
+            "Currency": row_currency,
+            "Applied_Rate_per_kWh": rate,
+            "Credits_Left": "",
+            "Error": error,
+        },
+        columns=list(BATCH_OUTPUT_COLUMNS),
+    )
+
+
+def row_fingerprints(out: pd.DataFrame) -> np.ndarray:
+    """uint64 key per row of an evaluate_batch_frame result, from its normalized inputs.
+
+    Numbers are hashed as floats and ids after stripping, so "10" and 10.0 or
+    " cnc_1" and "cnc_1" give the same key. The applied rate and currency are
+    part of the key, so a changed tariff or time window counts as a changed row.
+    Only meaningful for valid rows.
+    """
+
+    key = pd.DataFrame(
+        {
+            "Weight_In": pd.to_numeric(out["Weight_In"], errors="coerce").astype(np.float64),
+            "Weight_Out": pd.to_numeric(out["Weight_Out"], errors="coerce").astype(np.float64),
+            "Time": pd.to_numeric(out["Time"], errors="coerce").astype(np.float64),
+            "Machine_ID": out["Machine_ID"].astype(str),
+            "Material_ID": out["Material_ID"].astype(str),
+            "Currency": out["Currency"].astype(str),
+            "Applied_Rate_per_kWh": out["Applied_Rate_per_kWh"].astype(np.float64),
+        }
+    )
+    fingerprints: np.ndarray = pd.util.hash_pandas_object(key, index=False).to_numpy(
+        dtype=np.uint64
+    )
+    return fingerprints
+
+
+def reuse_row_results(
+    out: pd.DataFrame, *, fingerprints: np.ndarray, previous: RowResultClaims
+) -> np.ndarray:
+    """Fills valid rows claimed from ``previous`` with their stored results.
+
+    Returns the mask of reused rows, to pass to apply_credit_grant so they are
+    not charged again. Modifies ``out`` in place.
+    """
+
+    reused, values = previous.claim(fingerprints, (out["Error"] == "").to_numpy())
+    if reused.any():
+        out.loc[reused, _RESULT_COLUMNS] = values[reused]
+    return reused
+
+
+def batch_row_results(out: pd.DataFrame, *, fingerprints: np.ndarray) -> RowResults:
+    """The rows of a finished (credited) chunk worth remembering: those without errors."""
+
+    ok = (out["Error"] == "").to_numpy()
+    return RowResults.build(
+        fingerprints[ok], out.loc[ok, _RESULT_COLUMNS].to_numpy(dtype=np.float64)
+    )
+
+
+def apply_credit_grant(
+    out: pd.DataFrame,
+    *,
+    granted: int,
+    credits_left: int | None,
+    reused: np.ndarray | None = None,
+) -> pd.DataFrame:
+    """Charges the first ``granted`` valid rows of an evaluate_batch_frame result.
+
+    Rows flagged in ``reused`` (see reuse_row_results) keep their results for
+    free. Other valid rows past the grant lose their results and get
+    ROW_ERROR_NO_CREDIT. ``credits_left`` is the balance after the grant (None
+    when unknown); each row's ``Credits_Left`` shows the balance after that row,
+    as if credits were consumed one row at a time. Modifies ``out`` in place and
+    returns it.
+    """
+
+    valid = (out["Error"] == "").to_numpy()
+    if reused is not None:
+        valid = valid & ~reused
+    charged = valid & (np.cumsum(valid) <= granted)
+    denied = valid & ~charged
+    if denied.any():
+        out.loc[denied, _RESULT_COLUMNS] = np.nan
+        out.loc[denied, "Error"] = ROW_ERROR_NO_CREDIT
+    if credits_left is not None:
+        out["Credits_Left"] = credits_left + granted - np.cumsum(charged)
+    return out
+
+
+# Asset tables preloaded in each worker of a create_shard_pool pool.
+_shard_assets: tuple[pd.DataFrame, pd.DataFrame] | None = None
+
+
+def _init_shard_worker(machines: pd.DataFrame, materials: pd.DataFrame) -> None:
+    global _shard_assets
+    _shard_assets = (machines, materials)
+
+
+def _evaluate_shard(
+    frame: pd.DataFrame, rate_per_kwh: float, currency: str, tariffs: TariffMap | None
+) -> pd.DataFrame:
+    assert _shard_assets is not None, "worker started without create_shard_pool"
+    machines, materials = _shard_assets
+    return evaluate_batch_frame(
+        frame,
+        machines=machines,
+        materials=materials,
+        rate_per_kwh=rate_per_kwh,
+        currency=currency,
+        tariffs=tariffs,
+    )
+
+
+def create_shard_pool(
+    *, workers: int, machines: pd.DataFrame, materials: pd.DataFrame
+) -> ProcessPoolExecutor:
+    """Process pool for evaluate_batch_chunks; each worker loads the asset tables once.
+
+    Workers are spawned rather than forked so they do not inherit the server's
+    threads and locks. Asset changes need a new pool.
+    """
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_shard_worker,
+        initargs=(machines, materials),
+    )
+
+
+def evaluate_batch_chunks(
+    chunks: Iterable[pd.DataFrame],
+    *,
+    machines: pd.DataFrame,
+    materials: pd.DataFrame,
+    rate_per_kwh: float,
+    currency: str,
+    tariffs: Callable[[pd.DataFrame], TariffMap] | None = None,
+    pool: ProcessPoolExecutor | None = None,
+    inline_rows: int = 0,
+    max_pending: int = 4,
+) -> Generator[pd.DataFrame, None, None]:
+    """evaluate_batch_frame over a chunk stream, yielding results in input order.
+
+    Without ``pool`` every chunk is computed in-process. With one, the first
+    ``inline_rows`` rows still are (small files never pay the pickling cost) and
+    later chunks become shards on the pool, at most ``max_pending`` in flight so
+    memory stays bounded while the caller consumes earlier results. ``pool`` must
+    come from create_shard_pool with the same ``machines``/``materials``; if it is
+    shut down or broken, the affected chunks fall back to in-process.
+
+    ``tariffs`` is called in this process with each chunk and returns the
+    schedules it needs (see batch_tariff_keys), so rate lookups stay out of the
+    workers.
+    """
+
+    def _inline(chunk: pd.DataFrame, chunk_tariffs: TariffMap | None) -> pd.DataFrame:
+        return evaluate_batch_frame(
+            chunk,
+            machines=machines,
+            materials=materials,
+            rate_per_kwh=rate_per_kwh,
+            currency=currency,
+            tariffs=chunk_tariffs,
+        )
+
+    def _collect(
+        chunk: pd.DataFrame, chunk_tariffs: TariffMap | None, future: Future[pd.DataFrame] | None
+    ) -> pd.DataFrame:
+        if future is not None:
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                pass
+        return _inline(chunk, chunk_tariffs)
+
+    pending: deque[tuple[pd.DataFrame, TariffMap | None, Future[pd.DataFrame] | None]] = deque()
+    seen = 0
+    try:
+        for chunk in chunks:
+            chunk_tariffs = tariffs(chunk) if tariffs is not None else None
+            if pool is None or seen < inline_rows:
+                seen += len(chunk)
+                yield _inline(chunk, chunk_tariffs)
+                continue
+            future: Future[pd.DataFrame] | None
+            try:
+                future = pool.submit(_evaluate_shard, chunk, rate_per_kwh, currency, chunk_tariffs)
+            except RuntimeError:  # shut down or broken pool
+                future = None
+            pending.append((chunk, chunk_tariffs, future))
+            if len(pending) >= max_pending:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+    finally:
+        for _, _, future in pending:
+            if future is not None:
+                future.cancel()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import IO
+
+_HASH_BLOCK = 1 << 20
+
+
+def hash_upload(source: IO[bytes]) -> str:
+    """sha256 of an upload, read in blocks; rewinds ``source`` afterwards."""
+
+    source.seek(0)
+    digest = hashlib.sha256()
+    while block := source.read(_HASH_BLOCK):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def batch_cache_key(
+    *,
+    upload_digest: str,
+    user_id: str,
+    asset_version: str,
+    tariff_version: str,
+    output_format: str,
+) -> str:
+    """Cache key of a batch result: same bytes, user, assets, tariff and format."""
+
+    parts = (upload_digest, user_id, asset_version, tariff_version, output_format)
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class PendingBatchResult:
+    """A result being written into the cache; invisible until commit()."""
+
+    def __init__(self, cache: BatchResultCache, key: str) -> None:
+        self._cache = cache
+        self._key = key
+        self._tmp = cache.root / f".{key}.{uuid.uuid4().hex}.tmp"
+        self._fh: IO[bytes] | None = open(self._tmp, "wb")
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if self._fh is not None:
+            self._fh.write(data)
+            self.size += len(data)
+
+    def commit(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._fh = None
+        if self.size > self._cache.max_bytes:
+            self._tmp.unlink(missing_ok=True)
+            return
+        os.replace(self._tmp, self._cache.root / self._key)
+        self._cache.evict()
+
+    def discard(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self._tmp.unlink(missing_ok=True)
+
+
+class BatchResultCache:
+    """Finished batch results on local disk, evicted least-recently-used first.
+
+    Entries are files named by their batch_cache_key. A hit touches the file's
+    mtime, and evict() drops the oldest entries until the total fits
+    ``max_bytes``. Readers keep their open handle even if the entry is evicted
+    meanwhile.
+    """
+
+    def __init__(self, root: str | Path, *, max_bytes: int) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def open(self, key: str) -> IO[bytes] | None:
+        path = self.root / key
+        try:
+            fh = open(path, "rb")
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return fh
+
+    def begin(self, key: str) -> PendingBatchResult:
+        return PendingBatchResult(self, key)
+
+    def evict(self) -> int:
+        """Deletes least recently used entries until the cache fits; returns how many."""
+
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class RowResults:
+    """Computed batch rows keyed by input fingerprint.
+
+    ``fingerprints`` is a sorted, unique uint64 array; ``values`` holds the
+    matching (energy kWh, carbon kg, cost) rows and ``counts`` how many rows of
+    the run had that fingerprint, so duplicates are only reused as often as
+    they were paid for. ``paid_at`` is when the oldest of these rows was paid
+    (None: now).
+    """
+
+    fingerprints: np.ndarray
+    values: np.ndarray
+    counts: np.ndarray
+    paid_at: float | None = None
+
+    @classmethod
+    def build(
+        cls, fingerprints: np.ndarray, values: np.ndarray, counts: np.ndarray | None = None
+    ) -> RowResults:
+        fps = np.asarray(fingerprints, dtype=np.uint64)
+        vals = np.asarray(values, dtype=np.float64).reshape(len(fps), 3)
+        weights = np.ones(len(fps)) if counts is None else np.asarray(counts)
+        fps, first, inverse = np.unique(fps, return_index=True, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=weights, minlength=len(fps))
+        return cls(fingerprints=fps, values=vals[first], counts=totals.astype(np.int64))
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def positions(self, fingerprints: np.ndarray) -> np.ndarray:
+        """Index of each fingerprint in this table, or -1 when missing."""
+
+        fps = np.asarray(fingerprints, dtype=np.uint64)
+        if not len(self.fingerprints):
+            return np.full(len(fps), -1)
+        pos = np.searchsorted(self.fingerprints, fps)
+        pos[pos == len(self.fingerprints)] = 0
+        return np.where(self.fingerprints[pos] == fps, pos, -1)
+
+    def head(self, max_rows: int) -> RowResults:
+        return RowResults(
+            self.fingerprints[:max_rows],
+            self.values[:max_rows],
+            self.counts[:max_rows],
+            paid_at=self.paid_at,
+        )
+
+
+class RowResultClaims:
+    """Hands a previous run's rows out to a new run, each stored row at most once."""
+
+    def __init__(self, rows: RowResults) -> None:
+        self.rows = rows
+        self._remaining = rows.counts.copy()
+
+    def claim(
+        self, fingerprints: np.ndarray, eligible: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (claimed mask, values) for the ``eligible`` rows, in row order."""
+
+        pos = self.rows.positions(fingerprints)
+        candidate = np.flatnonzero(eligible & (pos >= 0))
+        claimed = np.zeros(len(pos), dtype=bool)
+        values = np.full((len(pos), 3), np.nan)
+        if not len(candidate):
+            return claimed, values
+
+        idx = pos[candidate]
+        # n-th occurrence of a fingerprint in this chunk takes the n-th remaining copy.
+        rank = pd.Series(idx).groupby(idx).cumcount().to_numpy()
+        ok = rank < self._remaining[idx]
+        np.subtract.at(self._remaining, idx[ok], 1)
+        claimed[candidate[ok]] = True
+        values[candidate[ok]] = self.rows.values[idx[ok]]
+        return claimed, values
+
+
+class RowResultStore:
+    """The latest run's rows per (user, workbook) on local disk: ``<root>/<key hash>.npz``.
+
+    A workbook is identified by its upload filename and only its most recent run
+    is kept. ``version`` ties the rows to the asset/tariff data and the credit
+    period they were paid in; rows saved under another version, or paid more
+    than ``max_age`` seconds ago, read as missing.
+
+    take() claims the rows by moving the file away before reading it, so when
+    the same workbook is uploaded twice at once only one run can reuse them.
+    """
+
+    def __init__(
+        self, root: str | Path, *, max_age: float, clock: Callable[[], float] = time.time
+    ) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._clock = clock
+
+    def _path(self, user_id: str, workbook: str) -> Path:
+        key = f"{user_id}\0{workbook}".encode("utf-8")
+        return self.root / (hashlib.sha256(key).hexdigest()[:32] + ".npz")
+
+    def take(self, user_id: str, workbook: str, *, version: str) -> RowResults | None:
+        """Removes and returns the stored rows; None when missing, stale or claimed."""
+
+        path = self._path(user_id, workbook)
+        claimed = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.claim.npz")
+        try:
+            os.replace(path, claimed)
+        except OSError:
+            return None
+        try:
+            with np.load(claimed, allow_pickle=False) as data:
+                paid_at = float(data["paid_at"])
+                if str(data["version"]) != version or self._clock() - paid_at > self.max_age:
+                    return None
+                return RowResults(
+                    fingerprints=data["fingerprints"],
+                    values=data["values"],
+                    counts=data["counts"],
+                    paid_at=paid_at,
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+        finally:
+            claimed.unlink(missing_ok=True)
+
+    def save(
+        self,
+        user_id: str,
+        workbook: str,
+        rows: RowResults,
+        *,
+        version: str,
+        overwrite: bool = True,
+    ) -> None:
+        """Stores ``rows`` as the workbook's latest run.
+
+        With ``overwrite=False`` rows another run saved in the meantime are kept;
+        that is how a run hands back rows it took but did not use.
+        """
+
+        path = self._path(user_id, workbook)
+        tmp = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.npz")
+        paid_at = self._clock() if rows.paid_at is None else rows.paid_at
+        try:
+            np.savez(
+                tmp,
+                version=np.array(version),
+                paid_at=np.array(paid_at),
+                fingerprints=rows.fingerprints,
+                values=rows.values,
+                counts=rows.counts,
+            )
+            if overwrite:
+                os.replace(tmp, path)
+            else:
+                try:
+                    os.link(tmp, path)
+                except FileExistsError:
+                    pass
+        finally:
+            tmp.unlink(missing_ok=True)
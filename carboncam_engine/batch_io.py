@@ -0,0 +1,637 @@
+from __future__ import annotations
+
+import os
+import re
+import zipfile
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from types import TracebackType
+from typing import IO, Protocol
+from xml.sax.saxutils import escape as xml_escape
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet/Arrow are optional: pip install "carboncam[columnar]"
+    pa = None
+
+BATCH_REQUIRED_COLUMNS = ("Weight_In", "Weight_Out", "Time", "Machine_ID", "Material_ID")
+# Optional per-row tariff columns (see evaluate_batch_frame).
+BATCH_OPTIONAL_COLUMNS = ("Start_HHMM", "End_HHMM", "Tariff", "Currency")
+DEFAULT_CHUNK_ROWS = 5_000
+
+BATCH_FORMATS = ("xlsx", "csv", "parquet", "arrow")
+BATCH_MEDIA_TYPES: dict[str, str] = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+_MEDIA_TYPE_FORMATS: dict[str, str] = {
+    **{media_type: fmt for fmt, media_type in BATCH_MEDIA_TYPES.items()},
+    "application/csv": "csv",
+    "application/x-parquet": "parquet",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+_EXTENSION_FORMATS: dict[str, str] = {
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".arrows": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+
+class BatchReadError(ValueError):
+    """Raised when an upload cannot be opened or breaks while streaming rows."""
+
+
+def format_available(fmt: str) -> bool:
+    """Parquet and Arrow need the optional pyarrow dependency."""
+
+    return fmt not in ("parquet", "arrow") or pa is not None
+
+
+def detect_input_format(
+    source: IO[bytes], *, filename: str | None = None, content_type: str | None = None
+) -> str:
+    """Picks the upload format from its magic bytes, then extension, then media type.
+
+    Anything unrecognised is treated as .xlsx, the original contract.
+    """
+
+    head = source.read(8)
+    source.seek(0)
+    if head.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.startswith(b"ARROW1") or head.startswith(b"\xff\xff\xff\xff"):
+        return "arrow"
+
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in _EXTENSION_FORMATS:
+        return _EXTENSION_FORMATS[ext]
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return _MEDIA_TYPE_FORMATS.get(media_type, "xlsx")
+
+
+def negotiate_output_format(accept: str | None, *, default: str) -> str:
+    """Best supported format for an ``Accept`` header (q-values honoured).
+
+    Missing headers, wildcards and headers that name no supported type fall back
+    to ``default`` so existing clients keep getting what they got before.
+    """
+
+    ranked: list[tuple[float, int, str]] = []
+    for i, item in enumerate((accept or "").split(",")):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranked.append((-q, i, media_type.lower()))
+
+    for _, _, media_type in sorted(ranked):
+        if media_type in ("*/*", "application/*", ""):
+            return default
+        if media_type in _MEDIA_TYPE_FORMATS:
+            return _MEDIA_TYPE_FORMATS[media_type]
+    return default
+
+
+def _header_names(cells: tuple[object, ...]) -> list[str]:
+    # Same naming as pd.read_excel: blank headers become "Unnamed: i", duplicates get ".n".
+    names: list[str] = []
+    seen: dict[str, int] = {}
+    for i, cell in enumerate(cells):
+        name = f"Unnamed: {i}" if cell is None or str(cell).strip() == "" else str(cell)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    while names and names[-1].startswith("Unnamed: "):
+        names.pop()
+    return names
+
+
+class BatchRowReader(ABC):
+    """Common interface: ``columns`` (header names) and ``chunks(chunk_rows)``."""
+
+    __slots__ = ("columns",)
+
+    columns: list[str]
+
+    @abstractmethod
+    def chunks(self, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]: ...
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> BatchRowReader:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class ExcelRowReader(BatchRowReader):
+    """Streams the first sheet of an .xlsx upload in fixed-size DataFrame chunks.
+
+    The workbook is opened read-only, so openpyxl parses rows lazily from the zip
+    instead of building the whole sheet in memory. The header row is read on
+    construction, which lets callers reject files with missing columns before any
+    data row is parsed. Cell values follow pd.read_excel: blank cells become NaN and
+    trailing blank rows are dropped. Peak memory is bounded by ``chunk_rows``.
+    """
+
+    __slots__ = ("_workbook", "_rows")
+
+    def __init__(self, source: IO[bytes]) -> None:
+        try:
+            self._workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+            sheet = self._workbook.worksheets[0]
+            # Some writers store a stale dimension tag; ignore it like pandas does.
+            sheet.reset_dimensions()
+            self._rows = sheet.iter_rows(values_only=True)
+            header = next(self._rows, ())
+        except Exception as e:
+            raise BatchReadError("invalid Excel file") from e
+        self.columns = _header_names(tuple(header))
+
+    def chunks(self, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Yields the data rows as DataFrames of at most ``chunk_rows`` rows."""
+
+        if chunk_rows <= 0:
+            raise ValueError("chunk_rows must be > 0")
+        width = len(self.columns)
+        chunk: list[tuple[object, ...]] = []
+        pending_blank = 0
+
+        while True:
+            try:
+                cells = next(self._rows, None)
+            except Exception as e:
+                raise BatchReadError("invalid Excel data") from e
+            if cells is None:
+                break
+
+            values = tuple(np.nan if c is None else c for c in cells[:width])
+            if all(v is np.nan for v in values):
+                # Only kept if a non-blank row follows.
+                pending_blank += 1
+                continue
+            values += (np.nan,) * (width - len(values))
+            for _ in range(pending_blank):
+                chunk.append((np.nan,) * width)
+                if len(chunk) >= chunk_rows:
+                    yield pd.DataFrame(chunk, columns=self.columns)
+                    chunk = []
+            pending_blank = 0
+            chunk.append(values)
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=self.columns)
+                chunk = []
+
+        if chunk:
+            yield pd.DataFrame(chunk, columns=self.columns)
+
+    def close(self) -> None:
+        self._workbook.close()
+
+
+class CsvRowReader(BatchRowReader):
+    """Streams a UTF-8 CSV upload with pandas' chunked C parser.
+
+    Only the header is parsed on construction. ID columns are read as text so
+    values like "007" keep their leading zeros.
+    """
+
+    __slots__ = ("_source",)
+
+    def __init__(self, source: IO[bytes]) -> None:
+        try:
+            header = pd.read_csv(source, nrows=0, encoding="utf-8-sig")
+            self.columns = [str(c) for c in header.columns]
+            source.seek(0)
+        except Exception as e:
+            raise BatchReadError("invalid CSV file") from e
+        self._source = source
+
+    def chunks(self, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        if chunk_rows <= 0:
+            raise ValueError("chunk_rows must be > 0")
+        text_columns = {
+            c: str
+            for c in ("Machine_ID", "Material_ID", *BATCH_OPTIONAL_COLUMNS)
+            if c in self.columns
+        }
+        try:
+            with pd.read_csv(
+                self._source, chunksize=chunk_rows, encoding="utf-8-sig", dtype=text_columns
+            ) as parser:
+                yield from parser
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
+            raise BatchReadError("invalid CSV data") from e
+
+
+class ArrowRowReader(BatchRowReader):
+    """Streams Parquet or Arrow IPC (file or stream) uploads record batch by record batch.
+
+    Only the required and optional batch columns are decoded, and numeric columns convert to pandas
+    without copying. Requires pyarrow.
+    """
+
+    __slots__ = ("_batches",)
+
+    def __init__(self, source: IO[bytes], *, fmt: str) -> None:
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Parquet/Arrow batches")
+        try:
+            if fmt == "parquet":
+                parquet_file = pq.ParquetFile(source)
+                self.columns = list(parquet_file.schema_arrow.names)
+                self._batches: Callable[[list[str], int], Iterator[pa.RecordBatch]] = (
+                    lambda columns, size: parquet_file.iter_batches(
+                        batch_size=size, columns=columns
+                    )
+                )
+            else:
+                self.columns, self._batches = self._open_ipc(source)
+        except Exception as e:
+            raise BatchReadError(f"invalid {fmt} file") from e
+
+    @staticmethod
+    def _open_ipc(
+        source: IO[bytes],
+    ) -> tuple[list[str], Callable[[list[str], int], Iterator[pa.RecordBatch]]]:
+        try:
+            file_reader = pa_ipc.open_file(source)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            stream_reader = pa_ipc.open_stream(source)
+            return list(stream_reader.schema.names), lambda columns, size: (
+                batch.select(columns) for batch in stream_reader
+            )
+        return list(file_reader.schema.names), lambda columns, size: (
+            file_reader.get_batch(i).select(columns) for i in range(file_reader.num_record_batches)
+        )
+
+    def chunks(self, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        if chunk_rows <= 0:
+            raise ValueError("chunk_rows must be > 0")
+        columns = [
+            c for c in (*BATCH_REQUIRED_COLUMNS, *BATCH_OPTIONAL_COLUMNS) if c in self.columns
+        ]
+        batches = self._batches(columns, chunk_rows)
+        while True:
+            try:
+                batch = next(batches, None)
+            except Exception as e:
+                raise BatchReadError("invalid Arrow data") from e
+            if batch is None:
+                break
+            for offset in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(offset, chunk_rows).to_pandas()
+
+
+def open_batch_reader(source: IO[bytes], *, fmt: str) -> BatchRowReader:
+    """Returns the streaming reader for ``fmt`` (see detect_input_format)."""
+
+    if fmt == "csv":
+        return CsvRowReader(source)
+    if fmt in ("parquet", "arrow"):
+        return ArrowRowReader(source, fmt=fmt)
+    return ExcelRowReader(source)
+
+
+class _ZipSink(Protocol):
+    """What zipfile needs from a write target: an open file or a _ByteSink."""
+
+    def write(self, data: bytes, /) -> int: ...
+
+    def flush(self) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class _ByteSink:
+    """Write-only, non-seekable buffer that a streamed response drains between chunks.
+
+    ``tell`` without ``seek`` makes zipfile write data descriptors instead of
+    seeking back, and gives pyarrow the offsets it needs for footers.
+    """
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        chunk = bytes(data)
+        self._parts.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+_XML_ILLEGAL_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        "</Relationships>"
+    ),
+    # Style 1 is the bold, bordered, centred header cell pandas' to_excel uses.
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+        '<border><left style="thin"/><right style="thin"/><top style="thin"/>'
+        '<bottom style="thin"/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/>'
+        "</cellStyleXfs>"
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" '
+        'applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="top"/></xf>'
+        "</cellXfs>"
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        "</styleSheet>"
+    ),
+}
+
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_TAIL = "</sheetData></worksheet>"
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _xlsx_body(value: object) -> str:
+    """Cell XML after ``<c r="A1"``; "" means no cell.
+
+    Mirrors to_excel: NaN/None/"" stay empty and +-inf are written as text.
+    """
+
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return f' t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, np.integer)):
+        return f"><v>{int(value)}</v></c>"
+    if isinstance(value, (float, np.floating)):
+        number = float(value)
+        if number != number:
+            return ""
+        if number not in (float("inf"), float("-inf")):
+            return f"><v>{number!r}</v></c>"
+        value = "inf" if number > 0 else "-inf"
+    text = _XML_ILLEGAL_RE.sub("", str(value))
+    if not text:
+        return ""
+    return f' t="inlineStr"><is><t xml:space="preserve">{xml_escape(text)}</t></is></c>'
+
+
+def _xlsx_bodies(column: pd.Series) -> list[str]:
+    values = column.to_numpy()
+    if values.dtype.kind == "f":
+        finite = np.isfinite(values).tolist()
+        return [
+            f"><v>{v!r}</v></c>" if ok else _xlsx_body(v) for v, ok in zip(values.tolist(), finite)
+        ]
+    if values.dtype.kind in "iu":
+        return [f"><v>{v}</v></c>" for v in values.tolist()]
+    # Object columns repeat a few values (ids, currency, error texts): format each once.
+    cache: dict[tuple[type, object], str] = {}
+    bodies: list[str] = []
+    for v in values.tolist():
+        try:
+            key = (type(v), v)
+            body = cache.get(key)
+            if body is None:
+                body = cache[key] = _xlsx_body(v)
+        except TypeError:  # unhashable
+            body = _xlsx_body(v)
+        bodies.append(body)
+    return bodies
+
+
+class XlsxStreamWriter:
+    """Write-only .xlsx writer that emits the workbook while rows are still coming.
+
+    The single worksheet is streamed into a deflated zip entry with inline strings
+    (no shared-string table), so memory stays flat however many rows are written
+    and the sink may be non-seekable (see _ByteSink). Output opens like a
+    to_excel workbook: one "Sheet1" with a bold header row.
+    """
+
+    def __init__(self, sink: _ZipSink) -> None:
+        # Fastest deflate level: the sheet XML is repetitive, so it still shrinks ~5x.
+        self._zip = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        for name, xml in _XLSX_STATIC_PARTS.items():
+            self._zip.writestr(name, xml)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(_XLSX_SHEET_HEAD.encode("utf-8"))
+        self._letters: list[str] = []
+        self._row = 0
+
+    def _letter(self, index: int) -> str:
+        while len(self._letters) <= index:
+            self._letters.append(_column_letter(len(self._letters)))
+        return self._letters[index]
+
+    def write_header(self, columns: list[str]) -> None:
+        self._row += 1
+        cells = "".join(
+            f'<c r="{self._letter(i)}{self._row}" s="1"{body}'
+            for i, body in enumerate(_xlsx_body(name) for name in columns)
+            if body
+        )
+        self._sheet.write(f'<row r="{self._row}">{cells}</row>'.encode("utf-8"))
+
+    def write_frame(self, frame: pd.DataFrame) -> None:
+        """Appends the frame's rows; cells are formatted column by column."""
+
+        row_numbers = range(self._row + 1, self._row + 1 + len(frame))
+        columns = [
+            [f'<c r="{letter}{r}"{body}' if body else "" for r, body in zip(row_numbers, bodies)]
+            for letter, bodies in (
+                (self._letter(i), _xlsx_bodies(frame.iloc[:, i])) for i in range(frame.shape[1])
+            )
+        ]
+        rows = [f'<row r="{r}">{"".join(cells)}</row>' for r, *cells in zip(row_numbers, *columns)]
+        self._sheet.write("".join(rows).encode("utf-8"))
+        self._row += len(frame)
+
+    def close(self) -> None:
+        self._sheet.write(_XLSX_SHEET_TAIL.encode("utf-8"))
+        self._sheet.close()
+        self._zip.close()
+
+
+def _typed_frame(frame: pd.DataFrame, dtypes: Mapping[str, str]) -> pd.DataFrame:
+    # Columnar formats need one type per column: mixed cells (e.g. echoed raw
+    # inputs that failed to parse) become null rather than failing the write.
+    typed = frame.copy()
+    for column, dtype in dtypes.items():
+        if column not in typed.columns:
+            continue
+        if dtype == "string":
+            typed[column] = typed[column].astype("string")
+        else:
+            numeric = pd.to_numeric(typed[column].replace("", np.nan), errors="coerce")
+            typed[column] = numeric.astype(dtype)
+    return typed
+
+
+def iter_batch_output(
+    frames: Iterable[pd.DataFrame],
+    *,
+    fmt: str,
+    dtypes: Mapping[str, str] | None = None,
+) -> Iterator[bytes]:
+    """Encodes result frames as xlsx, csv, parquet or Arrow IPC file, chunk by chunk.
+
+    Bytes are yielded after every frame, so a StreamingResponse starts sending
+    before later frames are computed and memory stays bounded by one frame.
+    The first frame fixes the columns (later frames are reindexed to them).
+    ``dtypes`` fixes the Parquet/Arrow column types so every file of a data lake
+    table shares one schema.
+    """
+
+    if fmt in ("parquet", "arrow") and pa is None:
+        raise RuntimeError("pyarrow is required for Parquet/Arrow batches")
+
+    sink = _ByteSink()
+    columns: list[str] | None = None
+    xlsx: XlsxStreamWriter | None = None
+    arrow_writer = None
+    schema = None
+
+    for frame in frames:
+        if columns is None:
+            columns = [str(c) for c in frame.columns]
+        else:
+            frame = frame.reindex(columns=columns)
+
+        if fmt == "csv":
+            sink.write(frame.to_csv(index=False, header=sink.tell() == 0).encode("utf-8"))
+        elif fmt in ("parquet", "arrow"):
+            table = pa.Table.from_pandas(_typed_frame(frame, dtypes or {}), preserve_index=False)
+            if arrow_writer is None:
+                schema = table.schema
+                arrow_writer = (
+                    pq.ParquetWriter(sink, schema)
+                    if fmt == "parquet"
+                    else pa_ipc.new_file(sink, schema)
+                )
+            arrow_writer.write_table(table.cast(schema))
+        else:
+            if xlsx is None:
+                xlsx = XlsxStreamWriter(sink)
+                xlsx.write_header(columns)
+            xlsx.write_frame(frame)
+        yield sink.drain()
+
+    if arrow_writer is not None:
+        arrow_writer.close()
+    if xlsx is not None:
+        xlsx.close()
+    yield sink.drain()
+
+
+def write_batch_output(
+    frames: Iterable[pd.DataFrame],
+    sink: IO[bytes],
+    *,
+    fmt: str,
+    dtypes: Mapping[str, str] | None = None,
+) -> None:
+    """Writes iter_batch_output into a file-like sink as the frames arrive."""
+
+    for part in iter_batch_output(frames, fmt=fmt, dtypes=dtypes):
+        if part:
+            sink.write(part)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import IO, Protocol
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+_BATCH_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    batch_id: str
+    user_id: str
+    status: str
+    input_format: str
+    output_format: str
+    created_at: float
+    updated_at: float
+    rows: int | None = None
+    error: str | None = None
+    error_status: int | None = None
+    filename: str | None = None
+
+
+class BatchJobStore(Protocol):
+    """Where job metadata, uploads and results live (local disk, object storage, ...)."""
+
+    def create(self, job: BatchJob, upload: IO[bytes]) -> None: ...
+
+    def get(self, batch_id: str) -> BatchJob | None: ...
+
+    def jobs(self) -> Iterator[BatchJob]: ...
+
+    def update(self, job: BatchJob) -> None: ...
+
+    def open_input(self, batch_id: str) -> IO[bytes]: ...
+
+    def delete_input(self, batch_id: str) -> None: ...
+
+    def result_writer(self, batch_id: str) -> AbstractContextManager[IO[bytes]]: ...
+
+    def open_result(self, batch_id: str) -> IO[bytes]: ...
+
+    def delete(self, batch_id: str) -> None: ...
+
+    def purge(self, *, max_age_seconds: float) -> int: ...
+
+
+class LocalBatchJobStore:
+    """BatchJobStore on local disk: ``<root>/<batch_id>/{job.json,input,result}``.
+
+    Metadata and results are written to a temp file and renamed into place, so
+    readers never see a half-written file. Unknown or malformed batch ids read as
+    missing jobs.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, batch_id: str) -> Path | None:
+        if not _BATCH_ID_RE.match(batch_id):
+            return None
+        return self.root / batch_id
+
+    def _require_dir(self, batch_id: str) -> Path:
+        job_dir = self._dir(batch_id)
+        if job_dir is None:
+            raise KeyError(batch_id)
+        return job_dir
+
+    def create(self, job: BatchJob, upload: IO[bytes]) -> None:
+        job_dir = self._require_dir(job.batch_id)
+        job_dir.mkdir()
+        with open(job_dir / "input", "wb") as fh:
+            shutil.copyfileobj(upload, fh, 1 << 20)
+        self.update(job)
+
+    def get(self, batch_id: str) -> BatchJob | None:
+        job_dir = self._dir(batch_id)
+        if job_dir is None:
+            return None
+        try:
+            with open(job_dir / "job.json", encoding="utf-8") as fh:
+                return BatchJob(**json.load(fh))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def jobs(self) -> Iterator[BatchJob]:
+        """Every readable job, in no particular order."""
+
+        for job_dir in self.root.iterdir():
+            job = self.get(job_dir.name)
+            if job is not None:
+                yield job
+
+    def update(self, job: BatchJob) -> None:
+        job_dir = self._require_dir(job.batch_id)
+        tmp = job_dir / "job.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(asdict(job), fh)
+        os.replace(tmp, job_dir / "job.json")
+
+    def open_input(self, batch_id: str) -> IO[bytes]:
+        return open(self._require_dir(batch_id) / "input", "rb")
+
+    def delete_input(self, batch_id: str) -> None:
+        (self._require_dir(batch_id) / "input").unlink(missing_ok=True)
+
+    @contextmanager
+    def result_writer(self, batch_id: str) -> Iterator[IO[bytes]]:
+        job_dir = self._require_dir(batch_id)
+        tmp = job_dir / "result.tmp"
+        try:
+            with open(tmp, "wb") as fh:
+                yield fh
+            os.replace(tmp, job_dir / "result")
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def open_result(self, batch_id: str) -> IO[bytes]:
+        return open(self._require_dir(batch_id) / "result", "rb")
+
+    def delete(self, batch_id: str) -> None:
+        shutil.rmtree(self._require_dir(batch_id), ignore_errors=True)
+
+    def purge(self, *, max_age_seconds: float) -> int:
+        """Deletes jobs last updated more than ``max_age_seconds`` ago; returns how many."""
+
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for job_dir in self.root.iterdir():
+            if not _BATCH_ID_RE.match(job_dir.name):
+                continue
+            try:
+                if (job_dir / "job.json").stat().st_mtime < cutoff:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
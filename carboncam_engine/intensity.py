@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import csv
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+class IntensityProfile:
+    """Time-varying grid carbon intensity (kgCO2/kWh) for one region.
+
+    Slots are evenly spaced (e.g. hourly or 15-minute) and cover one day or one week;
+    the curve repeats after that. A per-minute prefix sum is built once, so the mean
+    intensity over any operation window is an O(1) lookup (vectorized over arrays).
+    Minutes are counted from 00:00 (Monday 00:00 for weekly profiles).
+    """
+
+    __slots__ = ("region", "resolution_min", "values", "period_min", "_cumsum")
+
+    def __init__(self, *, region: str, values: npt.ArrayLike, resolution_min: int = 60) -> None:
+        slots = np.asarray(values, dtype=np.float64).ravel()
+        if resolution_min <= 0 or MINUTES_PER_DAY % resolution_min != 0:
+            raise ValueError("resolution_min must divide 1440")
+        period_min = slots.size * resolution_min
+        if period_min not in (MINUTES_PER_DAY, MINUTES_PER_WEEK):
+            raise ValueError("intensity profile must cover exactly one day or one week")
+        if not np.all(np.isfinite(slots)) or np.any(slots <= 0):
+            raise ValueError("carbon_intensity values must be > 0")
+
+        self.region = region
+        self.resolution_min = resolution_min
+        self.values = slots
+        self.values.setflags(write=False)
+        self.period_min = period_min
+
+        cumsum = np.zeros(period_min + 1, dtype=np.float64)
+        np.cumsum(np.repeat(slots, resolution_min), out=cumsum[1:])
+        cumsum.setflags(write=False)
+        self._cumsum = cumsum
+
+    def _integral(self, minute: np.ndarray) -> np.ndarray:
+        periods, offset = np.divmod(minute, self.period_min)
+        whole = np.floor(offset).astype(np.int64)
+        frac = offset - whole
+        # Linear within a minute so fractional starts/durations stay exact.
+        total: np.ndarray = (
+            periods * self._cumsum[-1]
+            + self._cumsum[whole]
+            + frac * (self._cumsum[np.minimum(whole + 1, self.period_min)] - self._cumsum[whole])
+        )
+        return total
+
+    def mean_intensity(self, start_min: npt.ArrayLike, duration_min: npt.ArrayLike) -> np.ndarray:
+        """Average kgCO2/kWh over [start_min, start_min + duration_min).
+
+        Assumes a flat power draw over the window. Zero-length windows return the
+        intensity at ``start_min``.
+        """
+
+        start, duration = np.broadcast_arrays(
+            np.asarray(start_min, dtype=np.float64), np.asarray(duration_min, dtype=np.float64)
+        )
+        finite = np.isfinite(start) & np.isfinite(duration)
+        start = np.where(finite, start, 0.0)
+        duration = np.where(finite, duration, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = (self._integral(start + duration) - self._integral(start)) / duration
+        slot = (np.floor(start).astype(np.int64) % self.period_min) // self.resolution_min
+        return np.where(finite, np.where(duration > 0, mean, self.values[slot]), np.nan)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, object]], *, region: str) -> IntensityProfile:
+        """Builds a profile from ``slot_start_min`` / ``carbon_intensity`` rows.
+
+        Same shape as the Supabase ``grid_carbon_intensity`` table and the CSV format.
+        Rows for other regions (when a ``region`` column is present) are ignored.
+        """
+
+        slots: dict[int, float] = {}
+        for row in rows:
+            row_region = row.get("region")
+            if row_region is not None and str(row_region).strip() != region:
+                continue
+            slot_start = int(str(row["slot_start_min"]).strip())
+            slots[slot_start] = float(str(row["carbon_intensity"]).strip())
+
+        if len(slots) < 2:
+            raise ValueError(f"intensity profile for region '{region}' needs at least 2 slots")
+
+        starts = np.array(sorted(slots), dtype=np.int64)
+        steps = np.unique(np.diff(starts))
+        if starts[0] != 0 or steps.size != 1:
+            raise ValueError("intensity slots must start at 0 and be evenly spaced")
+
+        return cls(
+            region=region,
+            values=[slots[int(s)] for s in starts],
+            resolution_min=int(steps[0]),
+        )
+
+    @classmethod
+    def from_csv(cls, path: str | Path, *, region: str) -> IntensityProfile:
+        """Loads ``region,slot_start_min,carbon_intensity`` rows from a local CSV."""
+
+        with open(path, newline="", encoding="utf-8") as fh:
+            return cls.from_rows(csv.DictReader(fh), region=region)
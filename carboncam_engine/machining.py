@@ -1,5 +1,48 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from typing import cast
+
+import numpy as np
+import numpy.typing as npt
+
+from carboncam_engine.intensity import IntensityProfile
+from carboncam_engine.tariff import (
+    PERIOD_DAY,
+    PERIOD_NIGHT,
+    PERIOD_PEAK,
+    TariffSchedule,
+    get_tariff_schedule,
+)
+
+# Batch error codes (calculate_machining_carbon_batch). 0 = OK; order matches the
+# checks in calculate_machining_carbon so the first failing rule wins.
+BATCH_OK = 0
+BATCH_ERR_NOT_FINITE = 1
+BATCH_ERR_NEGATIVE_WEIGHT = 2
+BATCH_ERR_FINAL_GT_INITIAL = 3
+BATCH_ERR_TIME = 4
+BATCH_ERR_KC = 5
+BATCH_ERR_STANDBY_POWER = 6
+BATCH_ERR_CARBON_INTENSITY = 7
+BATCH_ERR_DENSITY = 8
+BATCH_ERR_ENERGY = 9
+BATCH_ERR_START_TIME = 10
+
+BATCH_ERROR_MESSAGES: dict[int, str] = {
+    BATCH_OK: "",
+    BATCH_ERR_NOT_FINITE: "Inputs must be finite numbers.",
+    BATCH_ERR_NEGATIVE_WEIGHT: "Weights must be non-negative.",
+    BATCH_ERR_FINAL_GT_INITIAL: "final_weight_kg cannot be greater than initial_weight_kg.",
+    BATCH_ERR_TIME: "process_time_minutes must be > 0.",
+    BATCH_ERR_KC: "kc_value must be > 0.",
+    BATCH_ERR_STANDBY_POWER: "standby_power_kw must be >= 0.",
+    BATCH_ERR_CARBON_INTENSITY: "carbon_intensity must be > 0.",
+    BATCH_ERR_DENSITY: "density must be > 0.",
+    BATCH_ERR_ENERGY: "total_energy_kwh must be >= 0",
+    BATCH_ERR_START_TIME: "start minute must be between 0 and 1439",
+}
+
 
 def _parse_hhmm_to_minutes(value: str) -> int:
     """Parses 'HH:MM' into minutes since midnight."""
@@ -16,12 +59,6 @@ def _parse_hhmm_to_minutes(value: str) -> int:
     return hour * 60 + minute
 
 
-def _overlap_minutes(a_start: int, a_end: int, b_start: int, b_end: int) -> int:
-    start = max(a_start, b_start)
-    end = min(a_end, b_end)
-    return max(0, end - start)
-
-
 def estimate_energy_cost(
     *,
     total_energy_kwh: float,
@@ -39,12 +76,16 @@ def estimate_energy_cost(
     day_start_min: int = 6 * 60,
     peak_start_min: int = 17 * 60,
     night_start_min: int = 22 * 60,
+    schedule: TariffSchedule | None = None,
 ) -> dict[str, float | str]:
     """Estimates electricity cost using Single or 3-time (Multi) tariff.
 
     - Single: cost = kWh * single_rate_per_kwh
     - Multi: splits the operation duration across Day/Peak/Night windows and applies
       weighted average rate.
+
+    Pass a precompiled ``schedule`` (see tariff.get_tariff_schedule) to reuse it across
+    calls; the rate/window arguments are then ignored.
     """
 
     if total_energy_kwh < 0:
@@ -52,13 +93,16 @@ def estimate_energy_cost(
     if process_time_minutes <= 0:
         raise ValueError("process_time_minutes must be > 0")
 
-    tariff = tariff_type.strip().lower()
     start_min = _parse_hhmm_to_minutes(operation_start_hhmm)
 
     if operation_end_hhmm:
         end_min = _parse_hhmm_to_minutes(operation_end_hhmm)
         if end_min <= start_min:
             end_min += 24 * 60
+        if process_time_minutes > 24 * 60:
+            # HH:MM only pins the clock time; whole days come from process_time_minutes.
+            extra_days = round((process_time_minutes - (end_min - start_min)) / (24 * 60))
+            end_min += max(0, extra_days) * 24 * 60
         duration_min = float(end_min - start_min)
     else:
         duration_min = float(process_time_minutes)
@@ -70,60 +114,98 @@ def estimate_energy_cost(
     interval_start = start_min
     interval_end = start_min + int(round(effective_duration_min))
 
-    if tariff == "single":
-        if single_rate_per_kwh is None or single_rate_per_kwh <= 0:
-            raise ValueError("single_rate_per_kwh must be provided and > 0 for Single tariff")
+    if schedule is None:
+        schedule = get_tariff_schedule(
+            tariff_type=tariff_type,
+            single_rate_per_kwh=single_rate_per_kwh,
+            day_rate_per_kwh=day_rate_per_kwh,
+            peak_rate_per_kwh=peak_rate_per_kwh,
+            night_rate_per_kwh=night_rate_per_kwh,
+            day_start_min=day_start_min,
+            peak_start_min=peak_start_min,
+            night_start_min=night_start_min,
+        )
+
+    if schedule.tariff_type == "single":
+        rate = float(cast(float, schedule.single_rate_per_kwh))
         return {
-            "energy_cost": float(total_energy_kwh) * float(single_rate_per_kwh),
+            "energy_cost": float(total_energy_kwh) * rate,
             "energy_currency": currency,
-            "applied_rate_per_kwh": float(single_rate_per_kwh),
+            "applied_rate_per_kwh": rate,
             "minutes_day": 0.0,
             "minutes_peak": 0.0,
             "minutes_night": float(effective_duration_min),
         }
 
-    if tariff != "multi":
-        raise ValueError("tariff_type must be 'Single' or 'Multi'")
-
-    if day_rate_per_kwh is None or peak_rate_per_kwh is None or night_rate_per_kwh is None:
-        raise ValueError("day/peak/night rates must be provided for Multi tariff")
-    if day_rate_per_kwh <= 0 or peak_rate_per_kwh <= 0 or night_rate_per_kwh <= 0:
-        raise ValueError("day/peak/night rates must be > 0")
+    minutes = schedule.period_minutes(interval_start, interval_end)
+    total_minutes = max(1, interval_end - interval_start)
+    rate_minutes = float(schedule.rate_minutes(interval_start, interval_end))
+    weighted_rate = rate_minutes / float(total_minutes)
 
-    # Define windows for a day. Night wraps around midnight.
-    windows = {
-        "day": [(day_start_min, peak_start_min)],
-        "peak": [(peak_start_min, night_start_min)],
-        "night": [(night_start_min, 24 * 60), (0, day_start_min)],
+    return {
+        "energy_cost": float(total_energy_kwh) * float(weighted_rate),
+        "energy_currency": currency,
+        "applied_rate_per_kwh": float(weighted_rate),
+        "minutes_day": float(minutes[PERIOD_DAY]),
+        "minutes_peak": float(minutes[PERIOD_PEAK]),
+        "minutes_night": float(minutes[PERIOD_NIGHT]),
     }
 
-    minutes_day = 0
-    minutes_peak = 0
-    minutes_night = 0
 
-    # Compute overlaps for up to two days (handles crossing midnight).
-    for offset in (0, 24 * 60):
-        for seg_start, seg_end in windows["day"]:
-            minutes_day += _overlap_minutes(interval_start, interval_end, seg_start + offset, seg_end + offset)
-        for seg_start, seg_end in windows["peak"]:
-            minutes_peak += _overlap_minutes(interval_start, interval_end, seg_start + offset, seg_end + offset)
-        for seg_start, seg_end in windows["night"]:
-            minutes_night += _overlap_minutes(interval_start, interval_end, seg_start + offset, seg_end + offset)
+def estimate_energy_cost_batch(
+    *,
+    schedule: TariffSchedule,
+    start_min: npt.ArrayLike,
+    duration_min: npt.ArrayLike,
+    total_energy_kwh: npt.ArrayLike,
+) -> dict[str, np.ndarray]:
+    """Vectorized estimate_energy_cost for many operations against one tariff.
+
+    ``start_min`` is minutes since midnight, ``duration_min`` the operation length in
+    minutes (rounded to whole minutes for the split, as in the scalar path). Invalid
+    rows get NaN outputs and a non-zero ``error_code`` instead of raising.
+    """
+
+    start, duration, kwh = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in (start_min, duration_min, total_energy_kwh))
+    )
+    start = np.atleast_1d(start)
+    duration = np.atleast_1d(duration)
+    kwh = np.atleast_1d(kwh)
+
+    error_code = np.zeros(start.shape, dtype=np.int8)
+    rules = (
+        (~(np.isfinite(start) & np.isfinite(duration) & np.isfinite(kwh)), BATCH_ERR_NOT_FINITE),
+        (kwh < 0, BATCH_ERR_ENERGY),
+        (duration <= 0, BATCH_ERR_TIME),
+        ((start < 0) | (start >= 24 * 60), BATCH_ERR_START_TIME),
+    )
+    for mask, code in rules:
+        error_code[(error_code == BATCH_OK) & mask] = code
+    ok = error_code == BATCH_OK
+
+    interval_start = np.where(ok, np.floor(start), 0).astype(np.int64)
+    interval_end = interval_start + np.where(ok, np.rint(duration), 0).astype(np.int64)
 
-    total_minutes = max(1, interval_end - interval_start)
-    weighted_rate = (
-        (minutes_day * float(day_rate_per_kwh))
-        + (minutes_peak * float(peak_rate_per_kwh))
-        + (minutes_night * float(night_rate_per_kwh))
-    ) / float(total_minutes)
+    if schedule.tariff_type == "single":
+        rate = np.full(start.shape, float(cast(float, schedule.single_rate_per_kwh)))
+        zeros = np.zeros(start.shape)
+        minutes_day, minutes_peak, minutes_night = zeros, zeros.copy(), duration.copy()
+    else:
+        total_minutes = np.maximum(1, interval_end - interval_start)
+        rate = schedule.rate_minutes(interval_start, interval_end) / total_minutes
+        minutes_day, minutes_peak, minutes_night = schedule.period_minutes(
+            interval_start, interval_end
+        )
 
+    nan = np.float64(np.nan)
     return {
-        "energy_cost": float(total_energy_kwh) * float(weighted_rate),
-        "energy_currency": currency,
-        "applied_rate_per_kwh": float(weighted_rate),
-        "minutes_day": float(minutes_day),
-        "minutes_peak": float(minutes_peak),
-        "minutes_night": float(minutes_night),
+        "energy_cost": np.where(ok, kwh * rate, nan),
+        "applied_rate_per_kwh": np.where(ok, rate, nan),
+        "minutes_day": np.where(ok, minutes_day, nan),
+        "minutes_peak": np.where(ok, minutes_peak, nan),
+        "minutes_night": np.where(ok, minutes_night, nan),
+        "error_code": error_code,
     }
 
 
@@ -135,6 +217,9 @@ def calculate_machining_carbon(
     standby_power_kw: float,
     carbon_intensity: float,
     density: float,
+    *,
+    intensity_profile: IntensityProfile | None = None,
+    operation_start_min: float | None = None,
 ) -> dict[str, float]:
     """Talaşlı imalat enerji tüketimi ve CO2 hesabı.
 
@@ -145,6 +230,8 @@ def calculate_machining_carbon(
     - standby_power_kw: kW
     - carbon_intensity: kgCO2 / kWh
     - density: kg / m^3  (örn. çelik ~7850)
+    - intensity_profile, operation_start_min: verilirse carbon_intensity yerine işlem
+      penceresindeki (başlangıç + süre) ortalama şebeke yoğunluğu kullanılır.
 
     Dönüş:
     - removed_material_weight_kg
@@ -155,6 +242,13 @@ def calculate_machining_carbon(
     - total_carbon_kg
     """
 
+    if intensity_profile is not None:
+        if operation_start_min is None:
+            raise ValueError("operation_start_min is required with intensity_profile.")
+        carbon_intensity = float(
+            intensity_profile.mean_intensity(operation_start_min, process_time_minutes)
+        )
+
     if initial_weight_kg < 0 or final_weight_kg < 0:
         raise ValueError("Weights must be non-negative.")
     if final_weight_kg > initial_weight_kg:
@@ -194,6 +288,192 @@ def calculate_machining_carbon(
     }
 
 
+def calculate_machining_carbon_batch(
+    *,
+    initial_weight_kg: npt.ArrayLike,
+    final_weight_kg: npt.ArrayLike,
+    process_time_minutes: npt.ArrayLike,
+    kc_value: npt.ArrayLike,
+    standby_power_kw: npt.ArrayLike,
+    carbon_intensity: npt.ArrayLike,
+    density: npt.ArrayLike,
+    intensity_profile: IntensityProfile | None = None,
+    operation_start_min: npt.ArrayLike | None = None,
+) -> dict[str, np.ndarray]:
+    """Vectorized calculate_machining_carbon for many rows at once.
+
+    Accepts NumPy arrays, pandas Series or scalars (broadcast to the row count).
+    With ``intensity_profile`` + ``operation_start_min``, each row's carbon intensity
+    is the profile mean over its own operation window.
+    Rows are validated with masks instead of raising: invalid rows get NaN outputs
+    and a non-zero ``error_code`` (see BATCH_ERROR_MESSAGES).
+
+    Returns columnar float64 arrays under the same keys as calculate_machining_carbon,
+    plus ``error_code`` (int8).
+    """
+
+    if intensity_profile is not None:
+        if operation_start_min is None:
+            raise ValueError("operation_start_min is required with intensity_profile.")
+        carbon_intensity = intensity_profile.mean_intensity(
+            operation_start_min, np.asarray(process_time_minutes, dtype=np.float64)
+        )
+
+    initial, final, time_min, kc, standby, intensity, dens = np.broadcast_arrays(
+        *(
+            np.asarray(v, dtype=np.float64)
+            for v in (
+                initial_weight_kg,
+                final_weight_kg,
+                process_time_minutes,
+                kc_value,
+                standby_power_kw,
+                carbon_intensity,
+                density,
+            )
+        )
+    )
+    initial = np.atleast_1d(initial)
+    final = np.atleast_1d(final)
+    time_min = np.atleast_1d(time_min)
+    kc = np.atleast_1d(kc)
+    standby = np.atleast_1d(standby)
+    intensity = np.atleast_1d(intensity)
+    dens = np.atleast_1d(dens)
+
+    error_code = np.zeros(initial.shape, dtype=np.int8)
+
+    finite = (
+        np.isfinite(initial)
+        & np.isfinite(final)
+        & np.isfinite(time_min)
+        & np.isfinite(kc)
+        & np.isfinite(standby)
+        & np.isfinite(intensity)
+        & np.isfinite(dens)
+    )
+    # Same order as the scalar checks; a row keeps the first error it hits.
+    rules = (
+        (~finite, BATCH_ERR_NOT_FINITE),
+        ((initial < 0) | (final < 0), BATCH_ERR_NEGATIVE_WEIGHT),
+        (final > initial, BATCH_ERR_FINAL_GT_INITIAL),
+        (time_min <= 0, BATCH_ERR_TIME),
+        (kc <= 0, BATCH_ERR_KC),
+        (standby < 0, BATCH_ERR_STANDBY_POWER),
+        (intensity <= 0, BATCH_ERR_CARBON_INTENSITY),
+        (dens <= 0, BATCH_ERR_DENSITY),
+    )
+    for mask, code in rules:
+        error_code[(error_code == BATCH_OK) & mask] = code
+
+    ok = error_code == BATCH_OK
+    with np.errstate(divide="ignore", invalid="ignore"):
+        removed_material_weight = np.where(ok, initial - final, np.nan)
+        removed_volume_cm3 = (removed_material_weight / dens) * 1_000_000.0
+        processing_energy_kwh = (removed_volume_cm3 * kc) / 60.0 / 1000.0 / 0.85
+        idle_energy_kwh = np.where(ok, standby * (time_min / 60.0), np.nan)
+        total_energy_kwh = processing_energy_kwh + idle_energy_kwh
+        total_carbon = total_energy_kwh * intensity
+
+    return {
+        "removed_material_weight_kg": removed_material_weight,
+        "removed_volume_cm3": removed_volume_cm3,
+        "processing_energy_kwh": processing_energy_kwh,
+        "idle_energy_kwh": idle_energy_kwh,
+        "total_energy_kwh": total_energy_kwh,
+        "total_carbon_kg": total_carbon,
+        "error_code": error_code,
+    }
+
+
+@dataclass(frozen=True)
+class CalculationPlan:
+    """Precompiled coefficients for one (machine, material) pair.
+
+    Folds the per-call constants of calculate_machining_carbon into two energy
+    coefficients, so energy is ``removed_kg * kwh_per_kg_removed + minutes *
+    idle_kwh_per_min`` and carbon is that times ``carbon_intensity``. Build with
+    CalculationPlan.compile(); results match calculate_machining_carbon.
+    """
+
+    kc_value: float
+    standby_power_kw: float
+    carbon_intensity: float
+    density: float
+    cm3_per_kg: float
+    kwh_per_kg_removed: float
+    idle_kwh_per_min: float
+
+    @classmethod
+    def compile(
+        cls,
+        *,
+        kc_value: float,
+        standby_power_kw: float,
+        carbon_intensity: float,
+        density: float,
+    ) -> CalculationPlan:
+        if kc_value <= 0:
+            raise ValueError("kc_value must be > 0.")
+        if standby_power_kw < 0:
+            raise ValueError("standby_power_kw must be >= 0.")
+        if carbon_intensity <= 0:
+            raise ValueError("carbon_intensity must be > 0.")
+        if density <= 0:
+            raise ValueError("density must be > 0.")
+
+        cm3_per_kg = 1_000_000.0 / density
+        return cls(
+            kc_value=kc_value,
+            standby_power_kw=standby_power_kw,
+            carbon_intensity=carbon_intensity,
+            density=density,
+            cm3_per_kg=cm3_per_kg,
+            kwh_per_kg_removed=cm3_per_kg * kc_value / 60.0 / 1000.0 / 0.85,
+            idle_kwh_per_min=standby_power_kw / 60.0,
+        )
+
+    def evaluate(
+        self,
+        *,
+        initial_weight_kg: float,
+        final_weight_kg: float,
+        process_time_minutes: float,
+        intensity_profile: IntensityProfile | None = None,
+        operation_start_min: float | None = None,
+    ) -> dict[str, float]:
+        """Same result (and ValueErrors) as calculate_machining_carbon for this pair."""
+
+        carbon_intensity = self.carbon_intensity
+        if intensity_profile is not None:
+            if operation_start_min is None:
+                raise ValueError("operation_start_min is required with intensity_profile.")
+            carbon_intensity = float(
+                intensity_profile.mean_intensity(operation_start_min, process_time_minutes)
+            )
+
+        if initial_weight_kg < 0 or final_weight_kg < 0:
+            raise ValueError("Weights must be non-negative.")
+        if final_weight_kg > initial_weight_kg:
+            raise ValueError("final_weight_kg cannot be greater than initial_weight_kg.")
+        if process_time_minutes <= 0:
+            raise ValueError("process_time_minutes must be > 0.")
+
+        removed_material_weight = initial_weight_kg - final_weight_kg
+        processing_energy_kwh = removed_material_weight * self.kwh_per_kg_removed
+        idle_energy_kwh = process_time_minutes * self.idle_kwh_per_min
+        total_energy_kwh = processing_energy_kwh + idle_energy_kwh
+
+        return {
+            "removed_material_weight_kg": removed_material_weight,
+            "removed_volume_cm3": removed_material_weight * self.cm3_per_kg,
+            "processing_energy_kwh": processing_energy_kwh,
+            "idle_energy_kwh": idle_energy_kwh,
+            "total_energy_kwh": total_energy_kwh,
+            "total_carbon_kg": total_energy_kwh * carbon_intensity,
+        }
+
+
 if __name__ == "__main__":
     result = calculate_machining_carbon(
         initial_weight_kg=10.0,
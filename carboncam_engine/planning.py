@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+
+from carboncam_engine.intensity import IntensityProfile
+from carboncam_engine.machining import estimate_energy_cost_batch
+from carboncam_engine.tariff import MINUTES_PER_DAY, TariffSchedule
+
+# Prefix-sum differences carry float noise; values this close (relative) are ties.
+_REL_TOL = 1e-9
+
+
+def _first_min_index(values: np.ndarray) -> int:
+    best = float(np.nanmin(values))
+    tol = _REL_TOL * max(1.0, abs(best))
+    return int(np.argmax(values <= best + tol))
+
+
+def find_optimal_start_times(
+    *,
+    total_energy_kwh: float,
+    duration_min: float,
+    schedule: TariffSchedule,
+    carbon_intensity: float,
+    intensity_profile: IntensityProfile | None = None,
+    horizon_min: int = MINUTES_PER_DAY,
+    step_min: int = 1,
+) -> dict[str, object]:
+    """Sweeps every candidate start minute and returns the cost/carbon curves.
+
+    Each candidate is a sliding window of ``duration_min`` over the compiled tariff
+    (and intensity) prefix sums, so the whole sweep is a handful of vectorized
+    lookups. Carbon uses ``carbon_intensity`` unless an ``intensity_profile`` is given.
+    Ties resolve to the earliest start.
+    """
+
+    if total_energy_kwh < 0:
+        raise ValueError("total_energy_kwh must be >= 0")
+    if duration_min <= 0:
+        raise ValueError("duration_min must be > 0")
+    if horizon_min <= 0 or step_min <= 0:
+        raise ValueError("horizon_min and step_min must be > 0")
+    if intensity_profile is None and carbon_intensity <= 0:
+        raise ValueError("carbon_intensity must be > 0")
+
+    start_min = np.arange(0, horizon_min, step_min, dtype=np.int64)
+    # estimate_energy_cost_batch takes minute-of-day starts; tariffs repeat daily.
+    cost = estimate_energy_cost_batch(
+        schedule=schedule,
+        start_min=start_min % MINUTES_PER_DAY,
+        duration_min=duration_min,
+        total_energy_kwh=total_energy_kwh,
+    )
+
+    if intensity_profile is not None:
+        intensity = intensity_profile.mean_intensity(start_min, duration_min)
+    else:
+        intensity = np.full(start_min.shape, float(carbon_intensity))
+    carbon = total_energy_kwh * intensity
+
+    cheapest = _first_min_index(cost["energy_cost"])
+    greenest = _first_min_index(carbon)
+
+    return {
+        "start_min": start_min,
+        "energy_cost": cost["energy_cost"],
+        "applied_rate_per_kwh": cost["applied_rate_per_kwh"],
+        "total_carbon_kg": carbon,
+        "cheapest_start_min": int(start_min[cheapest]),
+        "lowest_carbon_start_min": int(start_min[greenest]),
+    }
+
+
+def _tie_ranks(values: np.ndarray) -> np.ndarray:
+    """Dense ranks of ``values``; neighbours within ``_REL_TOL`` share a rank."""
+
+    order = np.argsort(values, kind="stable")
+    ordered = values[order]
+    # Written as "not within tolerance" so a NaN always starts its own rank.
+    step = ~(np.diff(ordered) <= _REL_TOL * np.maximum(1.0, np.abs(ordered[1:])))
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.concatenate(([0], np.cumsum(step)))
+    return ranks
+
+
+def _pareto_mask_2d(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Non-dominated (x, y) pairs, both minimized; equal pairs all survive."""
+
+    order = np.lexsort((y, x))
+    xs, ys = x[order], y[order]
+    first = np.searchsorted(xs, xs, side="left")
+    # Dominated by a pair with a smaller x and no larger y ...
+    running = np.minimum.accumulate(ys)
+    dominated = (first > 0) & (running[np.maximum(first - 1, 0)] <= ys)
+    # ... or by one with the same x and a smaller y (sorted first within equal x).
+    dominated |= ys > ys[first]
+    mask = np.empty(len(order), dtype=bool)
+    mask[order] = ~dominated
+    return mask
+
+
+def _pareto_mask(points: np.ndarray) -> np.ndarray:
+    """Non-dominated rows of ``points`` (all objectives minimized); equal rows all survive.
+
+    Values within ``_REL_TOL`` of each other compare as equal. Rows are swept by the third objective. A row is dominated either within its
+    group of equal third values (a 2D check) or by a kept row with a smaller
+    third value that is no worse on the first two; the kept rows form a
+    staircase (x ascending, running minimum of y) answered by one searchsorted.
+    O(n log n) per distinct third value and O(n) memory.
+    """
+
+    if len(points):
+        points = np.column_stack([_tie_ranks(points[:, k]) for k in range(points.shape[1])])
+    keep = np.zeros(len(points), dtype=bool)
+    stair_x = np.zeros(0)
+    stair_y = np.zeros(0)
+    for value in np.unique(points[:, 2]):
+        rows = np.flatnonzero(points[:, 2] == value)
+        x, y = points[rows, 0], points[rows, 1]
+        ok = _pareto_mask_2d(x, y)
+        if stair_x.size:
+            pos = np.searchsorted(stair_x, x, side="right") - 1
+            ok &= ~((pos >= 0) & (stair_y[np.maximum(pos, 0)] <= y))
+        keep[rows[ok]] = True
+        stair_x = np.concatenate([stair_x, x[ok]])
+        stair_y = np.concatenate([stair_y, y[ok]])
+        order = np.argsort(stair_x, kind="stable")
+        stair_x, stair_y = stair_x[order], np.minimum.accumulate(stair_y[order])
+    return keep
+
+
+def machine_start_pareto_front(
+    *,
+    total_energy_kwh: npt.ArrayLike,
+    idle_energy_kwh: npt.ArrayLike,
+    carbon_intensity: npt.ArrayLike,
+    duration_min: float,
+    schedule: TariffSchedule,
+    intensity_profile: IntensityProfile | None = None,
+    horizon_min: int = MINUTES_PER_DAY,
+    slot_min: int = 15,
+) -> dict[str, np.ndarray]:
+    """Pareto front of (energy cost, carbon, idle share) over machines x start slots.
+
+    Inputs are per-machine arrays (e.g. from calculate_machining_carbon_batch). The
+    full grid is scored with one broadcasted tariff/intensity lookup. Idle share is
+    constant per machine, so each machine is first reduced to its 2D (cost, carbon)
+    front with a sort + running minimum; the final 3D dominance check then only
+    runs on those survivors, sweeping them by idle share.
+
+    Returns front points sorted by cost: ``machine_index``, ``start_min``,
+    ``energy_cost``, ``total_carbon_kg``, ``idle_share``.
+    """
+
+    energy = np.asarray(total_energy_kwh, dtype=np.float64).ravel()
+    idle = np.asarray(idle_energy_kwh, dtype=np.float64).ravel()
+    machine_intensity = np.broadcast_to(
+        np.asarray(carbon_intensity, dtype=np.float64), energy.shape
+    )
+    if duration_min <= 0:
+        raise ValueError("duration_min must be > 0")
+    if horizon_min <= 0 or slot_min <= 0:
+        raise ValueError("horizon_min and slot_min must be > 0")
+    if intensity_profile is None and (machine_intensity <= 0).any():
+        raise ValueError("carbon_intensity must be > 0")
+
+    slot_starts = np.arange(0, horizon_min, slot_min, dtype=np.int64)
+    rate = estimate_energy_cost_batch(
+        schedule=schedule,
+        start_min=slot_starts % MINUTES_PER_DAY,
+        duration_min=duration_min,
+        total_energy_kwh=1.0,
+    )["applied_rate_per_kwh"]
+    cost = energy[:, None] * rate[None, :]
+    if intensity_profile is not None:
+        carbon = (
+            energy[:, None] * intensity_profile.mean_intensity(slot_starts, duration_min)[None, :]
+        )
+    else:
+        carbon = (energy * machine_intensity)[:, None] * np.ones(slot_starts.shape)[None, :]
+    # Near-equal slots tie (earliest wins) in the per-machine reduction below;
+    # the reported values stay unrounded.
+    cost_rank = _tie_ranks(cost.ravel()).reshape(cost.shape)
+    carbon_rank = _tie_ranks(carbon.ravel()).reshape(carbon.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        idle_share = np.where(energy > 0, idle / energy, 0.0)
+
+    machines: list[np.ndarray] = []
+    slots: list[np.ndarray] = []
+    for m in range(energy.size):
+        if not np.isfinite(energy[m]):
+            continue
+        order = np.lexsort((carbon_rank[m], cost_rank[m]))
+        running = np.minimum.accumulate(carbon_rank[m, order])
+        keep = np.ones(order.size, dtype=bool)
+        keep[1:] = carbon_rank[m, order[1:]] < running[:-1]
+        machines.append(np.full(int(keep.sum()), m, dtype=np.int64))
+        slots.append(order[keep])
+
+    if not machines:
+        empty = np.zeros(0)
+        return {
+            "machine_index": empty.astype(np.int64),
+            "start_min": empty.astype(np.int64),
+            "energy_cost": empty,
+            "total_carbon_kg": empty,
+            "idle_share": empty,
+        }
+
+    cand_m = np.concatenate(machines)
+    cand_s = np.concatenate(slots)
+    points = np.column_stack((cost[cand_m, cand_s], carbon[cand_m, cand_s], idle_share[cand_m]))
+    mask = _pareto_mask(points)
+    cand_m, cand_s, points = cand_m[mask], cand_s[mask], points[mask]
+    order = np.lexsort((points[:, 1], points[:, 0]))
+
+    return {
+        "machine_index": cand_m[order],
+        "start_min": slot_starts[cand_s[order]],
+        "energy_cost": points[order, 0],
+        "total_carbon_kg": points[order, 1],
+        "idle_share": points[order, 2],
+    }
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import Any
+
+import httpx
+
+try:
+    import h2  # noqa: F401  # type: ignore[import-not-found]
+
+    HTTP2_AVAILABLE = True
+except ImportError:  # HTTP/1.1 keep-alive only
+    HTTP2_AVAILABLE = False
+
+DEFAULT_TIMEOUT_SECONDS = 10.0
+
+
+class PostgrestError(Exception):
+    """A PostgREST call failed: ``status_code`` is None when the service was unreachable."""
+
+    def __init__(self, message: str, *, status_code: int | None = None, body: str = "") -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def _request_kwargs(
+    *,
+    params: dict[str, str] | None,
+    json: object,
+    headers: dict[str, str] | None,
+    timeout: float | None,
+) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {"params": params, "headers": headers}
+    if json is not None:
+        kwargs["json"] = json
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return kwargs
+
+
+def _checked(resp: httpx.Response) -> httpx.Response:
+    if resp.status_code >= 400:
+        raise PostgrestError(
+            f"HTTP {resp.status_code}", status_code=resp.status_code, body=resp.text
+        )
+    return resp
+
+
+def _json_rows(body: object) -> list[dict[str, object]]:
+    if not isinstance(body, list):
+        raise ValueError("expected a JSON array")
+    return [row for row in body if isinstance(row, dict)]
+
+
+def _client_options(
+    *, url: str, service_role_key: str, timeout: float, max_connections: int
+) -> dict[str, Any]:
+    return {
+        "base_url": f"{url.rstrip('/')}/rest/v1/",
+        "headers": {"apikey": service_role_key, "Authorization": f"Bearer {service_role_key}"},
+        "timeout": timeout,
+        "http2": HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        ),
+    }
+
+
+def _settings_from_env() -> tuple[str, str, float, int] | None:
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        return None
+    return (
+        url,
+        key,
+        float(os.getenv("SUPABASE_TIMEOUT_SECONDS", str(DEFAULT_TIMEOUT_SECONDS))),
+        int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20")),
+    )
+
+
+class PostgrestClient:
+    """Connection-pooled client for Supabase PostgREST (``<url>/rest/v1``) as service role.
+
+    One instance is shared by all threads: connections are kept alive between
+    calls (HTTP/2 when the ``h2`` package is installed), and each call may pass
+    its own ``timeout``.
+    """
+
+    def __init__(
+        self,
+        *,
+        url: str,
+        service_role_key: str,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        max_connections: int = 20,
+    ) -> None:
+        self.url = url
+        self.service_role_key = service_role_key
+        self._http = httpx.Client(
+            **_client_options(
+                url=url,
+                service_role_key=service_role_key,
+                timeout=timeout,
+                max_connections=max_connections,
+            )
+        )
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: dict[str, str] | None = None,
+        json: object = None,
+        headers: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> httpx.Response:
+        """Sends one request; raises PostgrestError on network errors and 4xx/5xx."""
+
+        kwargs = _request_kwargs(params=params, json=json, headers=headers, timeout=timeout)
+        try:
+            resp = self._http.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            raise PostgrestError(str(e)) from e
+        return _checked(resp)
+
+    def select(
+        self, table: str, *, params: dict[str, str], timeout: float | None = None
+    ) -> list[dict[str, object]]:
+        """GET ``table`` with PostgREST filters; returns the rows that are JSON objects.
+
+        Raises ValueError if the body is not a JSON array.
+        """
+
+        return _json_rows(self.request("GET", table, params=params, timeout=timeout).json())
+
+    def rpc(self, name: str, payload: dict[str, object], *, timeout: float | None = None) -> object:
+        """Calls ``rpc/<name>`` and returns the decoded JSON body (ValueError if not JSON)."""
+
+        return self.request("POST", f"rpc/{name}", json=payload, timeout=timeout).json()
+
+    def warm_up(self, *, timeout: float = 5.0) -> bool:
+        """Opens a pooled connection ahead of the first real call; True if reachable."""
+
+        try:
+            self._http.head("", timeout=timeout)
+        except httpx.HTTPError:
+            return False
+        return True
+
+    def close(self) -> None:
+        self._http.close()
+
+
+_client: PostgrestClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_postgrest_client() -> PostgrestClient | None:
+    """Shared client for SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY, or None when unset (dev).
+
+    The client is rebuilt if those env values change.
+    """
+
+    global _client
+    settings = _settings_from_env()
+    if settings is None:
+        return None
+    url, key, timeout, max_connections = settings
+
+    client = _client
+    if client is not None and client.url == url and client.service_role_key == key:
+        return client
+    with _client_lock:
+        if _client is None or _client.url != url or _client.service_role_key != key:
+            previous = _client
+            _client = PostgrestClient(
+                url=url, service_role_key=key, timeout=timeout, max_connections=max_connections
+            )
+            if previous is not None:
+                previous.close()
+        return _client
+
+
+def close_postgrest_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+class AsyncPostgrestClient:
+    """PostgrestClient for coroutines: same calls, awaited on an httpx.AsyncClient.
+
+    Its connections belong to the event loop that first used them.
+    """
+
+    def __init__(
+        self,
+        *,
+        url: str,
+        service_role_key: str,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        max_connections: int = 20,
+    ) -> None:
+        self.url = url
+        self.service_role_key = service_role_key
+        self._http = httpx.AsyncClient(
+            **_client_options(
+                url=url,
+                service_role_key=service_role_key,
+                timeout=timeout,
+                max_connections=max_connections,
+            )
+        )
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: dict[str, str] | None = None,
+        json: object = None,
+        headers: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> httpx.Response:
+        """Sends one request; raises PostgrestError on network errors and 4xx/5xx."""
+
+        kwargs = _request_kwargs(params=params, json=json, headers=headers, timeout=timeout)
+        try:
+            resp = await self._http.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            raise PostgrestError(str(e)) from e
+        return _checked(resp)
+
+    async def select(
+        self, table: str, *, params: dict[str, str], timeout: float | None = None
+    ) -> list[dict[str, object]]:
+        """GET ``table`` with PostgREST filters (ValueError if not a JSON array)."""
+
+        resp = await self.request("GET", table, params=params, timeout=timeout)
+        return _json_rows(resp.json())
+
+    async def rpc(
+        self, name: str, payload: dict[str, object], *, timeout: float | None = None
+    ) -> object:
+        """Calls ``rpc/<name>`` and returns the decoded JSON body (ValueError if not JSON)."""
+
+        resp = await self.request("POST", f"rpc/{name}", json=payload, timeout=timeout)
+        return resp.json()
+
+    async def warm_up(self, *, timeout: float = 5.0) -> bool:
+        """Opens a pooled connection ahead of the first real call; True if reachable."""
+
+        try:
+            await self._http.head("", timeout=timeout)
+        except httpx.HTTPError:
+            return False
+        return True
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_closing: set[asyncio.Task[None]] = set()
+
+
+def _retire(task: asyncio.Task[None]) -> None:
+    # The loop only keeps weak references to tasks.
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+_async_client: AsyncPostgrestClient | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_async_postgrest_client() -> AsyncPostgrestClient | None:
+    """Shared async client for the running event loop, or None when Supabase env is unset.
+
+    Must be called from a coroutine. The client is rebuilt if the env values or
+    the event loop change; a client left behind on a closed loop is dropped.
+    """
+
+    global _async_client, _async_client_loop
+    settings = _settings_from_env()
+    if settings is None:
+        return None
+    url, key, timeout, max_connections = settings
+
+    loop = asyncio.get_running_loop()
+    client = _async_client
+    if (
+        client is not None
+        and _async_client_loop is loop
+        and client.url == url
+        and client.service_role_key == key
+    ):
+        return client
+
+    if client is not None and _async_client_loop is loop:
+        _retire(loop.create_task(client.aclose()))
+    _async_client = AsyncPostgrestClient(
+        url=url, service_role_key=key, timeout=timeout, max_connections=max_connections
+    )
+    _async_client_loop = loop
+    return _async_client
+
+
+async def aclose_async_postgrest_client() -> None:
+    global _async_client, _async_client_loop
+    client, _async_client, _async_client_loop = _async_client, None, None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+
+import numpy as np
+
+from carboncam_engine.intensity import IntensityProfile
+from carboncam_engine.tariff import MINUTES_PER_DAY, TariffSchedule
+
+
+@dataclass(frozen=True)
+class FleetMachine:
+    machine_id: str
+    standby_power_kw: float
+    carbon_intensity: float
+    # Capacity window (minutes from plan start); one job at a time.
+    available_from_min: int = 0
+    available_until_min: int | None = None
+
+
+@dataclass(frozen=True)
+class FleetJob:
+    job_id: str
+    duration_min: int
+    processing_energy_kwh: float
+    machine_ids: tuple[str, ...] | None = None
+    earliest_start_min: int = 0
+    latest_end_min: int | None = None
+
+
+@dataclass(frozen=True)
+class JobAssignment:
+    job_id: str
+    machine_id: str
+    start_min: int
+    end_min: int
+    total_energy_kwh: float
+    energy_cost: float
+    total_carbon_kg: float
+
+
+class _FleetState:
+    """Per-machine minute occupancy with prefix sums for O(1) free-window checks."""
+
+    def __init__(self, machines: list[FleetMachine], horizon_min: int) -> None:
+        self.busy = np.zeros((len(machines), horizon_min), dtype=np.int32)
+        for m, machine in enumerate(machines):
+            self.busy[m, : max(0, machine.available_from_min)] = 1
+            if machine.available_until_min is not None:
+                self.busy[m, max(0, machine.available_until_min) :] = 1
+        self.busy_cumsum = np.zeros((len(machines), horizon_min + 1), dtype=np.int32)
+        np.cumsum(self.busy, axis=1, out=self.busy_cumsum[:, 1:])
+
+    def set(self, machine: int, start: int, end: int, value: int) -> None:
+        self.busy[machine, start:end] = value
+        np.cumsum(self.busy[machine], out=self.busy_cumsum[machine, 1:])
+
+    def free(self, starts: np.ndarray, duration: int) -> np.ndarray:
+        busy = self.busy_cumsum[:, starts + duration] - self.busy_cumsum[:, starts]
+        free: np.ndarray = busy == 0
+        return free
+
+
+def schedule_fleet_jobs(
+    *,
+    jobs: list[FleetJob],
+    machines: list[FleetMachine],
+    schedule: TariffSchedule,
+    objective: str = "cost",
+    intensity_profile: IntensityProfile | None = None,
+    horizon_min: int = MINUTES_PER_DAY,
+    slot_min: int = 15,
+    local_search_passes: int = 2,
+) -> dict[str, object]:
+    """Assigns jobs to machines and start slots minimizing tariff cost or carbon.
+
+    Heuristic: jobs are popped from a heap ordered by scheduling slack (tightest
+    windows first) and energy (largest first) and placed greedily at their best
+    feasible (machine, slot); then ``local_search_passes`` rounds of remove-and-
+    reinsert moves keep any improvement. Each placement scores the full
+    machines x slots grid at once with the compiled tariff/intensity prefix sums.
+    A machine runs one job at a time inside its availability window.
+
+    Returns ``assignments`` (list[JobAssignment], sorted by machine and start),
+    ``unassigned`` job ids and plan totals.
+    """
+
+    objective = objective.strip().lower()
+    if objective not in {"cost", "carbon"}:
+        raise ValueError("objective must be 'cost' or 'carbon'")
+    if horizon_min <= 0 or slot_min <= 0:
+        raise ValueError("horizon_min and slot_min must be > 0")
+    if not machines:
+        raise ValueError("at least one machine is required")
+    if len({m.machine_id for m in machines}) != len(machines):
+        raise ValueError("machine_id values must be unique")
+    if len({j.job_id for j in jobs}) != len(jobs):
+        raise ValueError("job_id values must be unique")
+
+    machine_index = {m.machine_id: i for i, m in enumerate(machines)}
+    for job in jobs:
+        missing = [m for m in job.machine_ids or () if m not in machine_index]
+        if missing:
+            raise ValueError(f"job {job.job_id}: machine_id not in machines: {', '.join(missing)}")
+    standby_kw = np.array([m.standby_power_kw for m in machines], dtype=np.float64)
+    machine_intensity = np.array([m.carbon_intensity for m in machines], dtype=np.float64)
+    slot_starts = np.arange(0, horizon_min, slot_min, dtype=np.int64)
+    state = _FleetState(machines, horizon_min)
+
+    # Per-duration rate and intensity curves over all slots (shared by equal durations).
+    curves: dict[int, tuple[np.ndarray, np.ndarray | None]] = {}
+
+    def _curves(duration: int) -> tuple[np.ndarray, np.ndarray | None]:
+        if duration not in curves:
+            starts = slot_starts % MINUTES_PER_DAY
+            rate = schedule.rate_minutes(starts, starts + duration) / float(duration)
+            intensity = (
+                intensity_profile.mean_intensity(slot_starts, duration)
+                if intensity_profile is not None
+                else None
+            )
+            curves[duration] = (rate, intensity)
+        return curves[duration]
+
+    def _energy(job: FleetJob) -> np.ndarray:
+        return job.processing_energy_kwh + standby_kw * (job.duration_min / 60.0)
+
+    def _scores(job: FleetJob) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(objective, cost, carbon) over machines x slots; infeasible cells are inf."""
+
+        duration = job.duration_min
+        energy = _energy(job)
+        rate, intensity = _curves(duration)
+        cost = energy[:, None] * rate[None, :]
+        if intensity is not None:
+            carbon = energy[:, None] * intensity[None, :]
+        else:
+            carbon = (energy * machine_intensity)[:, None] * np.ones_like(rate)[None, :]
+
+        latest_end = (
+            horizon_min if job.latest_end_min is None else min(job.latest_end_min, horizon_min)
+        )
+        slot_ok = (slot_starts >= job.earliest_start_min) & (slot_starts + duration <= latest_end)
+        feasible = np.zeros(cost.shape, dtype=bool)
+        if slot_ok.any():
+            ok_starts = slot_starts[slot_ok]
+            feasible[:, slot_ok] = state.free(ok_starts, duration)
+        if job.machine_ids is not None:
+            allowed = np.zeros(len(machines), dtype=bool)
+            allowed[[machine_index[m] for m in job.machine_ids]] = True
+            feasible &= allowed[:, None]
+
+        score = cost if objective == "cost" else carbon
+        return np.where(feasible, score, np.inf), cost, carbon
+
+    # job -> (machine, start, cost, carbon)
+    placement: dict[int, tuple[int, int, float, float]] = {}
+
+    def _place(j: int) -> float | None:
+        score, cost, carbon = _scores(jobs[j])
+        best = int(np.argmin(score))
+        m, s = divmod(best, score.shape[1])
+        if not np.isfinite(score[m, s]):
+            return None
+        start = int(slot_starts[s])
+        state.set(m, start, start + jobs[j].duration_min, 1)
+        placement[j] = (m, start, float(cost[m, s]), float(carbon[m, s]))
+        return float(score[m, s])
+
+    # Greedy: tightest window first, then largest energy.
+    heap: list[tuple[float, float, int]] = []
+    for j, job in enumerate(jobs):
+        if job.duration_min <= 0:
+            raise ValueError(f"job {job.job_id}: duration_min must be > 0")
+        latest_end = horizon_min if job.latest_end_min is None else job.latest_end_min
+        slack = float(latest_end - job.earliest_start_min - job.duration_min)
+        heapq.heappush(heap, (slack, -float(np.max(_energy(job))), j))
+    while heap:
+        _, _, j = heapq.heappop(heap)
+        _place(j)
+
+    # Local search: pull each job out and reinsert it at its best spot given the rest.
+    for _ in range(max(0, local_search_passes)):
+        improved = False
+        for j in list(placement):
+            m, start, cost, carbon = placement.pop(j)
+            current = cost if objective == "cost" else carbon
+            state.set(m, start, start + jobs[j].duration_min, 0)
+            new_score = _place(j)
+            if new_score is None or new_score >= current - 1e-9 * max(1.0, abs(current)):
+                if j in placement:
+                    nm, ns, _, _ = placement[j]
+                    state.set(nm, ns, ns + jobs[j].duration_min, 0)
+                state.set(m, start, start + jobs[j].duration_min, 1)
+                placement[j] = (m, start, cost, carbon)
+            else:
+                improved = True
+        if not improved:
+            break
+
+    assignments = [
+        JobAssignment(
+            job_id=jobs[j].job_id,
+            machine_id=machines[m].machine_id,
+            start_min=start,
+            end_min=start + jobs[j].duration_min,
+            total_energy_kwh=float(_energy(jobs[j])[m]),
+            energy_cost=cost,
+            total_carbon_kg=carbon,
+        )
+        for j, (m, start, cost, carbon) in placement.items()
+    ]
+    assignments.sort(key=lambda a: (machine_index[a.machine_id], a.start_min))
+
+    return {
+        "assignments": assignments,
+        "unassigned": [jobs[j].job_id for j in range(len(jobs)) if j not in placement],
+        "total_energy_kwh": sum(a.total_energy_kwh for a in assignments),
+        "total_energy_cost": sum(a.energy_cost for a in assignments),
+        "total_carbon_kg": sum(a.total_carbon_kg for a in assignments),
+    }
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import numpy.typing as npt
+
+MINUTES_PER_DAY = 24 * 60
+
+# Row index of each window in TariffSchedule period tables.
+PERIOD_DAY = 0
+PERIOD_PEAK = 1
+PERIOD_NIGHT = 2
+
+
+class TariffSchedule:
+    """Compiled Single or Multi (Day/Peak/Night) electricity tariff.
+
+    Built once per rate set: holds a per-minute rate table for one day and the
+    prefix sums of rates and window minutes. The integral up to any minute is
+    ``whole_days * daily_total + prefix[minute % 1440]``, so the cost split of an
+    interval is constant-time and exact for any duration (multi-day, week-long).
+    Window semantics match
+    estimate_energy_cost: Day [day_start, peak_start), Peak [peak_start, night_start),
+    Night [night_start, 24:00) + [00:00, day_start).
+    """
+
+    __slots__ = (
+        "tariff_type",
+        "single_rate_per_kwh",
+        "day_rate_per_kwh",
+        "peak_rate_per_kwh",
+        "night_rate_per_kwh",
+        "day_start_min",
+        "peak_start_min",
+        "night_start_min",
+        "minute_rates",
+        "_rate_cumsum",
+        "_period_cumsum",
+    )
+
+    def __init__(
+        self,
+        *,
+        tariff_type: str,
+        single_rate_per_kwh: float | None = None,
+        day_rate_per_kwh: float | None = None,
+        peak_rate_per_kwh: float | None = None,
+        night_rate_per_kwh: float | None = None,
+        day_start_min: int = 6 * 60,
+        peak_start_min: int = 17 * 60,
+        night_start_min: int = 22 * 60,
+    ) -> None:
+        tariff = tariff_type.strip().lower()
+        minute_rates = np.zeros(MINUTES_PER_DAY, dtype=np.float64)
+        period_minutes = np.zeros((3, MINUTES_PER_DAY), dtype=np.float64)
+
+        if tariff == "single":
+            if single_rate_per_kwh is None or single_rate_per_kwh <= 0:
+                raise ValueError("single_rate_per_kwh must be provided and > 0 for Single tariff")
+            minute_rates[:] = float(single_rate_per_kwh)
+        elif tariff == "multi":
+            if day_rate_per_kwh is None or peak_rate_per_kwh is None or night_rate_per_kwh is None:
+                raise ValueError("day/peak/night rates must be provided for Multi tariff")
+            if day_rate_per_kwh <= 0 or peak_rate_per_kwh <= 0 or night_rate_per_kwh <= 0:
+                raise ValueError("day/peak/night rates must be > 0")
+
+            windows = (
+                (PERIOD_DAY, float(day_rate_per_kwh), [(day_start_min, peak_start_min)]),
+                (PERIOD_PEAK, float(peak_rate_per_kwh), [(peak_start_min, night_start_min)]),
+                (
+                    PERIOD_NIGHT,
+                    float(night_rate_per_kwh),
+                    [(night_start_min, MINUTES_PER_DAY), (0, day_start_min)],
+                ),
+            )
+            # Accumulate (not assign) so misordered boundaries behave like the
+            # original overlap sums did.
+            for period, rate, segments in windows:
+                for seg_start, seg_end in segments:
+                    if seg_end > seg_start:
+                        minute_rates[seg_start:seg_end] += rate
+                        period_minutes[period, seg_start:seg_end] += 1.0
+        else:
+            raise ValueError("tariff_type must be 'Single' or 'Multi'")
+
+        self.tariff_type = tariff
+        self.single_rate_per_kwh = single_rate_per_kwh
+        self.day_rate_per_kwh = day_rate_per_kwh
+        self.peak_rate_per_kwh = peak_rate_per_kwh
+        self.night_rate_per_kwh = night_rate_per_kwh
+        self.day_start_min = day_start_min
+        self.peak_start_min = peak_start_min
+        self.night_start_min = night_start_min
+
+        self.minute_rates = minute_rates
+        self.minute_rates.setflags(write=False)
+        self._rate_cumsum = _prefix_sum(minute_rates)
+        self._period_cumsum = np.stack([_prefix_sum(row) for row in period_minutes])
+
+    def _integral(self, cumsum: np.ndarray, minute: np.ndarray) -> np.ndarray:
+        days, minute_of_day = np.divmod(minute, MINUTES_PER_DAY)
+        daily_total = cumsum[..., MINUTES_PER_DAY]
+        daily_total = daily_total.reshape(daily_total.shape + (1,) * np.ndim(days))
+        total: np.ndarray = days * daily_total + cumsum[..., minute_of_day]
+        return total
+
+    def rate_minutes(self, start_min: npt.ArrayLike, end_min: npt.ArrayLike) -> np.ndarray:
+        """Sum of per-minute rates over [start_min, end_min) (rate * minutes)."""
+
+        start = np.asarray(start_min, dtype=np.int64)
+        end = np.asarray(end_min, dtype=np.int64)
+        rate: np.ndarray = self._integral(self._rate_cumsum, end) - self._integral(
+            self._rate_cumsum, start
+        )
+        return rate
+
+    def period_minutes(self, start_min: npt.ArrayLike, end_min: npt.ArrayLike) -> np.ndarray:
+        """Minutes of [start_min, end_min) in Day/Peak/Night; leading axis is PERIOD_*."""
+
+        start = np.asarray(start_min, dtype=np.int64)
+        end = np.asarray(end_min, dtype=np.int64)
+        minutes: np.ndarray = self._integral(self._period_cumsum, end) - self._integral(
+            self._period_cumsum, start
+        )
+        return minutes
+
+
+def _prefix_sum(values: np.ndarray) -> np.ndarray:
+    out = np.zeros(values.shape[-1] + 1, dtype=np.float64)
+    np.cumsum(values, out=out[1:])
+    out.setflags(write=False)
+    return out
+
+
+@lru_cache(maxsize=256)
+def get_tariff_schedule(
+    *,
+    tariff_type: str,
+    single_rate_per_kwh: float | None = None,
+    day_rate_per_kwh: float | None = None,
+    peak_rate_per_kwh: float | None = None,
+    night_rate_per_kwh: float | None = None,
+    day_start_min: int = 6 * 60,
+    peak_start_min: int = 17 * 60,
+    night_start_min: int = 22 * 60,
+) -> TariffSchedule:
+    """Returns a shared compiled TariffSchedule for the given rates and windows.
+
+    Schedules are immutable, so identical rate sets (e.g. the same electricity_rates
+    row across requests) reuse one compiled instance.
+    """
+
+    return TariffSchedule(
+        tariff_type=tariff_type,
+        single_rate_per_kwh=single_rate_per_kwh,
+        day_rate_per_kwh=day_rate_per_kwh,
+        peak_rate_per_kwh=peak_rate_per_kwh,
+        night_rate_per_kwh=night_rate_per_kwh,
+        day_start_min=day_start_min,
+        peak_start_min=peak_start_min,
+        night_start_min=night_start_min,
+    )
+
+
+@dataclass(frozen=True)
+class TariffSnapshot:
+    """A whole rate table compiled once, indexed by (region, currency, tariff_type).
+
+    ``version`` identifies the rate data the schedules were compiled from, so
+    results computed with the snapshot can be cached under it.
+    """
+
+    schedules: Mapping[tuple[str, str, str], TariffSchedule]
+    version: str
+
+    def get(self, *, region: str, currency: str, tariff_type: str) -> TariffSchedule | None:
+        return self.schedules.get((region, currency, tariff_type))
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import numpy as np
+
+from carboncam_engine.machining import BATCH_OK, calculate_machining_carbon_batch
+
+DEFAULT_CHUNK_SIZE = 65_536
+DEFAULT_HISTOGRAM_BINS = 16_384
+
+
+class _StreamingHistogram:
+    """Mean and percentiles of a stream of values in O(bins) memory.
+
+    Values are counted into ``bins`` equal-width bins. The range starts at the
+    first chunk's [min, max] and doubles (merging bin pairs) whenever a value
+    falls outside it, so bins stay narrower than about 4 * (max - min) / bins. A
+    percentile lands within one bin of the sample values at its rank. Mean, min
+    and max are exact.
+    """
+
+    def __init__(self, bins: int = DEFAULT_HISTOGRAM_BINS) -> None:
+        if bins < 2 or bins % 2:
+            raise ValueError("bins must be an even number >= 2")
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.lo = 0.0
+        self.width = 0.0
+        self.n = 0
+        self.total = 0.0
+        self.vmin = float("inf")
+        self.vmax = float("-inf")
+
+    def _grow(self, *, down: bool) -> None:
+        bins = len(self.counts)
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        if down:
+            self.counts[bins // 2 :] = merged
+            self.lo -= self.width * bins
+        else:
+            self.counts[: bins // 2] = merged
+        self.width *= 2
+
+    def add(self, values: np.ndarray) -> None:
+        if not values.size:
+            return
+        v = np.asarray(values, dtype=np.float64)
+        lo, hi = float(v.min()), float(v.max())
+        bins = len(self.counts)
+        if self.n == 0:
+            self.lo = lo
+            self.width = (hi - lo) / bins if hi > lo else max(abs(lo), 1.0) * 1e-9
+        while lo < self.lo:
+            self._grow(down=True)
+        while hi >= self.lo + self.width * bins:
+            self._grow(down=False)
+        idx = np.minimum(((v - self.lo) / self.width).astype(np.int64), bins - 1)
+        self.counts += np.bincount(idx, minlength=bins)
+        self.n += v.size
+        self.total += float(v.sum())
+        self.vmin = min(self.vmin, lo)
+        self.vmax = max(self.vmax, hi)
+
+    def percentiles(self, q: list[float]) -> list[float]:
+        """Like np.percentile (linear), interpolating uniformly inside a bin."""
+
+        cum = np.cumsum(self.counts)
+        out: list[float] = []
+        for pct in q:
+            rank = pct / 100.0 * (self.n - 1)
+            b = int(np.searchsorted(cum, rank, side="right"))
+            before = cum[b] - self.counts[b]
+            frac = float(rank - before + 0.5) / float(self.counts[b])
+            value = self.lo + (b + frac) * self.width
+            out.append(min(max(value, self.vmin), self.vmax))
+        return out
+
+
+def _summary(values: _StreamingHistogram, scale: float = 1.0) -> dict[str, float]:
+    if values.n == 0:
+        return {"mean": float("nan"), "p5": float("nan"), "p50": float("nan"), "p95": float("nan")}
+    p5, p50, p95 = values.percentiles([5, 50, 95])
+    return {
+        "mean": values.total / values.n * scale,
+        "p5": p5 * scale,
+        "p50": p50 * scale,
+        "p95": p95 * scale,
+    }
+
+
+def simulate_machining_uncertainty(
+    *,
+    initial_weight_kg: float,
+    final_weight_kg: float,
+    process_time_minutes: float,
+    kc_value: float,
+    standby_power_kw: float,
+    carbon_intensity: float,
+    density: float,
+    initial_weight_sd: float = 0.0,
+    final_weight_sd: float = 0.0,
+    process_time_sd: float = 0.0,
+    kc_value_rel_sd: float = 0.0,
+    standby_power_rel_sd: float = 0.0,
+    rate_per_kwh: float | None = None,
+    n_draws: int = 100_000,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    histogram_bins: int = DEFAULT_HISTOGRAM_BINS,
+    seed: int | None = None,
+) -> dict[str, object]:
+    """Monte Carlo energy/carbon/cost distribution for one operation.
+
+    Inputs are sampled as independent normals (weights and time with absolute SDs,
+    kc and standby power with relative SDs) and pushed through
+    calculate_machining_carbon_batch ``chunk_size`` draws at a time. Physically
+    invalid draws (e.g. final > initial) are rejected. Only total energy is
+    tracked, in a streaming histogram of ``histogram_bins`` bins; carbon and cost
+    are linear in energy for a fixed intensity and rate, so their statistics are
+    scaled from it. Peak memory is O(histogram_bins + chunk_size temporaries)
+    whatever ``n_draws`` is; percentiles are within one histogram bin of the
+    exact sample percentiles (see _StreamingHistogram).
+
+    Returns ``draws``, ``valid_draws`` and mean/p5/p50/p95 for ``total_energy_kwh``,
+    ``total_carbon_kg`` and (if ``rate_per_kwh`` is given) ``energy_cost``.
+    """
+
+    if n_draws <= 0:
+        raise ValueError("n_draws must be > 0")
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+    sds = (
+        initial_weight_sd,
+        final_weight_sd,
+        process_time_sd,
+        kc_value_rel_sd,
+        standby_power_rel_sd,
+    )
+    if any(sd < 0 for sd in sds):
+        raise ValueError("standard deviations must be >= 0")
+
+    rng = np.random.default_rng(seed)
+    energy = _StreamingHistogram(histogram_bins)
+
+    for offset in range(0, n_draws, chunk_size):
+        size = min(chunk_size, n_draws - offset)
+        calc = calculate_machining_carbon_batch(
+            initial_weight_kg=rng.normal(initial_weight_kg, initial_weight_sd, size),
+            final_weight_kg=rng.normal(final_weight_kg, final_weight_sd, size),
+            process_time_minutes=rng.normal(process_time_minutes, process_time_sd, size),
+            kc_value=kc_value * rng.normal(1.0, kc_value_rel_sd, size),
+            standby_power_kw=standby_power_kw * rng.normal(1.0, standby_power_rel_sd, size),
+            carbon_intensity=carbon_intensity,
+            density=density,
+        )
+        energy.add(calc["total_energy_kwh"][calc["error_code"] == BATCH_OK])
+
+    result: dict[str, object] = {
+        "draws": n_draws,
+        "valid_draws": energy.n,
+        "total_energy_kwh": _summary(energy),
+        "total_carbon_kg": _summary(energy, float(carbon_intensity)),
+    }
+    if rate_per_kwh is not None:
+        result["energy_cost"] = _summary(energy, float(rate_per_kwh))
+    return result
@@ -1,18 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import hashlib
+import inspect
 import io
+import itertools
 import json
 import math
 import os
+import tempfile
+import time
 import uuid
-from datetime import datetime
+from collections import Counter
+from collections.abc import Callable, Generator, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
 from functools import wraps
-from typing import TypedDict, cast
-from urllib.error import HTTPError, URLError
-from urllib.request import Request as UrlRequest
-from urllib.request import urlopen
+from typing import IO, Literal, TypedDict, cast
 
+import numpy as np
 import pandas as pd
 import sentry_sdk
 from fastapi import Depends, FastAPI, File, Header, HTTPException, UploadFile
@@ -26,9 +34,67 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.util import get_remote_address
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 
-from carboncam_engine.machining import calculate_machining_carbon, estimate_energy_cost
+from carboncam_engine.api_key_cache import ApiKeyCache
+from carboncam_engine.api_key_usage import ApiKeyUsageBuffer
+from carboncam_engine.batch import (
+    BATCH_OUTPUT_DTYPES,
+    ROW_ERROR_NO_CREDIT,
+    TariffMap,
+    apply_credit_grant,
+    batch_row_results,
+    batch_tariff_keys,
+    create_shard_pool,
+    evaluate_batch_chunks,
+    reuse_row_results,
+    row_fingerprints,
+)
+from carboncam_engine.batch_cache import BatchResultCache, batch_cache_key, hash_upload
+from carboncam_engine.batch_history import RowResultClaims, RowResults, RowResultStore
+from carboncam_engine.batch_io import (
+    BATCH_MEDIA_TYPES,
+    BATCH_OPTIONAL_COLUMNS,
+    BATCH_REQUIRED_COLUMNS,
+    DEFAULT_CHUNK_ROWS,
+    BatchReadError,
+    BatchRowReader,
+    detect_input_format,
+    format_available,
+    iter_batch_output,
+    negotiate_output_format,
+    open_batch_reader,
+    write_batch_output,
+)
+from carboncam_engine.batch_jobs import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    BatchJob,
+    BatchJobStore,
+    LocalBatchJobStore,
+)
+from carboncam_engine.intensity import IntensityProfile
+from carboncam_engine.machining import (
+    BATCH_ERROR_MESSAGES,
+    BATCH_OK,
+    CalculationPlan,
+    calculate_machining_carbon_batch,
+    estimate_energy_cost,
+)
+from carboncam_engine.planning import find_optimal_start_times, machine_start_pareto_front
+from carboncam_engine.postgrest import (
+    PostgrestError,
+    aclose_async_postgrest_client,
+    close_postgrest_client,
+    get_async_postgrest_client,
+    get_postgrest_client,
+)
+from carboncam_engine.scheduling import FleetJob, FleetMachine, schedule_fleet_jobs
+from carboncam_engine.tariff import TariffSchedule, TariffSnapshot, get_tariff_schedule
+from carboncam_engine.uncertainty import simulate_machining_uncertainty
 
 try:
     from carboncam_engine.email_service import (
@@ -181,44 +247,68 @@ app.add_middleware(
 )
 
 
+def _credits_service_error(e: PostgrestError) -> HTTPException:
+    if e.status_code is None:
+        return HTTPException(status_code=500, detail=f"Credits service unreachable: {e}")
+    return HTTPException(status_code=500, detail=f"Credits service error: {e.body or e}")
+
+
+def _credits_rpc_or_raise(*, name: str, payload: dict[str, object]) -> object:
+    """Calls a credits RPC with the service role key and returns the decoded JSON body.
+
+    Returns None if Supabase env is missing (dev). Service errors surface as HTTP 500.
+    """
+
+    client = get_postgrest_client()
+    if client is None:
+        return None
+
+    try:
+        return client.rpc(name, payload)
+    except PostgrestError as e:
+        raise _credits_service_error(e)
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Credits service returned invalid response")
+
+
+async def _credits_rpc_or_raise_async(*, name: str, payload: dict[str, object]) -> object:
+    """_credits_rpc_or_raise on the async client, for async endpoints."""
+
+    client = get_async_postgrest_client()
+    if client is None:
+        return None
+
+    try:
+        return await client.rpc(name, payload)
+    except PostgrestError as e:
+        raise _credits_service_error(e)
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Credits service returned invalid response")
+
+
 def _consume_monthly_credit_or_raise(*, user_id: str) -> int:
     """Consumes one monthly credit for the user and returns remaining credits.
 
     Uses Supabase RPC (service role). If Supabase env is missing, behaves as unlimited (dev).
     """
 
-    supabase_url = os.getenv("SUPABASE_URL")
-    service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    if not supabase_url or not service_role_key:
-        return 999  # dev fallback
+    body = _credits_rpc_or_raise(name="consume_monthly_credit", payload={"p_user_id": user_id})
+    return _remaining_credits_or_raise(body)
 
-    endpoint = f"{supabase_url.rstrip('/')}/rest/v1/rpc/consume_monthly_credit"
-    payload = json.dumps({"p_user_id": user_id}).encode("utf-8")
-    req = UrlRequest(
-        endpoint,
-        data=payload,
-        method="POST",
-        headers={
-            "Content-Type": "application/json",
-            "apikey": service_role_key,
-            "Authorization": f"Bearer {service_role_key}",
-        },
+
+async def _consume_monthly_credit_or_raise_async(*, user_id: str) -> int:
+    body = await _credits_rpc_or_raise_async(
+        name="consume_monthly_credit", payload={"p_user_id": user_id}
     )
+    return _remaining_credits_or_raise(body)
 
-    try:
-        with urlopen(req, timeout=10) as resp:
-            body = resp.read().decode("utf-8")
-    except HTTPError as e:
-        try:
-            detail = e.read().decode("utf-8")
-        except Exception:
-            detail = str(e)
-        raise HTTPException(status_code=500, detail=f"Credits service error: {detail}")
-    except URLError as e:
-        raise HTTPException(status_code=500, detail=f"Credits service unreachable: {e}")
+
+def _remaining_credits_or_raise(body: object) -> int:
+    if body is None:
+        return 999  # dev fallback
 
     try:
-        remaining = int(json.loads(body))
+        remaining = int(cast(int, body))
     except Exception:
         raise HTTPException(status_code=500, detail="Credits service returned invalid response")
 
@@ -228,6 +318,37 @@ def _consume_monthly_credit_or_raise(*, user_id: str) -> int:
     return remaining
 
 
+class CreditGrant(TypedDict):
+    granted: int
+    credits_left: int
+
+
+def _consume_monthly_credits(*, user_id: str, count: int) -> CreditGrant:
+    """Reserves up to ``count`` monthly credits in one RPC call.
+
+    The grant may be partial (down to 0) when the balance is short; callers decide
+    what to do with the rows that did not get a credit. Dev fallback grants everything.
+    """
+
+    body = _credits_rpc_or_raise(
+        name="consume_monthly_credits", payload={"p_user_id": user_id, "p_count": count}
+    )
+    if body is None:
+        return {"granted": count, "credits_left": 999}  # dev fallback
+
+    try:
+        data = cast(dict[str, object], body)
+        granted = int(cast(int, data["granted"]))
+        credits_left = int(cast(int, data["credits_left"]))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Credits service returned invalid response")
+
+    if granted < 0 or granted > count or credits_left < 0:
+        raise HTTPException(status_code=500, detail="Credits service returned invalid response")
+
+    return {"granted": granted, "credits_left": credits_left}
+
+
 def _parse_time_to_minutes(value: str) -> int:
     """Parses Postgres time (HH:MM[:SS]) into minutes since midnight."""
 
@@ -279,131 +400,257 @@ def _maybe_time_to_minutes(value: object) -> int | None:
     return None
 
 
-def _fetch_electricity_rates_or_none(
-    *,
-    region: str,
-    currency: str,
-    tariff_type: str,
-) -> ElectricityRateRow | None:
-    """Fetches a single matching electricity_rates row from Supabase.
+_ELECTRICITY_RATES_PARAMS = {
+    "select": "region,currency,tariff_type,single_rate_per_kwh,day_rate_per_kwh,"
+    "peak_rate_per_kwh,night_rate_per_kwh,day_start,peak_start,night_start",
+    "order": "region.asc,currency.asc,tariff_type.asc",
+}
+
 
-    Returns None if Supabase env is not configured or no row is found.
+def _fetch_electricity_rate_rows_or_none() -> list[ElectricityRateRow] | None:
+    """Fetches the whole electricity_rates table from Supabase.
+
+    Returns [] if Supabase env is not configured (ENV rates only), None if the request fails.
     """
 
-    supabase_url = os.getenv("SUPABASE_URL")
-    service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    if not supabase_url or not service_role_key:
+    client = get_postgrest_client()
+    if client is None:
+        return []
+
+    try:
+        rows = client.select("electricity_rates", params=_ELECTRICITY_RATES_PARAMS)
+    except (PostgrestError, ValueError):
         return None
+    return cast(list[ElectricityRateRow], rows)
 
-    query = (
-        "electricity_rates"
-        "?select=region,currency,tariff_type,single_rate_per_kwh,day_rate_per_kwh,peak_rate_per_kwh,night_rate_per_kwh,day_start,peak_start,night_start"
-        f"&region=eq.{region}"
-        f"&currency=eq.{currency}"
-        f"&tariff_type=eq.{tariff_type}"
-        "&limit=1"
-    )
-    endpoint = f"{supabase_url.rstrip('/')}/rest/v1/{query}"
-    req = UrlRequest(
-        endpoint,
-        method="GET",
-        headers={
-            "apikey": service_role_key,
-            "Authorization": f"Bearer {service_role_key}",
-        },
-    )
+
+async def _fetch_electricity_rate_rows_or_none_async() -> list[ElectricityRateRow] | None:
+    client = get_async_postgrest_client()
+    if client is None:
+        return []
 
     try:
-        with urlopen(req, timeout=10) as resp:
-            body = resp.read().decode("utf-8")
-    except Exception:
+        rows = await client.select("electricity_rates", params=_ELECTRICITY_RATES_PARAMS)
+    except (PostgrestError, ValueError):
+        return None
+    return cast(list[ElectricityRateRow], rows)
+
+
+def _fetch_grid_intensity_rows_or_none(*, region: str) -> list[dict[str, object]] | None:
+    """Fetches the grid_carbon_intensity slots of a region from Supabase.
+
+    Returns None if Supabase env is not configured or the request fails.
+    """
+
+    client = get_postgrest_client()
+    if client is None:
         return None
 
     try:
-        rows_obj: object = json.loads(body)
-        if not isinstance(rows_obj, list) or not rows_obj:
-            return None
-        rows_list = cast(list[object], rows_obj)
-        row_obj = rows_list[0]
-        if not isinstance(row_obj, dict):
-            return None
-        return cast(ElectricityRateRow, row_obj)
-    except Exception:
+        return client.select("grid_carbon_intensity", params=_grid_intensity_params(region=region))
+    except (PostgrestError, ValueError):
         return None
 
 
+async def _fetch_grid_intensity_rows_or_none_async(
+    *, region: str
+) -> list[dict[str, object]] | None:
+    client = get_async_postgrest_client()
+    if client is None:
+        return None
+
+    try:
+        return await client.select(
+            "grid_carbon_intensity", params=_grid_intensity_params(region=region)
+        )
+    except (PostgrestError, ValueError):
+        return None
+
+
+def _grid_intensity_params(*, region: str) -> dict[str, str]:
+    return {
+        "select": "slot_start_min,carbon_intensity",
+        "region": f"eq.{region}",
+        "order": "slot_start_min.asc",
+    }
+
+
+_intensity_profiles: dict[str, tuple[float, IntensityProfile | None]] = {}
+
+
+def _get_intensity_profile_or_none(*, region: str) -> IntensityProfile | None:
+    """Returns the compiled grid intensity profile of a region, or None.
+
+    Source: GRID_INTENSITY_CSV (local file) if set, otherwise Supabase. Compiled profiles
+    (and misses) are cached for GRID_INTENSITY_CACHE_SECONDS.
+    """
+
+    cached = _fresh_intensity_profile(region=region)
+    if cached is not None:
+        return cached[1]
+
+    csv_path = os.getenv("GRID_INTENSITY_CSV")
+    rows = None if csv_path else _fetch_grid_intensity_rows_or_none(region=region)
+    return _build_intensity_profile(region=region, csv_path=csv_path, rows=rows)
+
+
+async def _get_intensity_profile_or_none_async(*, region: str) -> IntensityProfile | None:
+    cached = _fresh_intensity_profile(region=region)
+    if cached is not None:
+        return cached[1]
+
+    if os.getenv("GRID_INTENSITY_CSV"):
+        return await run_in_threadpool(_get_intensity_profile_or_none, region=region)
+    rows = await _fetch_grid_intensity_rows_or_none_async(region=region)
+    return _build_intensity_profile(region=region, csv_path=None, rows=rows)
+
+
+def _fresh_intensity_profile(*, region: str) -> tuple[float, IntensityProfile | None] | None:
+    ttl = float(os.getenv("GRID_INTENSITY_CACHE_SECONDS", "3600"))
+    cached = _intensity_profiles.get(region)
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        return cached
+    return None
+
+
+def _build_intensity_profile(
+    *, region: str, csv_path: str | None, rows: list[dict[str, object]] | None
+) -> IntensityProfile | None:
+    profile: IntensityProfile | None = None
+    try:
+        if csv_path:
+            profile = IntensityProfile.from_csv(csv_path, region=region)
+        elif rows:
+            profile = IntensityProfile.from_rows(rows, region=region)
+    except Exception as e:
+        logger.warning(f"Grid intensity profile unavailable for {region}: {e}")
+        profile = None
+
+    _intensity_profiles[region] = (time.monotonic(), profile)
+    return profile
+
+
+def _grid_intensity_region() -> str:
+    return os.getenv("GRID_INTENSITY_REGION") or os.getenv("ELECTRICITY_RATES_REGION") or "TR"
+
+
+async def _operation_intensity(
+    *, operation_start_hhmm: str | None
+) -> tuple[IntensityProfile | None, int | None]:
+    """(intensity_profile, operation_start_min) for the engine; (None, None) if unavailable."""
+
+    if not operation_start_hhmm:
+        return None, None
+    try:
+        start_min = _parse_time_to_minutes(operation_start_hhmm)
+    except Exception:
+        return None, None
+
+    profile = await _get_intensity_profile_or_none_async(region=_grid_intensity_region())
+    if profile is None:
+        return None, None
+    return profile, start_min
+
+
 class ApiKeyRow(TypedDict, total=False):
     user_id: str
     revoked_at: str | None
 
 
-def _fetch_api_key_row_or_none(*, key_hash: str) -> ApiKeyRow | None:
-    supabase_url = os.getenv("SUPABASE_URL")
-    service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    if not supabase_url or not service_role_key:
-        return None
+async def _fetch_api_key_user_id_or_none(*, key_hash: str, cache: ApiKeyCache | None) -> str | None:
+    """user_id of a valid (not revoked) key; None if the key is invalid or the lookup fails.
 
-    query = (
-        "api_keys"
-        "?select=user_id,revoked_at"
-        f"&key_hash=eq.{key_hash}"
-        "&revoked_at=is.null"
-        "&limit=1"
-    )
-    endpoint = f"{supabase_url.rstrip('/')}/rest/v1/{query}"
-    req = UrlRequest(
-        endpoint,
-        method="GET",
-        headers={
-            "apikey": service_role_key,
-            "Authorization": f"Bearer {service_role_key}",
-        },
-    )
+    Found and not-found answers are stored in ``cache``; service errors are not.
+    """
 
-    try:
-        with urlopen(req, timeout=10) as resp:
-            body = resp.read().decode("utf-8")
-    except Exception:
+    client = get_async_postgrest_client()
+    if client is None:
         return None
 
     try:
-        rows_obj: object = json.loads(body)
-        if not isinstance(rows_obj, list) or not rows_obj:
-            return None
-        rows_list = cast(list[object], rows_obj)
-        row_obj = rows_list[0]
-        if not isinstance(row_obj, dict):
-            return None
-        return cast(ApiKeyRow, row_obj)
-    except Exception:
+        rows = await client.select(
+            "api_keys",
+            params={
+                "select": "user_id,revoked_at",
+                "key_hash": f"eq.{key_hash}",
+                "revoked_at": "is.null",
+                "limit": "1",
+            },
+        )
+    except (PostgrestError, ValueError):
         return None
+    row = cast(ApiKeyRow, rows[0]) if rows else None
+    user_id = str(row["user_id"]) if row and row.get("user_id") else None
+    if cache is not None:
+        cache.put(key_hash, user_id)
+    return user_id
+
+
+_api_key_cache: ApiKeyCache | None = None
+
+
+def _get_api_key_cache() -> ApiKeyCache | None:
+    """Shared key_hash -> user_id cache; None when API_KEY_CACHE_MAX_ENTRIES is 0.
+
+    Valid keys are kept API_KEY_CACHE_SECONDS, invalid ones API_KEY_NEGATIVE_CACHE_SECONDS.
+    """
+
+    global _api_key_cache
+    max_entries = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "10000"))
+    if max_entries <= 0:
+        return None
+    if _api_key_cache is None:
+        _api_key_cache = ApiKeyCache(max_entries=max_entries, ttl=0, negative_ttl=0)
+    _api_key_cache.max_entries = max_entries
+    _api_key_cache.ttl = float(os.getenv("API_KEY_CACHE_SECONDS", "60"))
+    _api_key_cache.negative_ttl = float(os.getenv("API_KEY_NEGATIVE_CACHE_SECONDS", "5"))
+    return _api_key_cache
+
+
+def _best_effort_timeout() -> float:
+    # Kullanıcı isteğini bekleten, sonucu önemsiz yazmalar için kısa süre.
+    return float(os.getenv("SUPABASE_BEST_EFFORT_TIMEOUT_SECONDS", "3"))
+
+
+# last_used_at istek yolunda yazılmaz: son kullanım zamanı bellekte tutulur ve
+# API_KEY_USAGE_FLUSH_SECONDS'ta bir tek RPC ile toplu yazılır (kapanışta da).
+_api_key_usage = ApiKeyUsageBuffer()
+_api_key_usage_task: asyncio.Task[None] | None = None
 
 
 def _mark_api_key_used(*, key_hash: str) -> None:
-    supabase_url = os.getenv("SUPABASE_URL")
-    service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    if not supabase_url or not service_role_key:
-        return
+    _api_key_usage.record(key_hash, datetime.now(timezone.utc))
 
-    endpoint = f"{supabase_url.rstrip('/')}/rest/v1/api_keys?key_hash=eq.{key_hash}"
-    payload = json.dumps({"last_used_at": datetime.utcnow().isoformat()}).encode("utf-8")
-    req = UrlRequest(
-        endpoint,
-        data=payload,
-        method="PATCH",
-        headers={
-            "Content-Type": "application/json",
-            "apikey": service_role_key,
-            "Authorization": f"Bearer {service_role_key}",
-        },
-    )
 
-    try:
-        with urlopen(req, timeout=10) as resp:
-            resp.read()
-    except Exception:
-        # Best-effort; do not block API requests.
+async def _flush_api_key_usage() -> None:
+    """Writes buffered last_used_at times in one touch_api_keys call (best-effort).
+
+    Times that could not be written are kept for the next flush.
+    """
+
+    pending = _api_key_usage.drain()
+    if not pending:
         return
+    client = get_async_postgrest_client()
+    if client is None:
+        return
+
+    used_at = {key_hash: at.isoformat() for key_hash, at in pending.items()}
+    try:
+        await client.rpc("touch_api_keys", {"p_used_at": used_at}, timeout=_best_effort_timeout())
+    except (PostgrestError, ValueError) as e:
+        _api_key_usage.restore(pending)
+        logger.warning(f"API key usage flush failed ({len(pending)} keys): {e}")
+    except asyncio.CancelledError:
+        # Kapanışta iptal edilirse shutdown_event'teki son flush tekrar dener.
+        _api_key_usage.restore(pending)
+        raise
+
+
+async def _api_key_usage_flusher() -> None:
+    while True:
+        await asyncio.sleep(float(os.getenv("API_KEY_USAGE_FLUSH_SECONDS", "30")))
+        await _flush_api_key_usage()
 
 
 def _emails_enabled() -> bool:
@@ -421,7 +668,7 @@ def _get_client_ip(request: Request) -> str | None:
     return None
 
 
-def _insert_audit_log(
+async def _insert_audit_log(
     *,
     user_id: str,
     action: str,
@@ -431,12 +678,10 @@ def _insert_audit_log(
     actor_name: str | None = None,
     actor_email: str | None = None,
 ) -> None:
-    supabase_url = os.getenv("SUPABASE_URL")
-    service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    if not supabase_url or not service_role_key:
+    client = get_async_postgrest_client()
+    if client is None:
         return
 
-    endpoint = f"{supabase_url.rstrip('/')}/rest/v1/audit_logs"
     payload = {
         "company_id": company_id,
         "user_id": user_id,
@@ -447,21 +692,9 @@ def _insert_audit_log(
         "ip_address": ip_address,
     }
 
-    req = UrlRequest(
-        endpoint,
-        data=json.dumps(payload).encode("utf-8"),
-        method="POST",
-        headers={
-            "Content-Type": "application/json",
-            "apikey": service_role_key,
-            "Authorization": f"Bearer {service_role_key}",
-        },
-    )
-
     try:
-        with urlopen(req, timeout=10) as resp:
-            resp.read()
-    except Exception:
+        await client.request("POST", "audit_logs", json=payload, timeout=_best_effort_timeout())
+    except PostgrestError:
         return
 
 
@@ -486,7 +719,11 @@ def audit_log(*, action: str | None = None):
                         request = v
                         break
 
-            result = await fn(*args, **kwargs)
+            # FastAPI gibi: async uç beklenir, senkron uç thread'de çalıştırılır.
+            if inspect.iscoroutinefunction(fn):
+                result = await fn(*args, **kwargs)
+            else:
+                result = await run_in_threadpool(fn, *args, **kwargs)
 
             try:
                 if not request:
@@ -515,7 +752,7 @@ def audit_log(*, action: str | None = None):
                     return result
 
                 ip_address = _get_client_ip(request)
-                _insert_audit_log(
+                await _insert_audit_log(
                     user_id=str(user_id),
                     action=str(resolved_action),
                     resource_id=str(resource_id) if resource_id else None,
@@ -554,7 +791,7 @@ async def internal_audit_log(
     try:
         user_id = request.headers.get("X-Carboncam-User-Id")
         if user_id:
-            _insert_audit_log(
+            await _insert_audit_log(
                 user_id=str(user_id),
                 action=str(payload.action),
                 resource_id=str(payload.resource_id) if payload.resource_id else None,
@@ -590,7 +827,9 @@ def _email_context_from_headers(
     return ctx
 
 
-def _maybe_send_quota_alert_email(*, ctx: EmailContext | None, credits_left: int) -> None:
+def _maybe_send_quota_alert_email(
+    *, ctx: EmailContext | None, credits_left: int, previous_credits: int | None = None
+) -> None:
     if not ctx or not ctx.get("user_email"):
         return
     if not _emails_enabled() or send_quota_alert_email is None or should_send_quota_alert is None:
@@ -600,8 +839,8 @@ def _maybe_send_quota_alert_email(*, ctx: EmailContext | None, credits_left: int
     if monthly_limit <= 0:
         return
 
-    # Dedup: sadece eşik ilk kez aşıldığında gönder.
-    prev_credits = credits_left + 1
+    # Dedup: sadece eşik ilk kez aşıldığında gönder (toplu düşümde önceki bakiye verilir).
+    prev_credits = credits_left + 1 if previous_credits is None else previous_credits
     try:
         if not should_send_quota_alert(credits_left=credits_left, monthly_limit=monthly_limit):
             return
@@ -624,7 +863,9 @@ def _maybe_send_quota_alert_email(*, ctx: EmailContext | None, credits_left: int
         return
 
 
-def _maybe_send_report_ready_email(*, ctx: EmailContext | None, batch_id: str) -> None:
+def _maybe_send_report_ready_email(
+    *, ctx: EmailContext | None, batch_id: str, report_filename: str = "Results.xlsx"
+) -> None:
     if not ctx or not ctx.get("user_email"):
         return
     if not _emails_enabled() or send_report_ready_email is None:
@@ -638,7 +879,7 @@ def _maybe_send_report_ready_email(*, ctx: EmailContext | None, batch_id: str) -
             to_email=str(ctx["user_email"]),
             user_name=str(ctx.get("user_name") or ""),
             company_name=cast(str | None, ctx.get("company_name")),
-            report_filename="Results.xlsx",
+            report_filename=report_filename,
             download_url=download_url,
             batch_id=batch_id,
         )
@@ -684,7 +925,7 @@ def internal_send_welcome_email(
     return {"id": message_id}
 
 
-def require_api_key(request: Request) -> str:
+async def require_api_key(request: Request) -> str:
     """Validates incoming API key and returns associated user_id."""
 
     token = _extract_api_key_from_headers(dict(request.headers))
@@ -695,11 +936,19 @@ def require_api_key(request: Request) -> str:
         raise HTTPException(status_code=401, detail="Invalid API key format")
 
     key_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
-    row = _fetch_api_key_row_or_none(key_hash=key_hash)
-    if not row or not row.get("user_id"):
+    # Anahtar -> kullanıcı eşlemesi kısa süre bellekte tutulur; geçersiz anahtarlar da
+    # (daha kısa süre) tutulur ki aynı hatalı anahtarla gelen istekler DB'ye gitmesin.
+    # İptal edilen anahtar en geç API_KEY_CACHE_SECONDS sonra (veya
+    # /internal/api-keys/invalidate ile hemen) reddedilir.
+    cache = _get_api_key_cache()
+    entry = cache.get(key_hash) if cache is not None else None
+    if entry is not None:
+        user_id = entry.user_id
+    else:
+        user_id = await _fetch_api_key_user_id_or_none(key_hash=key_hash, cache=cache)
+    if not user_id:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
-    user_id = str(row["user_id"])
     request.state.user_id = user_id
     _mark_api_key_used(key_hash=key_hash)
     return user_id
@@ -747,6 +996,141 @@ MATERIAL_NAMES: dict[str, str] = {
 }
 
 
+_calculation_plans: dict[tuple[str, str], CalculationPlan] = {}
+_asset_frames: dict[str, pd.DataFrame] = {}
+_asset_version = ""
+
+
+def _compute_asset_version() -> str:
+    payload = json.dumps({"machines": MACHINES, "materials": MATERIALS}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def invalidate_calculation_plans() -> str:
+    """Drops compiled plans; call whenever MACHINES/MATERIALS change.
+
+    Returns the new asset version.
+    """
+
+    global _asset_version
+    _calculation_plans.clear()
+    _asset_frames.clear()
+    _asset_version = _compute_asset_version()
+    return _asset_version
+
+
+def _calculation_plan_or_none(*, machine_id: str, material_id: str) -> CalculationPlan | None:
+    """Returns the shared compiled plan for a (machine, material) pair, or None if unknown."""
+
+    key = (machine_id, material_id)
+    plan = _calculation_plans.get(key)
+    if plan is not None:
+        return plan
+
+    machine = MACHINES.get(machine_id)
+    material = MATERIALS.get(material_id)
+    if machine is None or material is None:
+        return None
+
+    plan = CalculationPlan.compile(
+        kc_value=material["kc_value"],
+        standby_power_kw=machine["standby_power_kw"],
+        carbon_intensity=machine["carbon_intensity"],
+        density=material["density"],
+    )
+    _calculation_plans[key] = plan
+    return plan
+
+
+def _batch_asset_frames() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """MACHINES / MATERIALS as id-indexed frames for the columnar batch join."""
+
+    if not _asset_frames:
+        machines = pd.DataFrame.from_dict(MACHINES, orient="index")
+        materials = pd.DataFrame.from_dict(MATERIALS, orient="index")
+        _asset_frames["machines"] = machines[["standby_power_kw", "carbon_intensity"]].astype(float)
+        _asset_frames["materials"] = materials[["kc_value", "density"]].astype(float)
+    return _asset_frames["machines"], _asset_frames["materials"]
+
+
+_batch_shard_pool: ProcessPoolExecutor | None = None
+_batch_shard_pool_version = ""
+
+
+def _batch_worker_count() -> int:
+    return int(os.getenv("BATCH_WORKERS", "0"))
+
+
+def _get_batch_shard_pool() -> ProcessPoolExecutor | None:
+    """Worker pool for large batches, or None when BATCH_WORKERS is 0/1 (in-process)."""
+
+    global _batch_shard_pool, _batch_shard_pool_version
+    workers = _batch_worker_count()
+    if workers <= 1:
+        return None
+    if _batch_shard_pool is None or _batch_shard_pool_version != _asset_version:
+        # Makine/malzeme değiştiyse işçilerdeki tablolar eskidir; havuz yenilenir.
+        # Eski havuzdaki parçalar bitirilir, yeni parça kabul etmez.
+        if _batch_shard_pool is not None:
+            _batch_shard_pool.shutdown(wait=False)
+        machines, materials = _batch_asset_frames()
+        _batch_shard_pool = create_shard_pool(
+            workers=workers, machines=machines, materials=materials
+        )
+        _batch_shard_pool_version = _asset_version
+    return _batch_shard_pool
+
+
+def _get_calculation_plan_or_404(*, machine_id: str, material_id: str) -> CalculationPlan:
+    if material_id not in MATERIALS:
+        raise HTTPException(status_code=404, detail="material_id not found")
+    if machine_id not in MACHINES:
+        raise HTTPException(status_code=404, detail="machine_id not found")
+    return cast(
+        CalculationPlan, _calculation_plan_or_none(machine_id=machine_id, material_id=material_id)
+    )
+
+
+invalidate_calculation_plans()
+
+
+def _require_internal_secret(x_internal_secret: str | None) -> None:
+    expected = os.getenv("INTERNAL_API_SECRET")
+    if not expected:
+        raise HTTPException(status_code=503, detail="Internal API secret not configured")
+    if not x_internal_secret or x_internal_secret != expected:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@app.post("/internal/assets/invalidate")
+def internal_invalidate_assets(
+    x_internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+) -> dict[str, object]:
+    """Asset (makine/malzeme) verisi değiştiğinde derlenmiş hesap planlarını temizler."""
+
+    _require_internal_secret(x_internal_secret)
+    return {"ok": True, "asset_version": invalidate_calculation_plans()}
+
+
+class ApiKeyInvalidateRequest(BaseModel):
+    key_hash: str | None = Field(
+        default=None, description="sha256(api_key); boş bırakılırsa tüm önbellek temizlenir"
+    )
+
+
+@app.post("/internal/api-keys/invalidate")
+def internal_invalidate_api_keys(
+    payload: ApiKeyInvalidateRequest,
+    x_internal_secret: str | None = Header(default=None, alias="X-Internal-Secret"),
+) -> dict[str, object]:
+    """API key iptal edildiğinde önbellekteki doğrulama sonucunu siler (bu süreçte)."""
+
+    _require_internal_secret(x_internal_secret)
+    cache = _get_api_key_cache()
+    evicted = cache.invalidate(payload.key_hash) if cache is not None else 0
+    return {"ok": True, "evicted": evicted}
+
+
 class OptimizationTip(TypedDict, total=False):
     code: str
     idle_pct: int
@@ -790,6 +1174,24 @@ def _build_optimization_tips(
     return tips
 
 
+class UncertaintyOptions(BaseModel):
+    initial_weight_sd: float = Field(
+        default=0.0, ge=0, description="İlk ağırlık ölçüm std. sapması (kg)"
+    )
+    final_weight_sd: float = Field(
+        default=0.0, ge=0, description="Son ağırlık ölçüm std. sapması (kg)"
+    )
+    time_sd_min: float = Field(default=0.0, ge=0, description="İşleme süresi std. sapması (dakika)")
+    kc_rel_sd: float = Field(
+        default=0.0, ge=0, le=1, description="kc göreli std. sapması (örn. 0.05)"
+    )
+    standby_rel_sd: float = Field(
+        default=0.0, ge=0, le=1, description="Boşta güç göreli std. sapması"
+    )
+    draws: int = Field(default=100_000, ge=1_000, le=1_000_000, description="Örnek sayısı")
+    seed: int | None = Field(default=None, description="Tekrarlanabilir sonuç için RNG seed")
+
+
 class CalculateRequest(BaseModel):
     model_config = ConfigDict(
         json_schema_extra={
@@ -828,64 +1230,329 @@ class CalculateRequest(BaseModel):
         description="İşlem bitiş saati (HH:MM). Örn: 15:30 (opsiyonel)",
     )
     currency: str = Field(default="TRY", description="Enerji maliyeti para birimi (TRY/USD gibi)")
+    uncertainty: UncertaintyOptions | None = Field(
+        default=None,
+        description="Verilirse ölçüm belirsizliği Monte Carlo ile örneklenir (mean, P5/P50/P95)",
+    )
 
 
-CALCULATE_REQUEST_EXAMPLE: dict[str, object] = {
-    "machine_id": "cnc_1",
-    "material_id": "mat_6061",
-    "initial_weight": 10.0,
-    "final_weight": 9.2,
-    "time_min": 30,
-    "tariff_type": "Single",
-    "currency": "TRY",
-    "operation_start_hhmm": "14:30",
-    "operation_end_hhmm": "15:30",
-}
-
-CALCULATE_RESPONSE_EXAMPLE: dict[str, object] = {
-    "machine_id": "cnc_1",
-    "material_id": "mat_6061",
-    "credits_left": 2,
-    "efficiency_score": 68,
-    "optimization_tips": [
-        {"code": "idle_high", "idle_pct": 35},
-        {"code": "material_aluminum_feed_rate", "increase_pct": 15},
-    ],
-    "energy_cost": 18.75,
-    "energy_currency": "TRY",
-    "applied_rate_per_kwh": 1.25,
-    "total_energy_kwh": 15.0,
-    "processing_energy_kwh": 10.2,
-    "idle_energy_kwh": 4.8,
-    "total_carbon_kg": 6.6,
-}
+def _resolve_tariff_schedule(*, tariff_type: str, currency: str) -> TariffSchedule:
+    """Returns the compiled tariff schedule for the configured region.
 
+    Rates come from the `electricity_rates` snapshot with ENV fallbacks.
+    """
 
-class MachineInfo(BaseModel):
-    model_config = ConfigDict(
-        json_schema_extra={
-            "examples": [
-                {
-                    "id": "cnc_1",
-                    "model": "Mazak",
-                    "standby_power_kw": 2.5,
-                    "max_power_kw": 12.0,
-                    "carbon_intensity": 0.44,
-                }
-            ]
-        }
+    return _snapshot_tariff_schedule(
+        _get_rate_snapshot(), tariff_type=tariff_type, currency=currency
     )
 
-    id: str = Field(..., description="Makine ID")
-    model: str = Field(..., description="Model adı")
-    standby_power_kw: float = Field(..., description="Boşta güç tüketimi (kW)")
-    max_power_kw: float = Field(..., description="Maksimum güç tüketimi (kW)")
-    carbon_intensity: float = Field(..., description="Elektrik şebekesi karbon yoğunluğu (kgCO2/kWh)")
 
+def _snapshot_tariff_schedule(
+    rates: TariffSnapshot | None, *, tariff_type: str, currency: str
+) -> TariffSchedule:
+    """Schedule of the configured region's row in ``rates``, else one from ENV rates.
 
-@app.get(
-    "/machines",
-    summary="List available machines",
+    Raises ValueError if the ENV fallback cannot build ``tariff_type``.
+    """
+
+    region = os.getenv("ELECTRICITY_RATES_REGION", "TR")
+    schedule = (
+        rates.get(region=region, currency=currency, tariff_type=tariff_type)
+        if rates is not None
+        else None
+    )
+    if schedule is not None:
+        return schedule
+    return _tariff_schedule_from_row(tariff_type=tariff_type, db_row=None)
+
+
+# electricity_rates birkaç düzine satırdır ve ayda bir değişir: tablo tümüyle bellekte,
+# tarifeleri derlenmiş olarak tutulur ve ELECTRICITY_RATES_REFRESH_SECONDS'ta bir
+# arka planda yenilenir. İstek yolunda sadece sözlük araması yapılır.
+_rate_snapshot: TariffSnapshot | None = None
+_rate_snapshot_failed_at: float | None = None
+_rate_snapshot_task: asyncio.Task[None] | None = None
+_RATE_SNAPSHOT_RETRY_SECONDS = 30.0
+
+
+def _build_rate_snapshot(rows: list[ElectricityRateRow]) -> TariffSnapshot:
+    schedules: dict[tuple[str, str, str], TariffSchedule] = {}
+    for row in rows:
+        key = (str(row.get("region")), str(row.get("currency")), str(row.get("tariff_type")))
+        if key in schedules:
+            continue
+        try:
+            schedules[key] = _tariff_schedule_from_row(tariff_type=key[2], db_row=row)
+        except ValueError as e:
+            logger.warning(f"electricity_rates row {key} skipped: {e}")
+    digest = hashlib.sha256(json.dumps(rows, sort_keys=True, default=str).encode("utf-8"))
+    return TariffSnapshot(schedules=schedules, version=digest.hexdigest()[:16])
+
+
+def _store_rate_snapshot(rows: list[ElectricityRateRow] | None) -> TariffSnapshot | None:
+    """Swaps in a snapshot of ``rows``; None (failed fetch) keeps the current one."""
+
+    global _rate_snapshot, _rate_snapshot_failed_at
+    if rows is None:
+        _rate_snapshot_failed_at = time.monotonic()
+        logger.warning("electricity_rates could not be loaded; keeping previous rates")
+        return _rate_snapshot
+    _rate_snapshot = _build_rate_snapshot(rows)
+    _rate_snapshot_failed_at = None
+    return _rate_snapshot
+
+
+def _rate_snapshot_load_due() -> bool:
+    # Henüz yüklenemediyse (açılışta Supabase yoksa) istek yolunda en fazla
+    # _RATE_SNAPSHOT_RETRY_SECONDS'ta bir denenir.
+    return _rate_snapshot is None and (
+        _rate_snapshot_failed_at is None
+        or time.monotonic() - _rate_snapshot_failed_at >= _RATE_SNAPSHOT_RETRY_SECONDS
+    )
+
+
+def _get_rate_snapshot() -> TariffSnapshot | None:
+    """Current electricity_rates snapshot, loaded on first use if startup did not."""
+
+    if _rate_snapshot_load_due():
+        return _store_rate_snapshot(_fetch_electricity_rate_rows_or_none())
+    return _rate_snapshot
+
+
+async def _get_rate_snapshot_async() -> TariffSnapshot | None:
+    if _rate_snapshot_load_due():
+        return _store_rate_snapshot(await _fetch_electricity_rate_rows_or_none_async())
+    return _rate_snapshot
+
+
+async def _rate_snapshot_refresher() -> None:
+    while True:
+        await asyncio.sleep(float(os.getenv("ELECTRICITY_RATES_REFRESH_SECONDS", "3600")))
+        _store_rate_snapshot(await _fetch_electricity_rate_rows_or_none_async())
+
+
+_ELECTRICITY_RATE_ENV = (
+    "ELECTRICITY_RATES_REGION",
+    "ELECTRICITY_RATE_SINGLE_PER_KWH",
+    "ELECTRICITY_RATE_DAY_PER_KWH",
+    "ELECTRICITY_RATE_PEAK_PER_KWH",
+    "ELECTRICITY_RATE_NIGHT_PER_KWH",
+)
+
+
+def _rate_snapshot_version(rates: TariffSnapshot | None) -> str:
+    # ENV yedek fiyatları ve bölge de sonucu etkiler.
+    env = ":".join(os.getenv(name, "") for name in _ELECTRICITY_RATE_ENV)
+    return f"{env}:{rates.version if rates is not None else 'none'}"
+
+
+def _tariff_schedule_from_row(
+    *, tariff_type: str, db_row: ElectricityRateRow | None
+) -> TariffSchedule:
+    """Compiles an electricity_rates row (None: ENV rates only) into a tariff schedule."""
+
+    # Fallback (ENV)
+    single_rate = float(os.getenv("ELECTRICITY_RATE_SINGLE_PER_KWH", "1"))
+    day_rate = float(os.getenv("ELECTRICITY_RATE_DAY_PER_KWH", "1"))
+    peak_rate = float(os.getenv("ELECTRICITY_RATE_PEAK_PER_KWH", "2"))
+    night_rate = float(os.getenv("ELECTRICITY_RATE_NIGHT_PER_KWH", "0.8"))
+
+    day_start_min = 6 * 60
+    peak_start_min = 17 * 60
+    night_start_min = 22 * 60
+
+    if db_row:
+        # Supabase time kolonları genelde 'HH:MM:SS' formatında döner.
+        try:
+            parsed = _maybe_parse_float(db_row.get("single_rate_per_kwh"))
+            if parsed is not None:
+                single_rate = parsed
+
+            parsed = _maybe_parse_float(db_row.get("day_rate_per_kwh"))
+            if parsed is not None:
+                day_rate = parsed
+
+            parsed = _maybe_parse_float(db_row.get("peak_rate_per_kwh"))
+            if parsed is not None:
+                peak_rate = parsed
+
+            parsed = _maybe_parse_float(db_row.get("night_rate_per_kwh"))
+            if parsed is not None:
+                night_rate = parsed
+
+            parsed_min = _maybe_time_to_minutes(db_row.get("day_start"))
+            if parsed_min is not None:
+                day_start_min = parsed_min
+
+            parsed_min = _maybe_time_to_minutes(db_row.get("peak_start"))
+            if parsed_min is not None:
+                peak_start_min = parsed_min
+
+            parsed_min = _maybe_time_to_minutes(db_row.get("night_start"))
+            if parsed_min is not None:
+                night_start_min = parsed_min
+        except Exception:
+            pass
+
+    return get_tariff_schedule(
+        tariff_type=tariff_type,
+        single_rate_per_kwh=single_rate,
+        day_rate_per_kwh=day_rate,
+        peak_rate_per_kwh=peak_rate,
+        night_rate_per_kwh=night_rate,
+        day_start_min=day_start_min,
+        peak_start_min=peak_start_min,
+        night_start_min=night_start_min,
+    )
+
+
+async def _calculation_io(
+    *, req: CalculateRequest, user_id: str
+) -> tuple[int, TariffSnapshot | None, tuple[IntensityProfile | None, int | None]]:
+    """Credits, electricity rates and operation intensity of a calculation, fetched concurrently.
+
+    Rates are a snapshot lookup; Supabase is only asked if the snapshot is not loaded yet.
+    """
+
+    return await asyncio.gather(
+        _consume_monthly_credit_or_raise_async(user_id=user_id),
+        _get_rate_snapshot_async(),
+        _operation_intensity(operation_start_hhmm=req.operation_start_hhmm),
+    )
+
+
+def _energy_cost_payload(
+    *, req: CalculateRequest, total_energy_kwh: float, rates: TariffSnapshot | None
+) -> dict[str, object]:
+    if not req.operation_start_hhmm:
+        return {}
+
+    try:
+        schedule = _snapshot_tariff_schedule(
+            rates, tariff_type=req.tariff_type, currency=req.currency
+        )
+        cost = estimate_energy_cost(
+            total_energy_kwh=total_energy_kwh,
+            tariff_type=req.tariff_type,
+            operation_start_hhmm=req.operation_start_hhmm,
+            operation_end_hhmm=req.operation_end_hhmm,
+            process_time_minutes=req.time_min,
+            currency=req.currency,
+            schedule=schedule,
+        )
+    except ValueError as e:
+        # Saat formatı vb. hatalarda cost'u pas geçiyoruz.
+        return {"energy_cost_error": str(e)}
+
+    return {
+        "energy_cost": cost["energy_cost"],
+        "energy_currency": cost["energy_currency"],
+        "applied_rate_per_kwh": cost["applied_rate_per_kwh"],
+    }
+
+
+def _uncertainty_payload(
+    *,
+    req: CalculateRequest,
+    plan: CalculationPlan,
+    result: dict[str, float],
+    energy_cost_payload: dict[str, object],
+) -> dict[str, object]:
+    if req.uncertainty is None:
+        return {}
+
+    opts = req.uncertainty
+    total_energy_kwh = float(result["total_energy_kwh"])
+    # Profil kullanıldıysa efektif yoğunluk sonuçtan türetilir.
+    carbon_intensity = (
+        float(result["total_carbon_kg"]) / total_energy_kwh
+        if total_energy_kwh > 0
+        else plan.carbon_intensity
+    )
+    rate = energy_cost_payload.get("applied_rate_per_kwh")
+    max_draws = int(os.getenv("UNCERTAINTY_MAX_DRAWS", "1000000"))
+
+    try:
+        summary = simulate_machining_uncertainty(
+            initial_weight_kg=req.initial_weight,
+            final_weight_kg=req.final_weight,
+            process_time_minutes=req.time_min,
+            kc_value=plan.kc_value,
+            standby_power_kw=plan.standby_power_kw,
+            carbon_intensity=carbon_intensity,
+            density=plan.density,
+            initial_weight_sd=opts.initial_weight_sd,
+            final_weight_sd=opts.final_weight_sd,
+            process_time_sd=opts.time_sd_min,
+            kc_value_rel_sd=opts.kc_rel_sd,
+            standby_power_rel_sd=opts.standby_rel_sd,
+            rate_per_kwh=float(cast(float, rate)) if rate is not None else None,
+            n_draws=min(opts.draws, max_draws),
+            chunk_size=int(os.getenv("UNCERTAINTY_CHUNK_SIZE", "65536")),
+            seed=opts.seed,
+        )
+    except ValueError as e:
+        return {"uncertainty_error": str(e)}
+
+    return {"uncertainty": summary}
+
+
+CALCULATE_REQUEST_EXAMPLE: dict[str, object] = {
+    "machine_id": "cnc_1",
+    "material_id": "mat_6061",
+    "initial_weight": 10.0,
+    "final_weight": 9.2,
+    "time_min": 30,
+    "tariff_type": "Single",
+    "currency": "TRY",
+    "operation_start_hhmm": "14:30",
+    "operation_end_hhmm": "15:30",
+}
+
+CALCULATE_RESPONSE_EXAMPLE: dict[str, object] = {
+    "machine_id": "cnc_1",
+    "material_id": "mat_6061",
+    "credits_left": 2,
+    "efficiency_score": 68,
+    "optimization_tips": [
+        {"code": "idle_high", "idle_pct": 35},
+        {"code": "material_aluminum_feed_rate", "increase_pct": 15},
+    ],
+    "energy_cost": 18.75,
+    "energy_currency": "TRY",
+    "applied_rate_per_kwh": 1.25,
+    "total_energy_kwh": 15.0,
+    "processing_energy_kwh": 10.2,
+    "idle_energy_kwh": 4.8,
+    "total_carbon_kg": 6.6,
+}
+
+
+class MachineInfo(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "examples": [
+                {
+                    "id": "cnc_1",
+                    "model": "Mazak",
+                    "standby_power_kw": 2.5,
+                    "max_power_kw": 12.0,
+                    "carbon_intensity": 0.44,
+                }
+            ]
+        }
+    )
+
+    id: str = Field(..., description="Makine ID")
+    model: str = Field(..., description="Model adı")
+    standby_power_kw: float = Field(..., description="Boşta güç tüketimi (kW)")
+    max_power_kw: float = Field(..., description="Maksimum güç tüketimi (kW)")
+    carbon_intensity: float = Field(..., description="Elektrik şebekesi karbon yoğunluğu (kgCO2/kWh)")
+
+
+@app.get(
+    "/machines",
+    summary="List available machines",
     description=(
         "Sistemde desteklenen varsayılan makine tanımlarını listeler. "
         "Bu endpoint public'tir ve entegrasyon geliştirenlerin doğru machine_id seçebilmesi için tasarlanmıştır."
@@ -1105,7 +1772,7 @@ def generate_carboncam_pdf_report(
         }
     },
 )
-def calculate(
+async def calculate(
     req: CalculateRequest,
     x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
     x_carboncam_user_email: str | None = Header(default=None, alias="X-Carboncam-User-Email"),
@@ -1115,30 +1782,24 @@ def calculate(
     if not x_carboncam_user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    credits_left = _consume_monthly_credit_or_raise(user_id=x_carboncam_user_id)
+    credits_left, rates, (intensity_profile, start_min) = await _calculation_io(
+        req=req, user_id=x_carboncam_user_id
+    )
     ctx = _email_context_from_headers(
         user_email=x_carboncam_user_email,
         user_name=x_carboncam_user_name,
         company_name=x_carboncam_company_name,
     )
-    _maybe_send_quota_alert_email(ctx=ctx, credits_left=credits_left)
-
-    material = MATERIALS.get(req.material_id)
-    if material is None:
-        raise HTTPException(status_code=404, detail="material_id not found")
-
-    machine = MACHINES.get(req.machine_id)
-    if machine is None:
-        raise HTTPException(status_code=404, detail="machine_id not found")
+    if ctx:
+        await run_in_threadpool(_maybe_send_quota_alert_email, ctx=ctx, credits_left=credits_left)
 
-    result = calculate_machining_carbon(
+    plan = _get_calculation_plan_or_404(machine_id=req.machine_id, material_id=req.material_id)
+    result = plan.evaluate(
         initial_weight_kg=req.initial_weight,
         final_weight_kg=req.final_weight,
         process_time_minutes=req.time_min,
-        kc_value=material["kc_value"],
-        standby_power_kw=machine["standby_power_kw"],
-        carbon_intensity=machine["carbon_intensity"],
-        density=material["density"],
+        intensity_profile=intensity_profile,
+        operation_start_min=start_min,
     )
 
     total_energy_kwh = float(result.get("total_energy_kwh", 0.0))
@@ -1158,82 +1819,23 @@ def calculate(
         idle_energy_kwh=idle_energy_kwh,
     )
 
-    energy_cost_payload: dict[str, object] = {}
-    if req.operation_start_hhmm:
-        region = os.getenv("ELECTRICITY_RATES_REGION", "TR")
-        db_row = _fetch_electricity_rates_or_none(
-            region=region,
-            currency=req.currency,
-            tariff_type=req.tariff_type,
+    energy_cost_payload = _energy_cost_payload(
+        req=req,
+        total_energy_kwh=float(result["total_energy_kwh"]),
+        rates=rates,
+    )
+    # Monte Carlo örneklemesi CPU'da sürer; event loop'u bloklamaması için thread'de.
+    uncertainty_payload = (
+        await run_in_threadpool(
+            _uncertainty_payload,
+            req=req,
+            plan=plan,
+            result=result,
+            energy_cost_payload=energy_cost_payload,
         )
-
-        # Fallback (ENV)
-        single_rate = float(os.getenv("ELECTRICITY_RATE_SINGLE_PER_KWH", "1"))
-        day_rate = float(os.getenv("ELECTRICITY_RATE_DAY_PER_KWH", "1"))
-        peak_rate = float(os.getenv("ELECTRICITY_RATE_PEAK_PER_KWH", "2"))
-        night_rate = float(os.getenv("ELECTRICITY_RATE_NIGHT_PER_KWH", "0.8"))
-
-        day_start_min = 6 * 60
-        peak_start_min = 17 * 60
-        night_start_min = 22 * 60
-
-        if db_row:
-            # Supabase time kolonları genelde 'HH:MM:SS' formatında döner.
-            try:
-                parsed = _maybe_parse_float(db_row.get("single_rate_per_kwh"))
-                if parsed is not None:
-                    single_rate = parsed
-
-                parsed = _maybe_parse_float(db_row.get("day_rate_per_kwh"))
-                if parsed is not None:
-                    day_rate = parsed
-
-                parsed = _maybe_parse_float(db_row.get("peak_rate_per_kwh"))
-                if parsed is not None:
-                    peak_rate = parsed
-
-                parsed = _maybe_parse_float(db_row.get("night_rate_per_kwh"))
-                if parsed is not None:
-                    night_rate = parsed
-
-                parsed_min = _maybe_time_to_minutes(db_row.get("day_start"))
-                if parsed_min is not None:
-                    day_start_min = parsed_min
-
-                parsed_min = _maybe_time_to_minutes(db_row.get("peak_start"))
-                if parsed_min is not None:
-                    peak_start_min = parsed_min
-
-                parsed_min = _maybe_time_to_minutes(db_row.get("night_start"))
-                if parsed_min is not None:
-                    night_start_min = parsed_min
-            except Exception:
-                pass
-
-        try:
-            cost = estimate_energy_cost(
-                total_energy_kwh=float(result["total_energy_kwh"]),
-                tariff_type=req.tariff_type,
-                operation_start_hhmm=req.operation_start_hhmm,
-                operation_end_hhmm=req.operation_end_hhmm,
-                process_time_minutes=req.time_min,
-                currency=req.currency,
-                single_rate_per_kwh=single_rate,
-                day_rate_per_kwh=day_rate,
-                peak_rate_per_kwh=peak_rate,
-                night_rate_per_kwh=night_rate,
-                day_start_min=day_start_min,
-                peak_start_min=peak_start_min,
-                night_start_min=night_start_min,
-            )
-            energy_cost_payload = {
-                "energy_cost": cost["energy_cost"],
-                "energy_currency": cost["energy_currency"],
-                "applied_rate_per_kwh": cost["applied_rate_per_kwh"],
-            }
-        except ValueError as e:
-            # Saat formatı vb. hatalarda cost'u pas geçiyoruz.
-            energy_cost_payload = {"energy_cost_error": str(e)}
+        if req.uncertainty is not None
+        else {}
+    )
 
     return {
         "machine_id": req.machine_id,
@@ -1243,6 +1845,7 @@ def calculate(
         "optimization_tips": optimization_tips,
         **energy_cost_payload,
         **result,
+        **uncertainty_payload,
     }
 
 
@@ -1265,31 +1868,24 @@ def calculate(
     },
 )
 @limiter.limit("60/minute")
-def api_calculate(
+async def api_calculate(
     request: Request,
     req: CalculateRequest,
     user_id: str = Depends(require_api_key),
 ) -> dict[str, object]:
     # Credits are enforced same as UI unless you choose otherwise.
-    credits_left = _consume_monthly_credit_or_raise(user_id=user_id)
+    credits_left, rates, (intensity_profile, start_min) = await _calculation_io(
+        req=req, user_id=user_id
+    )
     # API key kullanan entegrasyonlarda email context yok; quota email default kapalı.
 
-    material = MATERIALS.get(req.material_id)
-    if material is None:
-        raise HTTPException(status_code=404, detail="material_id not found")
-
-    machine = MACHINES.get(req.machine_id)
-    if machine is None:
-        raise HTTPException(status_code=404, detail="machine_id not found")
-
-    result = calculate_machining_carbon(
+    plan = _get_calculation_plan_or_404(machine_id=req.machine_id, material_id=req.material_id)
+    result = plan.evaluate(
         initial_weight_kg=req.initial_weight,
         final_weight_kg=req.final_weight,
         process_time_minutes=req.time_min,
-        kc_value=material["kc_value"],
-        standby_power_kw=machine["standby_power_kw"],
-        carbon_intensity=machine["carbon_intensity"],
-        density=material["density"],
+        intensity_profile=intensity_profile,
+        operation_start_min=start_min,
     )
 
     total_energy_kwh = float(result.get("total_energy_kwh", 0.0))
@@ -1309,345 +1905,1192 @@ def api_calculate(
         idle_energy_kwh=idle_energy_kwh,
     )
 
-    energy_cost_payload: dict[str, object] = {}
-    if req.operation_start_hhmm:
-        region = os.getenv("ELECTRICITY_RATES_REGION", "TR")
-        db_row = _fetch_electricity_rates_or_none(
-            region=region,
-            currency=req.currency,
-            tariff_type=req.tariff_type,
+    energy_cost_payload = _energy_cost_payload(
+        req=req,
+        total_energy_kwh=float(result["total_energy_kwh"]),
+        rates=rates,
+    )
+    # Monte Carlo örneklemesi CPU'da sürer; event loop'u bloklamaması için thread'de.
+    uncertainty_payload = (
+        await run_in_threadpool(
+            _uncertainty_payload,
+            req=req,
+            plan=plan,
+            result=result,
+            energy_cost_payload=energy_cost_payload,
         )
+        if req.uncertainty is not None
+        else {}
+    )
 
-        single_rate = float(os.getenv("ELECTRICITY_RATE_SINGLE_PER_KWH", "1"))
-        day_rate = float(os.getenv("ELECTRICITY_RATE_DAY_PER_KWH", "1"))
-        peak_rate = float(os.getenv("ELECTRICITY_RATE_PEAK_PER_KWH", "2"))
-        night_rate = float(os.getenv("ELECTRICITY_RATE_NIGHT_PER_KWH", "0.8"))
-
-        day_start_min = 6 * 60
-        peak_start_min = 17 * 60
-        night_start_min = 22 * 60
-
-        if db_row:
-            try:
-                parsed = _maybe_parse_float(db_row.get("single_rate_per_kwh"))
-                if parsed is not None:
-                    single_rate = parsed
+    return {
+        "machine_id": req.machine_id,
+        "material_id": req.material_id,
+        "credits_left": credits_left,
+        "efficiency_score": efficiency_score,
+        "optimization_tips": optimization_tips,
+        **energy_cost_payload,
+        **result,
+        **uncertainty_payload,
+    }
 
-                parsed = _maybe_parse_float(db_row.get("day_rate_per_kwh"))
-                if parsed is not None:
-                    day_rate = parsed
 
-                parsed = _maybe_parse_float(db_row.get("peak_rate_per_kwh"))
-                if parsed is not None:
-                    peak_rate = parsed
+class StartTimeSearchRequest(BaseModel):
+    machine_id: str = Field(..., description="Makine kaydı ID")
+    material_id: str = Field(..., description="Malzeme kaydı ID")
+    initial_weight: float = Field(..., ge=0, description="İşleme öncesi ağırlık (kg)")
+    final_weight: float = Field(..., ge=0, description="İşleme sonrası ağırlık (kg)")
+    time_min: float = Field(..., gt=0, description="İşleme süresi (dakika)")
+    tariff_type: str = Field(
+        default="Multi", description="Elektrik tarifesi: 'Single' veya 'Multi'"
+    )
+    currency: str = Field(default="TRY", description="Enerji maliyeti para birimi")
+    horizon: Literal["day", "week"] = Field(
+        default="day",
+        description=(
+            "Taranacak başlangıç aralığı: bir gün (1440 dk) veya bir hafta (Pazartesi 00:00'dan)"
+        ),
+    )
+    step_min: int = Field(
+        default=1, ge=1, le=240, description="Aday başlangıçlar arası adım (dakika)"
+    )
+    include_curve: bool = Field(default=True, description="Tüm maliyet/karbon eğrisini döndür")
 
-                parsed = _maybe_parse_float(db_row.get("night_rate_per_kwh"))
-                if parsed is not None:
-                    night_rate = parsed
 
-                parsed_min = _maybe_time_to_minutes(db_row.get("day_start"))
-                if parsed_min is not None:
-                    day_start_min = parsed_min
+def _minute_label(minute: int) -> dict[str, object]:
+    return {
+        "start_min": minute,
+        "day_offset": minute // (24 * 60),
+        "start_hhmm": f"{(minute % (24 * 60)) // 60:02d}:{minute % 60:02d}",
+    }
 
-                parsed_min = _maybe_time_to_minutes(db_row.get("peak_start"))
-                if parsed_min is not None:
-                    peak_start_min = parsed_min
 
-                parsed_min = _maybe_time_to_minutes(db_row.get("night_start"))
-                if parsed_min is not None:
-                    night_start_min = parsed_min
-            except Exception:
-                pass
+def _search_start_times(*, req: StartTimeSearchRequest, user_id: str) -> dict[str, object]:
+    # Tarama kredi düşülmeden önce yapılır: hatalı girdi 400 döner ve kredi harcamaz.
+    plan = _get_calculation_plan_or_404(machine_id=req.machine_id, material_id=req.material_id)
+    try:
+        result = plan.evaluate(
+            initial_weight_kg=req.initial_weight,
+            final_weight_kg=req.final_weight,
+            process_time_minutes=req.time_min,
+        )
+        schedule = _resolve_tariff_schedule(tariff_type=req.tariff_type, currency=req.currency)
+        search = find_optimal_start_times(
+            total_energy_kwh=float(result["total_energy_kwh"]),
+            duration_min=req.time_min,
+            schedule=schedule,
+            carbon_intensity=plan.carbon_intensity,
+            intensity_profile=_get_intensity_profile_or_none(region=_grid_intensity_region()),
+            horizon_min=24 * 60 if req.horizon == "day" else 7 * 24 * 60,
+            step_min=req.step_min,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        try:
-            cost = estimate_energy_cost(
-                total_energy_kwh=float(result["total_energy_kwh"]),
-                tariff_type=req.tariff_type,
-                operation_start_hhmm=req.operation_start_hhmm,
-                operation_end_hhmm=req.operation_end_hhmm,
-                process_time_minutes=req.time_min,
-                currency=req.currency,
-                single_rate_per_kwh=single_rate,
-                day_rate_per_kwh=day_rate,
-                peak_rate_per_kwh=peak_rate,
-                night_rate_per_kwh=night_rate,
-                day_start_min=day_start_min,
-                peak_start_min=peak_start_min,
-                night_start_min=night_start_min,
-            )
-            energy_cost_payload = {
-                "energy_cost": cost["energy_cost"],
-                "energy_currency": cost["energy_currency"],
-                "applied_rate_per_kwh": cost["applied_rate_per_kwh"],
-            }
-        except ValueError as e:
-            energy_cost_payload = {"energy_cost_error": str(e)}
+    credits_left = _consume_monthly_credit_or_raise(user_id=user_id)
+    start_min = cast(np.ndarray, search["start_min"])
+    energy_cost = cast(np.ndarray, search["energy_cost"])
+    carbon = cast(np.ndarray, search["total_carbon_kg"])
+
+    def _point(minute: int) -> dict[str, object]:
+        i = int(np.searchsorted(start_min, minute))
+        return {
+            **_minute_label(minute),
+            "energy_cost": float(energy_cost[i]),
+            "total_carbon_kg": float(carbon[i]),
+        }
 
-    return {
+    payload: dict[str, object] = {
         "machine_id": req.machine_id,
         "material_id": req.material_id,
         "credits_left": credits_left,
-        "efficiency_score": efficiency_score,
-        "optimization_tips": optimization_tips,
-        **energy_cost_payload,
-        **result,
+        "energy_currency": req.currency,
+        "total_energy_kwh": float(result["total_energy_kwh"]),
+        "cheapest": _point(cast(int, search["cheapest_start_min"])),
+        "lowest_carbon": _point(cast(int, search["lowest_carbon_start_min"])),
     }
+    if req.include_curve:
+        payload["curve"] = {
+            "start_min": start_min.tolist(),
+            "energy_cost": energy_cost.tolist(),
+            "total_carbon_kg": carbon.tolist(),
+        }
+    return payload
 
 
-@app.get("/batch/template")
-def download_batch_template(
+@app.post(
+    "/optimize/start-time",
+    summary="Find cheapest / lowest-carbon start time",
+    description=(
+        "Bir iş için gün (veya hafta) boyunca her olası başlangıç dakikasını tarar; "
+        "en ucuz ve en düşük karbonlu başlangıç saatlerini ve tüm eğriyi döndürür.\n\n"
+        "Kimlik: `X-Carboncam-User-Id` header'ı. Tüm tarama tek kredi tüketir."
+    ),
+)
+def optimize_start_time(
+    req: StartTimeSearchRequest,
     x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
-):
+) -> dict[str, object]:
     if not x_carboncam_user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    df = pd.DataFrame(columns=["Weight_In", "Weight_Out", "Time", "Machine_ID", "Material_ID"])
-    buf = io.BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
-
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=Template.xlsx"},
-    )
+    return _search_start_times(req=req, user_id=x_carboncam_user_id)
 
 
-@app.get("/v1/batch/template")
+@app.post(
+    "/v1/optimize/start-time",
+    summary="Find cheapest / lowest-carbon start time (API key)",
+    description=(
+        "Developer API endpoint'i. `/optimize/start-time` ile aynı tarama; API key ile çağırılır, "
+        "rate limit uygulanır ve tek kredi tüketir."
+    ),
+)
 @limiter.limit("60/minute")
-def api_download_batch_template(
+def api_optimize_start_time(
     request: Request,
+    req: StartTimeSearchRequest,
     user_id: str = Depends(require_api_key),
-):
-    df = pd.DataFrame(columns=["Weight_In", "Weight_Out", "Time", "Machine_ID", "Material_ID"])
-    buf = io.BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=Template.xlsx"},
-    )
+) -> dict[str, object]:
+    return _search_start_times(req=req, user_id=user_id)
 
 
-@app.post("/batch/process")
-def process_batch(
-    file: UploadFile = File(...),
-    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
-    x_carboncam_user_email: str | None = Header(default=None, alias="X-Carboncam-User-Email"),
-    x_carboncam_user_name: str | None = Header(default=None, alias="X-Carboncam-User-Name"),
-    x_carboncam_company_name: str | None = Header(default=None, alias="X-Carboncam-Company-Name"),
-):
-    if not x_carboncam_user_id:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+PARETO_MAX_MACHINES = 500
 
-    try:
-        content = file.file.read()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Dosya okunamadı")
 
+class ParetoRequest(BaseModel):
+    material_id: str = Field(..., description="Malzeme kaydı ID")
+    initial_weight: float = Field(..., ge=0, description="İşleme öncesi ağırlık (kg)")
+    final_weight: float = Field(..., ge=0, description="İşleme sonrası ağırlık (kg)")
+    time_min: float = Field(..., gt=0, description="İşleme süresi (dakika)")
+    machine_ids: list[str] | None = Field(
+        default=None,
+        max_length=PARETO_MAX_MACHINES,
+        description="Değerlendirilecek makineler (boşsa hepsi, tekrarlar bir kez sayılır)",
+    )
+    tariff_type: str = Field(
+        default="Multi", description="Elektrik tarifesi: 'Single' veya 'Multi'"
+    )
+    currency: str = Field(default="TRY", description="Enerji maliyeti para birimi")
+    horizon: Literal["day", "week"] = Field(
+        default="day", description="Başlangıç slotlarının aralığı"
+    )
+    slot_min: int = Field(default=15, ge=1, le=240, description="Başlangıç slot aralığı (dakika)")
+
+
+def _pareto_front(*, req: ParetoRequest, user_id: str) -> dict[str, object]:
+    # Değerlendirme kredi düşülmeden önce yapılır: hatalı girdi 400/404 döner ve
+    # kredi harcamaz.
+    material = MATERIALS.get(req.material_id)
+    if material is None:
+        raise HTTPException(status_code=404, detail="material_id not found")
+
+    machine_ids = list(dict.fromkeys(req.machine_ids or MACHINES))
+    unknown = [m for m in machine_ids if m not in MACHINES]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"machine_id not found: {', '.join(unknown)}")
+    machines = [MACHINES[m] for m in machine_ids]
+
+    calc = calculate_machining_carbon_batch(
+        initial_weight_kg=req.initial_weight,
+        final_weight_kg=req.final_weight,
+        process_time_minutes=req.time_min,
+        kc_value=material["kc_value"],
+        standby_power_kw=[m["standby_power_kw"] for m in machines],
+        carbon_intensity=[m["carbon_intensity"] for m in machines],
+        density=material["density"],
+    )
+    error_code = int(calc["error_code"].max(initial=BATCH_OK))
+    if error_code != BATCH_OK:
+        raise HTTPException(status_code=400, detail=BATCH_ERROR_MESSAGES[error_code])
+
+    horizon_min = 24 * 60 if req.horizon == "day" else 7 * 24 * 60
     try:
-        df = pd.read_excel(io.BytesIO(content))
+        schedule = _resolve_tariff_schedule(tariff_type=req.tariff_type, currency=req.currency)
+        front = machine_start_pareto_front(
+            total_energy_kwh=calc["total_energy_kwh"],
+            idle_energy_kwh=calc["idle_energy_kwh"],
+            carbon_intensity=[m["carbon_intensity"] for m in machines],
+            duration_min=req.time_min,
+            schedule=schedule,
+            intensity_profile=_get_intensity_profile_or_none(region=_grid_intensity_region()),
+            horizon_min=horizon_min,
+            slot_min=req.slot_min,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    credits_left = _consume_monthly_credit_or_raise(user_id=user_id)
+    points: list[dict[str, object]] = []
+    for m, start, cost, carbon, idle_share in zip(
+        front["machine_index"].tolist(),
+        front["start_min"].tolist(),
+        front["energy_cost"].tolist(),
+        front["total_carbon_kg"].tolist(),
+        front["idle_share"].tolist(),
+    ):
+        points.append(
+            {
+                "machine_id": machine_ids[m],
+                "model": machines[m]["model"],
+                **_minute_label(start),
+                "energy_cost": cost,
+                "total_carbon_kg": carbon,
+                "idle_share": idle_share,
+                "total_energy_kwh": float(calc["total_energy_kwh"][m]),
+                "efficiency_score": _compute_efficiency_score(
+                    total_energy_kwh=float(calc["total_energy_kwh"][m]),
+                    processing_energy_kwh=float(calc["processing_energy_kwh"][m]),
+                ),
+            }
+        )
+
+    return {
+        "material_id": req.material_id,
+        "credits_left": credits_left,
+        "energy_currency": req.currency,
+        "evaluated": len(machine_ids) * len(range(0, horizon_min, req.slot_min)),
+        "front": points,
+    }
+
+
+@app.post(
+    "/optimize/pareto",
+    summary="Machine x start-time Pareto front",
+    description=(
+        "Bir parça için her makineyi her başlangıç slotunda değerlendirir ve "
+        "(enerji maliyeti, karbon, boşta enerji payı) Pareto cephesini döndürür.\n\n"
+        "Kimlik: `X-Carboncam-User-Id` header'ı. Tek kredi tüketir."
+    ),
+)
+def optimize_pareto(
+    req: ParetoRequest,
+    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
+) -> dict[str, object]:
+    if not x_carboncam_user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return _pareto_front(req=req, user_id=x_carboncam_user_id)
+
+
+@app.post(
+    "/v1/optimize/pareto",
+    summary="Machine x start-time Pareto front (API key)",
+    description=(
+        "Developer API endpoint'i. `/optimize/pareto` ile aynı değerlendirme; API key ile "
+        "çağırılır, rate limit uygulanır ve tek kredi tüketir."
+    ),
+)
+@limiter.limit("60/minute")
+def api_optimize_pareto(
+    request: Request,
+    req: ParetoRequest,
+    user_id: str = Depends(require_api_key),
+) -> dict[str, object]:
+    return _pareto_front(req=req, user_id=user_id)
+
+
+class ScheduleJobRequest(BaseModel):
+    job_id: str = Field(..., description="İş ID")
+    material_id: str = Field(..., description="Malzeme kaydı ID")
+    initial_weight: float = Field(..., ge=0, description="İşleme öncesi ağırlık (kg)")
+    final_weight: float = Field(..., ge=0, description="İşleme sonrası ağırlık (kg)")
+    time_min: float = Field(..., gt=0, description="İşleme süresi (dakika)")
+    machine_ids: list[str] | None = Field(default=None, description="Uygun makineler (boşsa hepsi)")
+    earliest_start_min: int = Field(
+        default=0, ge=0, description="En erken başlangıç (plan başından dakika)"
+    )
+    latest_end_min: int | None = Field(
+        default=None, gt=0, description="En geç bitiş (plan başından dakika)"
+    )
+
+
+class ScheduleMachineRequest(BaseModel):
+    machine_id: str = Field(..., description="Makine kaydı ID")
+    available_from_min: int = Field(default=0, ge=0, description="Müsaitlik başlangıcı (dakika)")
+    available_until_min: int | None = Field(
+        default=None, gt=0, description="Müsaitlik bitişi (dakika)"
+    )
+
+
+class ScheduleRequest(BaseModel):
+    jobs: list[ScheduleJobRequest] = Field(..., min_length=1, max_length=5000)
+    machines: list[ScheduleMachineRequest] | None = Field(
+        default=None, description="Planlanacak makineler (boşsa tüm makineler, tüm gün müsait)"
+    )
+    objective: Literal["cost", "carbon"] = Field(
+        default="cost", description="Minimize edilecek hedef"
+    )
+    tariff_type: str = Field(
+        default="Multi", description="Elektrik tarifesi: 'Single' veya 'Multi'"
+    )
+    currency: str = Field(default="TRY", description="Enerji maliyeti para birimi")
+    horizon: Literal["day", "week"] = Field(
+        default="day", description="Plan ufku (00:00'dan itibaren)"
+    )
+    slot_min: int = Field(default=15, ge=1, le=240, description="Başlangıç slot aralığı (dakika)")
+
+
+@app.post(
+    "/v1/schedule",
+    summary="Plan jobs across the machine fleet (API key)",
+    description=(
+        "İşleri makinelere ve başlangıç slotlarına atayarak toplam enerji maliyetini veya karbonu "
+        "minimize eder (heap tabanlı greedy + yerel arama). Her makine aynı anda tek iş "
+        "çalıştırır.\n\n"
+        "Kimlik: API key. Rate limit uygulanır; plan başına tek kredi tüketilir."
+    ),
+)
+@limiter.limit("60/minute")
+def api_schedule(
+    request: Request,
+    req: ScheduleRequest,
+    user_id: str = Depends(require_api_key),
+) -> dict[str, object]:
+    machine_reqs = req.machines or [ScheduleMachineRequest(machine_id=k) for k in MACHINES]
+    machine_counts = Counter(m.machine_id for m in machine_reqs)
+    duplicate_machines = sorted(k for k, n in machine_counts.items() if n > 1)
+    if duplicate_machines:
+        raise HTTPException(
+            status_code=400, detail=f"duplicate machine_id: {', '.join(duplicate_machines)}"
+        )
+    job_counts = Counter(j.job_id for j in req.jobs)
+    duplicate_jobs = sorted(k for k, n in job_counts.items() if n > 1)
+    if duplicate_jobs:
+        raise HTTPException(
+            status_code=400, detail=f"duplicate job_id: {', '.join(duplicate_jobs)}"
+        )
+    requested_machines = {m.machine_id for m in machine_reqs}
+    requested_machines.update(m for j in req.jobs for m in j.machine_ids or ())
+    unknown_machines = sorted(requested_machines - MACHINES.keys())
+    if unknown_machines:
+        raise HTTPException(
+            status_code=404, detail=f"machine_id not found: {', '.join(unknown_machines)}"
+        )
+    # İşin uygun makinelerinden biri plana verilen makineler arasında yoksa iş sessizce
+    # atanmamış kalmasın diye istek reddedilir.
+    fleet_ids = {m.machine_id for m in machine_reqs}
+    outside_fleet = [
+        f"{j.job_id}: {', '.join(missing)}"
+        for j in req.jobs
+        if (missing := [m for m in j.machine_ids or () if m not in fleet_ids])
+    ]
+    if outside_fleet:
+        raise HTTPException(
+            status_code=422,
+            detail=f"machine_id not in machines: {'; '.join(outside_fleet[:20])}",
+        )
+    unknown_materials = sorted({j.material_id for j in req.jobs if j.material_id not in MATERIALS})
+    if unknown_materials:
+        raise HTTPException(
+            status_code=404, detail=f"material_id not found: {', '.join(unknown_materials)}"
+        )
+
+    # Processing energy is machine-independent; standby is added per machine by the scheduler.
+    materials = [MATERIALS[j.material_id] for j in req.jobs]
+    calc = calculate_machining_carbon_batch(
+        initial_weight_kg=[j.initial_weight for j in req.jobs],
+        final_weight_kg=[j.final_weight for j in req.jobs],
+        process_time_minutes=[j.time_min for j in req.jobs],
+        kc_value=[m["kc_value"] for m in materials],
+        standby_power_kw=0.0,
+        carbon_intensity=1.0,
+        density=[m["density"] for m in materials],
+    )
+    error_code = calc["error_code"]
+    if (error_code != BATCH_OK).any():
+        bad = [
+            f"{j.job_id}: {BATCH_ERROR_MESSAGES[int(code)]}"
+            for j, code in zip(req.jobs, error_code)
+            if code != BATCH_OK
+        ]
+        raise HTTPException(status_code=400, detail="; ".join(bad[:20]))
+
+    fleet = [
+        FleetMachine(
+            machine_id=m.machine_id,
+            standby_power_kw=MACHINES[m.machine_id]["standby_power_kw"],
+            carbon_intensity=MACHINES[m.machine_id]["carbon_intensity"],
+            available_from_min=m.available_from_min,
+            available_until_min=m.available_until_min,
+        )
+        for m in machine_reqs
+    ]
+    jobs = [
+        FleetJob(
+            job_id=j.job_id,
+            duration_min=int(math.ceil(j.time_min)),
+            processing_energy_kwh=float(calc["processing_energy_kwh"][i]),
+            machine_ids=tuple(j.machine_ids) if j.machine_ids else None,
+            earliest_start_min=j.earliest_start_min,
+            latest_end_min=j.latest_end_min,
+        )
+        for i, j in enumerate(req.jobs)
+    ]
+
+    try:
+        schedule = _resolve_tariff_schedule(tariff_type=req.tariff_type, currency=req.currency)
+        plan = schedule_fleet_jobs(
+            jobs=jobs,
+            machines=fleet,
+            schedule=schedule,
+            objective=req.objective,
+            intensity_profile=_get_intensity_profile_or_none(region=_grid_intensity_region()),
+            horizon_min=24 * 60 if req.horizon == "day" else 7 * 24 * 60,
+            slot_min=req.slot_min,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Kredi plan başarıyla çıktıktan sonra düşülür; hatalı istek kredi harcamaz.
+    credits_left = _consume_monthly_credit_or_raise(user_id=user_id)
+    return {
+        "credits_left": credits_left,
+        "objective": req.objective,
+        "energy_currency": req.currency,
+        **plan,
+        "assignments": [
+            {**asdict(a), **_minute_label(a.start_min)} for a in cast(list, plan["assignments"])
+        ],
+    }
+
+
+@app.get("/batch/template")
+def download_batch_template(
+    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
+):
+    if not x_carboncam_user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    df = pd.DataFrame(columns=[*BATCH_REQUIRED_COLUMNS, *BATCH_OPTIONAL_COLUMNS])
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    buf.seek(0)
+
+    return StreamingResponse(
+        buf,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": "attachment; filename=Template.xlsx"},
+    )
+
+
+@app.get("/v1/batch/template")
+@limiter.limit("60/minute")
+def api_download_batch_template(
+    request: Request,
+    user_id: str = Depends(require_api_key),
+):
+    df = pd.DataFrame(columns=[*BATCH_REQUIRED_COLUMNS, *BATCH_OPTIONAL_COLUMNS])
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    buf.seek(0)
+    return StreamingResponse(
+        buf,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": "attachment; filename=Template.xlsx"},
+    )
+
+
+_BATCH_FORMAT_LABELS = {"xlsx": "Excel", "csv": "CSV", "parquet": "Parquet", "arrow": "Arrow"}
+
+
+def _batch_formats_or_raise(
+    *, source: IO[bytes], filename: str | None, content_type: str | None, accept: str | None
+) -> tuple[str, str]:
+    """(input_format, output_format) for an upload; 400/415 if unreadable or unsupported."""
+
+    try:
+        source.seek(0)
+        input_format = detect_input_format(source, filename=filename, content_type=content_type)
     except Exception:
-        raise HTTPException(status_code=400, detail="Geçersiz Excel dosyası")
+        raise HTTPException(status_code=400, detail="Dosya okunamadı")
+
+    # Giriş formatı içerikten/uzantıdan, çıkış formatı Accept başlığından seçilir;
+    # Accept yoksa sonuç girişle aynı formatta döner.
+    output_format = negotiate_output_format(accept, default=input_format)
+    for fmt in (input_format, output_format):
+        if not format_available(fmt):
+            raise HTTPException(status_code=415, detail=f"{fmt} desteği için pyarrow kurulu olmalı")
+    return input_format, output_format
+
 
-    required_cols = ["Weight_In", "Weight_Out", "Time", "Machine_ID", "Material_ID"]
-    missing = [c for c in required_cols if c not in df.columns]
+def _open_batch_reader_or_400(*, source: IO[bytes], input_format: str) -> BatchRowReader:
+    """Opens the streaming reader and validates the header row before any data row."""
+
+    try:
+        reader = open_batch_reader(source, fmt=input_format)
+    except BatchReadError:
+        raise HTTPException(
+            status_code=400, detail=f"Geçersiz {_BATCH_FORMAT_LABELS[input_format]} dosyası"
+        )
+
+    missing = [c for c in BATCH_REQUIRED_COLUMNS if c not in reader.columns]
     if missing:
+        reader.close()
         raise HTTPException(status_code=400, detail=f"Eksik sütunlar: {', '.join(missing)}")
+    return reader
 
-    output_rows: list[dict[str, object]] = []
-    single_rate = float(os.getenv("ELECTRICITY_RATE_SINGLE_PER_KWH", "1"))
-    currency = os.getenv("ELECTRICITY_RATE_CURRENCY", "TRY")
-    credits_left_last: int | None = None
+
+def _batch_rate() -> tuple[float, str]:
+    return (
+        float(os.getenv("ELECTRICITY_RATE_SINGLE_PER_KWH", "1")),
+        os.getenv("ELECTRICITY_RATE_CURRENCY", "TRY"),
+    )
+
+
+_batch_result_cache: BatchResultCache | None = None
+
+
+def _get_batch_result_cache() -> BatchResultCache | None:
+    """Shared result cache under BATCH_CACHE_DIR; None when BATCH_CACHE_MAX_BYTES is 0."""
+
+    global _batch_result_cache
+    max_bytes = int(os.getenv("BATCH_CACHE_MAX_BYTES", str(512 << 20)))
+    if max_bytes <= 0:
+        return None
+    if _batch_result_cache is None:
+        root = os.getenv("BATCH_CACHE_DIR") or os.path.join(
+            tempfile.gettempdir(), "carboncam-batch-cache"
+        )
+        _batch_result_cache = BatchResultCache(root, max_bytes=max_bytes)
+    _batch_result_cache.max_bytes = max_bytes
+    return _batch_result_cache
+
+
+def _batch_tariff_version() -> str:
+    rate, currency = _batch_rate()
+    return f"single:{rate!r}:{currency}"
+
+
+def _batch_cache_key(
+    *, source: IO[bytes], user_id: str, output_format: str, rates: TariffSnapshot | None
+) -> str:
+    return batch_cache_key(
+        upload_digest=hash_upload(source),
+        user_id=user_id,
+        asset_version=_asset_version,
+        tariff_version=f"{_batch_tariff_version()}:{_rate_snapshot_version(rates)}",
+        output_format=output_format,
+    )
+
+
+_batch_row_store: RowResultStore | None = None
+
+
+def _batch_row_history_max_rows() -> int:
+    return int(os.getenv("BATCH_ROW_HISTORY_MAX_ROWS", "100000"))
+
+
+def _batch_row_history_version() -> str:
+    # Kredi dönemi (UTC ay) sürümdedir: aylık krediler yenilenince eski satırlar
+    # geçersiz olur, önceki ay ödenmiş satır bu ay bedava sayılmaz.
+    period = datetime.now(timezone.utc).strftime("%Y-%m")
+    return f"{_asset_version}:{_batch_tariff_version()}:{period}"
+
+
+def _batch_workbook_name(filename: str | None) -> str | None:
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name or None
+
+
+def _get_batch_row_store() -> RowResultStore | None:
+    """Per-workbook row results under BATCH_ROWS_DIR; None when BATCH_ROW_HISTORY_MAX_ROWS is 0.
+
+    Stored rows expire after BATCH_ROW_HISTORY_TTL_SECONDS (default 7 days).
+    """
+
+    global _batch_row_store
+    if _batch_row_history_max_rows() <= 0:
+        return None
+    if _batch_row_store is None:
+        root = os.getenv("BATCH_ROWS_DIR") or os.path.join(
+            tempfile.gettempdir(), "carboncam-batch-rows"
+        )
+        _batch_row_store = RowResultStore(
+            root, max_age=float(os.getenv("BATCH_ROW_HISTORY_TTL_SECONDS", "604800"))
+        )
+    return _batch_row_store
+
+
+def _batch_tariff_resolver(
+    *, currency: str, rates: TariffSnapshot | None
+) -> Callable[[pd.DataFrame], TariffMap]:
+    """Per-chunk schedule lookup that resolves each (tariff, currency) once per upload."""
+
+    schedules: dict[tuple[str, str], TariffSchedule | None] = {}
+
+    def _resolve(chunk: pd.DataFrame) -> TariffMap:
+        needed = batch_tariff_keys(chunk, currency=currency)
+        for tariff_type, cur in needed - schedules.keys():
+            try:
+                schedules[(tariff_type, cur)] = _snapshot_tariff_schedule(
+                    rates, tariff_type=tariff_type, currency=cur
+                )
+            except ValueError:
+                # Satırlar "Tarife fiyatları bulunamadı" hatasıyla döner.
+                schedules[(tariff_type, cur)] = None
+        return {key: s for key in needed if (s := schedules[key]) is not None}
+
+    return _resolve
+
+
+def _iter_batch_frames(
+    *,
+    reader: BatchRowReader,
+    input_format: str,
+    user_id: str,
+    ctx: EmailContext | None,
+    rates: TariffSnapshot | None,
+    workbook: str | None,
+) -> Generator[pd.DataFrame, None, None]:
+    """Runs an opened upload through the engine chunk by chunk, yielding output frames.
+
+    Tariff/Currency rows are priced from ``rates``, the snapshot taken when the
+    upload arrived. ``workbook`` is the upload filename; rows already paid for in
+    the previous run of the same workbook are reused.
+    """
+
+    single_rate, currency = _batch_rate()
+    chunk_rows = int(os.getenv("BATCH_CHUNK_ROWS", str(DEFAULT_CHUNK_ROWS)))
+    machines, materials = _batch_asset_frames()
+    credits_left: int | None = None
+    processed = 0
+    started = False
+    exhausted = False
+
+    # Aynı çalışma kitabının (dosya adı) bu kredi dönemindeki son çalıştırmasında
+    # ücretlendirilen satırlar (aynı girdi, aynı makine/malzeme ve tarife sürümü)
+    # yeniden ücretlendirilmez; yalnızca yeni veya değişen satırlar kredi harcar.
+    # Saklanan satırlar yüklemeye alınırken diskten kaldırılır: aynı anda gelen
+    # ikinci yükleme onları bulamaz ve tam ücretlendirilir.
+    row_store = _get_batch_row_store() if workbook else None
+    history_version = _batch_row_history_version()
+    previous = (
+        row_store.take(user_id, workbook, version=history_version)
+        if row_store is not None and workbook
+        else None
+    )
+    claims = RowResultClaims(previous) if previous is not None else None
+    kept: list[RowResults] = []
+    reused_any = False
+
+    # Büyük dosyalarda ilk BATCH_PARALLEL_MIN_ROWS satırdan sonraki parçalar işçi
+    # süreçlerde hesaplanır; sonuçlar yine dosya sırasıyla gelir, kredi burada ayrılır.
+    evaluated = evaluate_batch_chunks(
+        reader.chunks(chunk_rows),
+        machines=machines,
+        materials=materials,
+        rate_per_kwh=single_rate,
+        currency=currency,
+        tariffs=_batch_tariff_resolver(currency=currency, rates=rates),
+        pool=_get_batch_shard_pool(),
+        inline_rows=int(os.getenv("BATCH_PARALLEL_MIN_ROWS", "20000")),
+        max_pending=2 * max(_batch_worker_count(), 1),
+    )
+    try:
+        for out in evaluated:
+            fingerprints = row_fingerprints(out) if row_store is not None else None
+            reused = np.zeros(len(out), dtype=bool)
+            if claims is not None and fingerprints is not None:
+                reused = reuse_row_results(out, fingerprints=fingerprints, previous=claims)
+
+            # Sadece yeni/değişen geçerli satırlar için tek RPC ile toplu kredi ayrılır;
+            # kredisi yetmeyen satırlar "Kredi yetersiz" hatasıyla döner.
+            valid_rows = int(((out["Error"] == "").to_numpy() & ~reused).sum())
+            granted = 0
+            if valid_rows and not exhausted:
+                grant = _consume_monthly_credits(user_id=user_id, count=valid_rows)
+                granted = grant["granted"]
+                # 402 yalnızca yanıt başlamadan, ilk parçada döner; sonraki
+                # parçalarda satırlar "Kredi yetersiz" olarak işaretlenir.
+                if granted == 0 and not started and not reused.any():
+                    raise HTTPException(
+                        status_code=402, detail="Payment Required: monthly free credits exhausted"
+                    )
+                if granted:
+                    _maybe_send_quota_alert_email(
+                        ctx=ctx,
+                        credits_left=grant["credits_left"],
+                        previous_credits=grant["credits_left"] + granted,
+                    )
+                credits_left = grant["credits_left"]
+                exhausted = granted < valid_rows
+            elif credits_left is None and reused.any():
+                # Sadece bakiyeyi okur (0 kredi), Credits_Left boş kalmasın diye.
+                credits_left = _consume_monthly_credits(user_id=user_id, count=0)["credits_left"]
+
+            processed += len(out)
+            reused_any = reused_any or bool(reused.any())
+            out = apply_credit_grant(out, granted=granted, credits_left=credits_left, reused=reused)
+            if fingerprints is not None:
+                kept.append(batch_row_results(out, fingerprints=fingerprints))
+            started = True
+            yield out
+    except BatchReadError:
+        raise HTTPException(
+            status_code=400, detail=f"Geçersiz {_BATCH_FORMAT_LABELS[input_format]} dosyası"
+        )
+    finally:
+        evaluated.close()
+        # Yalnızca bu çalıştırmanın satırları saklanır; önceki çalıştırmadan yeniden
+        # kullanılan satır varsa süre ilk ödemeden sayılmaya devam eder. Hiç satır
+        # işlenmediyse alınan satırlar, arada yenisi yazılmadıysa geri bırakılır.
+        if row_store is not None and workbook:
+            try:
+                if kept:
+                    rows = RowResults.build(
+                        np.concatenate([r.fingerprints for r in kept]),
+                        np.concatenate([r.values for r in kept]),
+                        np.concatenate([r.counts for r in kept]),
+                    ).head(_batch_row_history_max_rows())
+                    if reused_any and previous is not None:
+                        rows = replace(rows, paid_at=previous.paid_at)
+                    row_store.save(user_id, workbook, rows, version=history_version)
+                elif previous is not None:
+                    row_store.save(
+                        user_id, workbook, previous, version=history_version, overwrite=False
+                    )
+            except OSError as e:
+                logger.warning(f"Batch row history not saved for {user_id}: {e}")
+
+    if not processed:
+        yield pd.DataFrame([{"Error": "İşlenecek satır bulunamadı"}])
+
+
+def _batch_frames_until_error(
+    frames: Iterator[pd.DataFrame],
+) -> Generator[pd.DataFrame, None, None]:
+    # Yanıt başladıktan sonra HTTP durumu değiştirilemez; sonraki parçalardaki
+    # hata dosyaya son satır olarak yazılır.
+    try:
+        yield from frames
+    except HTTPException as e:
+        yield pd.DataFrame([{"Error": str(e.detail)}])
+
+
+@app.post("/batch/process")
+async def process_batch(
+    file: UploadFile = File(...),
+    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
+    x_carboncam_user_email: str | None = Header(default=None, alias="X-Carboncam-User-Email"),
+    x_carboncam_user_name: str | None = Header(default=None, alias="X-Carboncam-User-Name"),
+    x_carboncam_company_name: str | None = Header(default=None, alias="X-Carboncam-Company-Name"),
+    accept: str | None = Header(default=None, alias="Accept"),
+):
+    if not x_carboncam_user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    # Dosya okuma ve hesaplama adımları thread'de çalışır; event loop yalnızca
+    # bekler, böylece bir worker aynı anda birçok isteği taşıyabilir.
+    input_format, output_format = await run_in_threadpool(
+        _batch_formats_or_raise,
+        source=file.file,
+        filename=file.filename,
+        content_type=file.content_type,
+        accept=accept,
+    )
     ctx = _email_context_from_headers(
         user_email=x_carboncam_user_email,
         user_name=x_carboncam_user_name,
         company_name=x_carboncam_company_name,
     )
+    filename = f"Results.{output_format}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    # Aynı kullanıcı aynı dosyayı (aynı makine/malzeme ve tarife sürümüyle) tekrar
+    # yüklerse saklanan sonuç döner. Bu, daha önce ücreti ödenmiş sonucun yeniden
+    # indirilmesidir: kredi düşülmez, Credits_Left ilk çalıştırmadaki değerleri
+    # gösterir. Kredisi yetmeyen ya da yarıda kesilen sonuçlar saklanmaz. Tüm dosya,
+    # yükleme anındaki electricity_rates snapshot'ıyla fiyatlanır; sürümü anahtardadır.
+    rates = await _get_rate_snapshot_async()
+    cache = _get_batch_result_cache()
+    cache_key = ""
+    if cache is not None:
+        cache_key = await run_in_threadpool(
+            _batch_cache_key,
+            source=file.file,
+            user_id=x_carboncam_user_id,
+            output_format=output_format,
+            rates=rates,
+        )
+        cached = cache.open(cache_key)
+        if cached is not None:
+
+            def _cached_chunks() -> Iterator[bytes]:
+                with cached:
+                    while chunk := cached.read(1 << 16):
+                        yield chunk
+
+            return StreamingResponse(
+                _cached_chunks(),
+                media_type=BATCH_MEDIA_TYPES[output_format],
+                headers={**headers, "X-Carboncam-Cache": "hit"},
+            )
 
-    for _, row in df.iterrows():
-        try:
-            credits_left_last = _consume_monthly_credit_or_raise(user_id=x_carboncam_user_id)
-        except HTTPException:
-            # Kredi bitince hatayı üst kata aynen ilet.
-            raise
+    # Yükleme belleğe alınmadan satır satır okunur; başlık satırı önce doğrulanır,
+    # veri satırları BATCH_CHUNK_ROWS'luk parçalarla gelir. Sonuç da parça parça
+    # yazılıp gönderilir; ilk parça yanıt başlamadan hesaplanır ki 402/400 gibi
+    # hatalar HTTP durumu olarak dönebilsin.
+    reader = await run_in_threadpool(
+        _open_batch_reader_or_400, source=file.file, input_format=input_format
+    )
+    frames = _iter_batch_frames(
+        reader=reader,
+        input_format=input_format,
+        user_id=x_carboncam_user_id,
+        ctx=ctx,
+        rates=rates,
+        workbook=_batch_workbook_name(file.filename),
+    )
+    try:
+        first = await run_in_threadpool(next, frames)
+    except BaseException:
+        frames.close()
+        reader.close()
+        raise
+
+    batch_id = uuid.uuid4().hex[:12]
+    complete = True
 
-        if credits_left_last is not None:
-            _maybe_send_quota_alert_email(ctx=ctx, credits_left=int(credits_left_last))
+    def _checked(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        nonlocal complete
+        for frame in chunks:
+            if "Weight_In" not in frame or (frame["Error"] == ROW_ERROR_NO_CREDIT).any():
+                complete = False
+            yield frame
 
+    def _body() -> Iterator[bytes]:
+        pending = cache.begin(cache_key) if cache is not None else None
         try:
-            initial = float(row["Weight_In"])
-            final = float(row["Weight_Out"])
-            time_min = float(row["Time"])
-            machine_id = str(row["Machine_ID"]).strip()
-            material_id = str(row["Material_ID"]).strip()
-        except Exception:
-            output_rows.append({
-                "Weight_In": row.get("Weight_In", ""),
-                "Weight_Out": row.get("Weight_Out", ""),
-                "Time": row.get("Time", ""),
-                "Machine_ID": row.get("Machine_ID", ""),
-                "Material_ID": row.get("Material_ID", ""),
-                "Total_Energy_kWh": "",
-                "Total_Carbon_kg": "",
-                "Energy_Cost": "",
-                "Currency": currency,
-                "Applied_Rate_per_kWh": single_rate,
-                "Credits_Left": credits_left_last if credits_left_last is not None else "",
-                "Error": "Sayısal değerler parse edilemedi",
-            })
-            continue
+            for data in iter_batch_output(
+                _checked(_batch_frames_until_error(itertools.chain([first], frames))),
+                fmt=output_format,
+                dtypes=BATCH_OUTPUT_DTYPES,
+            ):
+                if pending is not None:
+                    pending.write(data)
+                yield data
+            if pending is not None and complete:
+                pending.commit()
+        finally:
+            if pending is not None:
+                pending.discard()
+            frames.close()
+            reader.close()
+        _maybe_send_report_ready_email(ctx=ctx, batch_id=batch_id, report_filename=filename)
 
-        if not (math.isfinite(initial) and math.isfinite(final) and math.isfinite(time_min)):
-            output_rows.append({
-                "Weight_In": initial,
-                "Weight_Out": final,
-                "Time": time_min,
-                "Machine_ID": machine_id,
-                "Material_ID": material_id,
-                "Total_Energy_kWh": "",
-                "Total_Carbon_kg": "",
-                "Energy_Cost": "",
-                "Currency": currency,
-                "Applied_Rate_per_kWh": single_rate,
-                "Credits_Left": credits_left_last if credits_left_last is not None else "",
-                "Error": "Geçersiz sayı (NaN/inf)",
-            })
-            continue
+    return StreamingResponse(
+        _body(),
+        media_type=BATCH_MEDIA_TYPES[output_format],
+        headers={**headers, "X-Carboncam-Cache": "miss"} if cache is not None else headers,
+    )
 
-        if time_min <= 0 or initial < 0 or final < 0:
-            output_rows.append({
-                "Weight_In": initial,
-                "Weight_Out": final,
-                "Time": time_min,
-                "Machine_ID": machine_id,
-                "Material_ID": material_id,
-                "Total_Energy_kWh": "",
-                "Total_Carbon_kg": "",
-                "Energy_Cost": "",
-                "Currency": currency,
-                "Applied_Rate_per_kWh": single_rate,
-                "Credits_Left": credits_left_last if credits_left_last is not None else "",
-                "Error": "Geçersiz ağırlık/süre",
-            })
-            continue
 
-        machine = MACHINES.get(machine_id)
-        material = MATERIALS.get(material_id)
-        if not machine or not material:
-            output_rows.append({
-                "Weight_In": initial,
-                "Weight_Out": final,
-                "Time": time_min,
-                "Machine_ID": machine_id,
-                "Material_ID": material_id,
-                "Total_Energy_kWh": "",
-                "Total_Carbon_kg": "",
-                "Energy_Cost": "",
-                "Currency": currency,
-                "Applied_Rate_per_kWh": single_rate,
-                "Credits_Left": credits_left_last if credits_left_last is not None else "",
-                "Error": "Makine veya malzeme bulunamadı",
-            })
+@app.post("/v1/batch/process")
+@limiter.limit("60/minute")
+async def api_process_batch(
+    request: Request,
+    file: UploadFile = File(...),
+    user_id: str = Depends(require_api_key),
+):
+    # Reuse the same logic by calling the internal function body.
+    # Credits are enforced per row via user_id.
+    return await process_batch(
+        file=file,
+        x_carboncam_user_id=user_id,
+        x_carboncam_user_email=None,
+        x_carboncam_user_name=None,
+        x_carboncam_company_name=None,
+        accept=request.headers.get("accept"),
+    )
+
+
+_batch_job_store: BatchJobStore | None = None
+_batch_job_executor: ThreadPoolExecutor | None = None
+
+
+def _get_batch_job_store() -> BatchJobStore:
+    """Shared job store; local disk under BATCH_JOBS_DIR unless replaced at startup."""
+
+    global _batch_job_store
+    if _batch_job_store is None:
+        root = os.getenv("BATCH_JOBS_DIR") or os.path.join(
+            tempfile.gettempdir(), "carboncam-batch-jobs"
+        )
+        _batch_job_store = LocalBatchJobStore(root)
+    return _batch_job_store
+
+
+def _get_batch_job_executor() -> ThreadPoolExecutor:
+    global _batch_job_executor
+    if _batch_job_executor is None:
+        _batch_job_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("BATCH_JOB_WORKERS", "2")),
+            thread_name_prefix="batch-job",
+        )
+    return _batch_job_executor
+
+
+def _batch_job_payload(job: BatchJob, *, url_prefix: str) -> dict[str, object]:
+    payload: dict[str, object] = {
+        "batch_id": job.batch_id,
+        "status": job.status,
+        "created_at": datetime.fromtimestamp(job.created_at, tz=timezone.utc).isoformat(),
+        "updated_at": datetime.fromtimestamp(job.updated_at, tz=timezone.utc).isoformat(),
+        "status_url": f"{url_prefix}/batch/jobs/{job.batch_id}",
+    }
+    if job.status == JOB_DONE:
+        payload["rows"] = job.rows
+        payload["result_url"] = f"{url_prefix}/batch/jobs/{job.batch_id}/result"
+    if job.status == JOB_FAILED:
+        payload["error"] = job.error
+        payload["error_status"] = job.error_status
+    return payload
+
+
+def _fail_interrupted_batch_jobs() -> int:
+    """Marks jobs a previous process left queued or running as failed; returns how many.
+
+    The job executor lives in the process, so such jobs never resume: shutdown
+    cancels the queued ones and a crash loses both. Assumes one process runs the
+    store's jobs (a single uvicorn worker, as in the Dockerfile).
+    """
+
+    store = _get_batch_job_store()
+    failed = 0
+    for job in list(store.jobs()):
+        if job.status not in (JOB_QUEUED, JOB_RUNNING):
             continue
+        store.delete_input(job.batch_id)
+        store.update(
+            replace(
+                job,
+                status=JOB_FAILED,
+                error="Sunucu yeniden başlatıldığı için iş tamamlanamadı; dosyayı tekrar yükleyin",
+                error_status=503,
+                updated_at=time.time(),
+            )
+        )
+        failed += 1
+    return failed
 
-        try:
-            calc = calculate_machining_carbon(
-                initial_weight_kg=initial,
-                final_weight_kg=final,
-                process_time_minutes=time_min,
-                kc_value=material["kc_value"],
-                standby_power_kw=machine["standby_power_kw"],
-                carbon_intensity=machine["carbon_intensity"],
-                density=material["density"],
+
+def _run_batch_job(*, batch_id: str, ctx: EmailContext | None) -> None:
+    store = _get_batch_job_store()
+    job = store.get(batch_id)
+    if job is None:
+        return
+    job = replace(job, status=JOB_RUNNING, updated_at=time.time())
+    store.update(job)
+
+    rows = 0
+
+    def _counted(frames: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        # Yalnızca veri satırları sayılır; "satır yok" ve hata satırları değil.
+        nonlocal rows
+        for frame in frames:
+            if "Weight_In" in frame:
+                rows += len(frame)
+            yield frame
+
+    try:
+        with (
+            store.open_input(batch_id) as source,
+            _open_batch_reader_or_400(source=source, input_format=job.input_format) as reader,
+        ):
+            frames = _iter_batch_frames(
+                reader=reader,
+                input_format=job.input_format,
+                user_id=job.user_id,
+                ctx=ctx,
+                rates=_get_rate_snapshot(),
+                workbook=job.filename,
             )
+            # Senkron uçtaki gibi: ilk parçadaki hata işi başarısız yapar (kredi
+            # düşülmemiştir); sonraki parçalardaki hata, ücreti ödenmiş kısmi
+            # sonucun son satırı olarak yazılır.
+            with contextlib.closing(frames):
+                first = next(frames)
+                with store.result_writer(batch_id) as sink:
+                    write_batch_output(
+                        _counted(_batch_frames_until_error(itertools.chain([first], frames))),
+                        sink,
+                        fmt=job.output_format,
+                        dtypes=BATCH_OUTPUT_DTYPES,
+                    )
+    except HTTPException as e:
+        job = replace(job, status=JOB_FAILED, error=str(e.detail), error_status=e.status_code)
+    except Exception:
+        logger.exception("Batch job %s failed", batch_id)
+        job = replace(job, status=JOB_FAILED, error="Batch işlenemedi", error_status=500)
+    else:
+        job = replace(job, status=JOB_DONE, rows=rows)
+    finally:
+        store.delete_input(batch_id)
+
+    store.update(replace(job, updated_at=time.time()))
+    if job.status == JOB_DONE:
+        # Hazır e-postası iş gerçekten bittiğinde gider.
+        _maybe_send_report_ready_email(
+            ctx=ctx, batch_id=batch_id, report_filename=f"Results.{job.output_format}"
+        )
 
-            energy_cost_value = float(calc["total_energy_kwh"]) * single_rate
-
-            output_rows.append({
-                "Weight_In": initial,
-                "Weight_Out": final,
-                "Time": time_min,
-                "Machine_ID": machine_id,
-                "Material_ID": material_id,
-                "Total_Energy_kWh": float(calc["total_energy_kwh"]),
-                "Total_Carbon_kg": float(calc["total_carbon_kg"]),
-                "Energy_Cost": energy_cost_value,
-                "Currency": currency,
-                "Applied_Rate_per_kWh": single_rate,
-                "Credits_Left": credits_left_last if credits_left_last is not None else "",
-                "Error": "",
-            })
-        except Exception as e:
-            output_rows.append({
-                "Weight_In": initial,
-                "Weight_Out": final,
-                "Time": time_min,
-                "Machine_ID": machine_id,
-                "Material_ID": material_id,
-                "Total_Energy_kWh": "",
-                "Total_Carbon_kg": "",
-                "Energy_Cost": "",
-                "Currency": currency,
-                "Applied_Rate_per_kWh": single_rate,
-                "Credits_Left": credits_left_last if credits_left_last is not None else "",
-                "Error": str(e),
-            })
-
-    if not output_rows:
-        output_rows.append({"Error": "İşlenecek satır bulunamadı"})
-
-    out_df = pd.DataFrame(output_rows)
-    out_buf = io.BytesIO()
-    out_df.to_excel(out_buf, index=False)
-    out_buf.seek(0)
 
-    batch_id = uuid.uuid4().hex[:12]
-    _maybe_send_report_ready_email(ctx=ctx, batch_id=batch_id)
+def _submit_batch_job(
+    *, file: UploadFile, user_id: str, ctx: EmailContext | None, accept: str | None
+) -> BatchJob:
+    """Stores the upload, validates its header and queues it on the batch worker pool."""
+
+    input_format, output_format = _batch_formats_or_raise(
+        source=file.file, filename=file.filename, content_type=file.content_type, accept=accept
+    )
+
+    store = _get_batch_job_store()
+    store.purge(max_age_seconds=float(os.getenv("BATCH_JOB_TTL_SECONDS", "86400")))
+
+    now = time.time()
+    job = BatchJob(
+        batch_id=uuid.uuid4().hex[:12],
+        user_id=user_id,
+        status=JOB_QUEUED,
+        input_format=input_format,
+        output_format=output_format,
+        created_at=now,
+        updated_at=now,
+        filename=_batch_workbook_name(file.filename),
+    )
+    file.file.seek(0)
+    store.create(job, file.file)
+
+    # Başlık hatası olan dosyalar kuyruğa girmeden 400 ile reddedilir.
+    try:
+        with store.open_input(job.batch_id) as source:
+            _open_batch_reader_or_400(source=source, input_format=input_format).close()
+    except HTTPException:
+        store.delete(job.batch_id)
+        raise
+
+    _get_batch_job_executor().submit(_run_batch_job, batch_id=job.batch_id, ctx=ctx)
+    return job
+
+
+def _get_batch_job_or_404(*, batch_id: str, user_id: str) -> BatchJob:
+    job = _get_batch_job_store().get(batch_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="batch_id not found")
+    return job
+
 
+def _batch_job_result_response(job: BatchJob) -> StreamingResponse:
+    if job.status != JOB_DONE:
+        raise HTTPException(status_code=409, detail=f"Batch job is {job.status}")
+
+    def _chunks() -> Iterator[bytes]:
+        with _get_batch_job_store().open_result(job.batch_id) as fh:
+            while chunk := fh.read(1 << 16):
+                yield chunk
+
+    filename = f"Results.{job.output_format}"
     return StreamingResponse(
-        out_buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=Results.xlsx"},
+        _chunks(),
+        media_type=BATCH_MEDIA_TYPES[job.output_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
-@app.post("/v1/batch/process")
+@app.post("/batch/jobs", status_code=202)
+def create_batch_job(
+    file: UploadFile = File(...),
+    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
+    x_carboncam_user_email: str | None = Header(default=None, alias="X-Carboncam-User-Email"),
+    x_carboncam_user_name: str | None = Header(default=None, alias="X-Carboncam-User-Name"),
+    x_carboncam_company_name: str | None = Header(default=None, alias="X-Carboncam-Company-Name"),
+    accept: str | None = Header(default=None, alias="Accept"),
+) -> dict[str, object]:
+    if not x_carboncam_user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    job = _submit_batch_job(
+        file=file,
+        user_id=x_carboncam_user_id,
+        ctx=_email_context_from_headers(
+            user_email=x_carboncam_user_email,
+            user_name=x_carboncam_user_name,
+            company_name=x_carboncam_company_name,
+        ),
+        accept=accept,
+    )
+    return _batch_job_payload(job, url_prefix="")
+
+
+@app.get("/batch/jobs/{batch_id}")
+def get_batch_job(
+    batch_id: str,
+    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
+) -> dict[str, object]:
+    if not x_carboncam_user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    job = _get_batch_job_or_404(batch_id=batch_id, user_id=x_carboncam_user_id)
+    return _batch_job_payload(job, url_prefix="")
+
+
+@app.get("/batch/jobs/{batch_id}/result")
+def download_batch_job_result(
+    batch_id: str,
+    x_carboncam_user_id: str | None = Header(default=None, alias="X-Carboncam-User-Id"),
+):
+    if not x_carboncam_user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    job = _get_batch_job_or_404(batch_id=batch_id, user_id=x_carboncam_user_id)
+    return _batch_job_result_response(job)
+
+
+@app.post("/v1/batch/jobs", status_code=202)
 @limiter.limit("60/minute")
-def api_process_batch(
+def api_create_batch_job(
     request: Request,
     file: UploadFile = File(...),
     user_id: str = Depends(require_api_key),
+) -> dict[str, object]:
+    job = _submit_batch_job(
+        file=file, user_id=user_id, ctx=None, accept=request.headers.get("accept")
+    )
+    return _batch_job_payload(job, url_prefix="/v1")
+
+
+@app.get("/v1/batch/jobs/{batch_id}")
+@limiter.limit("60/minute")
+def api_get_batch_job(
+    request: Request,
+    batch_id: str,
+    user_id: str = Depends(require_api_key),
+) -> dict[str, object]:
+    job = _get_batch_job_or_404(batch_id=batch_id, user_id=user_id)
+    return _batch_job_payload(job, url_prefix="/v1")
+
+
+@app.get("/v1/batch/jobs/{batch_id}/result")
+@limiter.limit("60/minute")
+def api_download_batch_job_result(
+    request: Request,
+    batch_id: str,
+    user_id: str = Depends(require_api_key),
 ):
-    # Reuse the same logic by calling the internal function body.
-    # Credits are enforced per row via user_id.
-    return process_batch(file=file, x_carboncam_user_id=user_id)
+    job = _get_batch_job_or_404(batch_id=batch_id, user_id=user_id)
+    return _batch_job_result_response(job)
 
 
 @app.post("/report")
 def report(req: ReportRequest):
-    material = MATERIALS.get(req.material_id)
-    if material is None:
-        raise HTTPException(status_code=404, detail="material_id not found")
-
-    machine = MACHINES.get(req.machine_id)
-    if machine is None:
-        raise HTTPException(status_code=404, detail="machine_id not found")
-
-    result = calculate_machining_carbon(
+    plan = _get_calculation_plan_or_404(machine_id=req.machine_id, material_id=req.material_id)
+    result = plan.evaluate(
         initial_weight_kg=req.initial_weight,
         final_weight_kg=req.final_weight,
         process_time_minutes=req.time_min,
-        kc_value=material["kc_value"],
-        standby_power_kw=machine["standby_power_kw"],
-        carbon_intensity=machine["carbon_intensity"],
-        density=material["density"],
     )
 
     pdf_bytes = generate_carboncam_pdf_report(
         operation_date=datetime.now(),
-        machine_model=str(machine.get("model", req.machine_id)),
+        machine_model=str(MACHINES[req.machine_id].get("model", req.machine_id)),
         material_type=MATERIAL_NAMES.get(req.material_id, req.material_id),
         operator_name=req.operator_name,
         total_energy_kwh=float(result["total_energy_kwh"]),
@@ -1676,12 +3119,50 @@ def health_check():
 # Startup event
 @app.on_event("startup")
 async def startup_event():
+    global _api_key_usage_task, _rate_snapshot_task
     logger.info("CarbonCAM API started successfully")
     logger.info(f"Environment: {os.getenv('ENVIRONMENT', 'development')}")
     logger.info(f"Sentry enabled: {bool(os.getenv('SENTRY_DSN'))}")
+    try:
+        interrupted = await asyncio.to_thread(_fail_interrupted_batch_jobs)
+    except OSError as e:
+        logger.warning(f"Interrupted batch jobs could not be checked: {e}")
+    else:
+        if interrupted:
+            logger.warning(f"Marked {interrupted} interrupted batch job(s) failed")
+    client = get_postgrest_client()
+    async_client = get_async_postgrest_client()
+    if client is not None and async_client is not None:
+        # İlk isteğin TCP/TLS el sıkışmasını beklememesi için bağlantılar önceden açılır.
+        reachable, _ = await asyncio.gather(
+            asyncio.to_thread(client.warm_up), async_client.warm_up()
+        )
+        logger.info(f"Supabase connection warm-up: {'ok' if reachable else 'failed'}")
+    _api_key_usage_task = asyncio.create_task(_api_key_usage_flusher())
+
+    rates = _store_rate_snapshot(await _fetch_electricity_rate_rows_or_none_async())
+    if rates is not None:
+        logger.info(f"Electricity rates loaded: {len(rates.schedules)} schedules")
+    _rate_snapshot_task = asyncio.create_task(_rate_snapshot_refresher())
 
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("CarbonCAM API shutting down")
+    if _batch_job_executor is not None:
+        # Kuyruktaki işler iptal edilir; çalışan iş bitene kadar beklenmez. Yarım
+        # kalan işler sonraki açılışta _fail_interrupted_batch_jobs ile kapatılır.
+        _batch_job_executor.shutdown(wait=False, cancel_futures=True)
+    if _batch_shard_pool is not None:
+        _batch_shard_pool.shutdown(wait=False, cancel_futures=True)
+    if _rate_snapshot_task is not None:
+        _rate_snapshot_task.cancel()
+    if _api_key_usage_task is not None:
+        _api_key_usage_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _api_key_usage_task
+    # Bekleyen last_used_at zamanları bağlantılar kapanmadan yazılır.
+    await _flush_api_key_usage()
+    close_postgrest_client()
+    await aclose_async_postgrest_client()
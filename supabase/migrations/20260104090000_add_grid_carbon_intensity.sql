@@ -0,0 +1,40 @@
+-- CarbonCAM: Grid Carbon Intensity Profiles
+-- Amaç: Bölge bazında saatlik / 15 dakikalık şebeke karbon yoğunluğu eğrisini saklamak.
+-- Bir profil ya bir günü (slot_start_min 0..1439) ya da bir haftayı (0..10079, Pazartesi 00:00'dan)
+-- eşit aralıklı slotlarla kapsar.
+
+create table if not exists public.grid_carbon_intensity (
+  id uuid primary key default gen_random_uuid(),
+
+  -- Örn: 'TR', 'EU'
+  region text not null,
+
+  -- Slot başlangıcı (periyot başından itibaren dakika)
+  slot_start_min integer not null check (slot_start_min >= 0 and slot_start_min < 10080),
+
+  -- kgCO2 / kWh
+  carbon_intensity double precision not null check (carbon_intensity > 0),
+
+  created_at timestamptz not null default now()
+);
+
+create unique index if not exists uq_grid_carbon_intensity_region_slot
+  on public.grid_carbon_intensity(region, slot_start_min);
+
+alter table public.grid_carbon_intensity enable row level security;
+
+drop policy if exists "grid_carbon_intensity_read" on public.grid_carbon_intensity;
+create policy "grid_carbon_intensity_read" on public.grid_carbon_intensity
+for select
+to anon, authenticated
+using (true);
+
+revoke insert, update, delete on public.grid_carbon_intensity from anon, authenticated;
+grant all on public.grid_carbon_intensity to service_role;
+
+drop policy if exists "service_role_all_grid_carbon_intensity" on public.grid_carbon_intensity;
+create policy "service_role_all_grid_carbon_intensity" on public.grid_carbon_intensity
+for all
+to service_role
+using (true)
+with check (true);
@@ -0,0 +1,53 @@
+-- Bulk credit consume for batch uploads.
+-- Reserves up to p_count credits in one call (one row lock instead of one per row).
+-- Partial grants are allowed: if the balance is short, grants what is left.
+-- Returns {"granted": <0..p_count>, "credits_left": <balance AFTER consumption>}.
+create or replace function public.consume_monthly_credits(p_user_id text, p_count integer)
+returns jsonb
+language plpgsql
+security definer
+as $$
+declare
+  v_credits integer;
+  v_reset_at timestamptz;
+  v_granted integer;
+begin
+  if p_count is null or p_count < 0 then
+    raise exception 'p_count must be >= 0';
+  end if;
+
+  -- Ensure user row exists
+  insert into public.users (id)
+  values (p_user_id)
+  on conflict (id) do nothing;
+
+  -- Lock the row for atomic update
+  select credits_left, credits_reset_at
+    into v_credits, v_reset_at
+    from public.users
+   where id = p_user_id
+   for update;
+
+  -- Monthly reset (same rule as consume_monthly_credit)
+  if now() >= v_reset_at then
+    v_credits := 3;
+    v_reset_at := date_trunc('month', now()) + interval '1 month';
+  end if;
+
+  v_credits := greatest(v_credits, 0);
+  v_granted := least(p_count, v_credits);
+  v_credits := v_credits - v_granted;
+
+  update public.users
+     set credits_left = v_credits,
+         credits_reset_at = v_reset_at
+   where id = p_user_id;
+
+  return jsonb_build_object('granted', v_granted, 'credits_left', v_credits);
+end;
+$$;
+
+revoke all on function public.consume_monthly_credits(text, integer) from anon;
+revoke all on function public.consume_monthly_credits(text, integer) from authenticated;
+
+grant execute on function public.consume_monthly_credits(text, integer) to service_role;
@@ -0,0 +1,27 @@
+-- Bulk last_used_at update for the API's write-behind usage buffer.
+-- p_used_at maps key_hash -> last use time: {"<key_hash>": "<timestamptz>", ...}.
+-- last_used_at only moves forward (several API processes flush independently)
+-- and revoked keys are left untouched. Returns the number of updated keys.
+create or replace function public.touch_api_keys(p_used_at jsonb)
+returns integer
+language plpgsql
+security definer
+as $$
+declare
+  v_updated integer;
+begin
+  update public.api_keys k
+     set last_used_at = greatest(coalesce(k.last_used_at, '-infinity'::timestamptz), u.used_at::timestamptz)
+    from jsonb_each_text(coalesce(p_used_at, '{}'::jsonb)) as u(key_hash, used_at)
+   where k.key_hash = u.key_hash
+     and k.revoked_at is null;
+
+  get diagnostics v_updated = row_count;
+  return v_updated;
+end;
+$$;
+
+revoke all on function public.touch_api_keys(jsonb) from anon;
+revoke all on function public.touch_api_keys(jsonb) from authenticated;
+
+grant execute on function public.touch_api_keys(jsonb) to service_role;